@@ -0,0 +1,1444 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the Product Matcher Service.
+
+Each benchmark runs against the functions in product_matcher_service.py on
+synthetic HasData-style titles, so no running server is required.
+
+Usage:
+    python benchmark_matcher.py embed            # per-pair vs batched vs warm-cache SBERT encoding
+    python benchmark_matcher.py embed --sizes 10 50 200 --repeat 5
+    python benchmark_matcher.py backends         # accuracy vs latency of torch / onnx / onnx-int8
+    python benchmark_matcher.py cascade          # cascaded vs full scoring: selections and embedding calls
+    python benchmark_matcher.py fuzzy            # per-pair RapidFuzz vs process.cdist at 50/500/5000
+    python benchmark_matcher.py units            # unit engine conformance on real titles (exit 1 on a mismatch) + timing
+    python benchmark_matcher.py units --dump results.jsonl --record review.jsonl
+    python benchmark_matcher.py llm              # async OpenAI client vs a local stub: loop lag, errors, keep-alive, cache
+    python benchmark_matcher.py singleflight     # 100 concurrent identical extractions -> exactly one upstream call
+    python benchmark_matcher.py speculative      # stores endpoint: LLM + classic scoring overlapped vs sequential, latency budget
+    python benchmark_matcher.py breaker          # OpenAI slowdown and hang: timeout backoff, circuit open -> instant fallback, recovery
+    python benchmark_matcher.py batch            # shopping list: batched vs per-query OpenAI calls, chunking, malformed-reply fallback
+    python benchmark_matcher.py local            # share of LLM extractions the local extractor avoids on a replay corpus
+    python benchmark_matcher.py local --queries queries.txt --dump results.jsonl
+    python benchmark_matcher.py pool             # event-loop lag and 503 admission control of the match executor
+    python benchmark_matcher.py pool --process
+    python benchmark_matcher.py stores           # serial vs fanned-out per-store matching on the stores endpoint
+    python benchmark_matcher.py rescore          # feature block rebuilt per fallback weight profile vs built once
+    python benchmark_matcher.py multi            # sequential vs deduplicated, concurrent /match-multiple-products
+    python benchmark_matcher.py respcache        # whole-response cache: miss vs hit latency and X-Cache headers
+
+units, singleflight, breaker, batch, pool, stores, rescore, multi and respcache check
+their results and exit 1 on a failure.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, List, Optional
+from urllib import request as urlrequest
+
+import brand_lexicon
+import embedding_backends
+import product_matcher_service as pms
+from embedding_store import iter_dump_titles
+from extraction_cache import _DB_PRUNE_EVERY, ExtractionCache, ResponseCache
+from openai_client import CircuitBreaker, LatencyTracker, OpenAIClient, StubOpenAIServer
+
+BRANDS = ["Great Value", "Good & Gather", "H-E-B", "Kroger", "Lucerne", "Horizon Organic",
+          "Fairlife", "Tide", "Gain", "Kirkland Signature", "Member's Mark", "Simple Truth"]
+ITEMS = ["Whole Milk", "2% Reduced Fat Milk", "Skim Milk", "Large White Eggs", "Orange Juice",
+         "Liquid Laundry Detergent", "Sourdough Bread", "Greek Yogurt", "Shredded Cheddar Cheese",
+         "Vegetable Oil", "Unsalted Butter", "Chocolate Milk"]
+SIZES = ["1 gal", "0.5 gal", "64 fl oz", "1 qt", "12 ct", "18 ct", "32 oz", "1.75 L", "500 ml",
+         "16 oz", "6 x 12 fl oz", "1 lb", ""]
+STORES = ["Walmart", "Target", "H-E-B", "Kroger", "Albertsons", "Costco"]
+
+# Specific (non-general) queries, so select_best_product takes the embedding path
+CORPUS_QUERIES = [
+    "great value whole milk 1 gallon", "horizon organic whole milk 64 fl oz",
+    "fairlife 2% reduced fat milk 52 oz", "kroger large white eggs 18 ct",
+    "tide liquid laundry detergent 64 oz", "gain liquid laundry detergent 92 fl oz",
+    "simple truth organic greek yogurt 32 oz", "kirkland signature unsalted butter 4 lb",
+    "lucerne shredded cheddar cheese 16 oz", "h-e-b orange juice 1 gal",
+    "member's mark vegetable oil 1 gal", "good & gather chocolate milk 0.5 gal",
+]
+
+
+# Extra size spellings for the unit parser corpus: no-space, long-form,
+# multipacks, several mentions per title and near-miss tokens.
+UNIT_SIZES = SIZES + ["1gal", "2 gallons", "0.5 Gallon", "12floz", "16 fluid oz", "2 Liters", "1 litre",
+                      "750ml", "355 mL", "2 Quarts", "1 pint", "3 pt", "1.5.2 oz", "1 lb", "12 oz (355 ml)",
+                      "2 L / 67.6 fl oz", "4 x 1 qt", "10 lbs", "8 oz, 1 gal", "oz 12", "1 l.", "64oz."]
+UNIT_CONFORMANCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "unit_conformance.jsonl")
+# Generated-title sizes and their canonical (dimension, amount)
+_OZ, _FL_OZ, _GAL, _LB = 0.028349523125, 0.0295735, 3.78541, 0.45359237
+SIZE_TRUTH = [
+    ("1 gal", ("volume", _GAL)), ("1 Gallon", ("volume", _GAL)), ("0.5 gal", ("volume", 0.5 * _GAL)),
+    ("1/2 gal", ("volume", 0.5 * _GAL)), ("2 gallons", ("volume", 2 * _GAL)), ("1gal", ("volume", _GAL)),
+    ("64 fl oz", ("volume", 64 * _FL_OZ)), ("12 fl. oz", ("volume", 12 * _FL_OZ)),
+    ("16 fluid ounces", ("volume", 16 * _FL_OZ)), ("12floz", ("volume", 12 * _FL_OZ)),
+    ("6 x 12 fl oz", ("volume", 72 * _FL_OZ)), ("1 qt", ("volume", 0.946353)), ("2 Quarts", ("volume", 2 * 0.946353)),
+    ("1 pint", ("volume", 0.473176)), ("1.75 L", ("volume", 1.75)), ("2 Liters", ("volume", 2.0)),
+    ("1 litre", ("volume", 1.0)), ("500 ml", ("volume", 0.5)), ("750ml", ("volume", 0.75)),
+    ("355 mL", ("volume", 0.355)), ("4 x 1 qt", ("volume", 4 * 0.946353)),
+    ("32 oz", ("weight", 32 * _OZ)), ("16 oz", ("weight", 16 * _OZ)), ("5.3 oz", ("weight", 5.3 * _OZ)),
+    ("1 lb", ("weight", _LB)), ("10 lbs", ("weight", 10 * _LB)), ("1 1/2 lb", ("weight", 1.5 * _LB)),
+    ("3/4 lb", ("weight", 0.75 * _LB)), ("2 pounds", ("weight", 2 * _LB)), ("1 kg", ("weight", 1.0)),
+    ("454 g", ("weight", 0.454)), ("907 grams", ("weight", 0.907)),
+    ("12 ct", ("count", 12.0)), ("18 Count", ("count", 18.0)), ("100 pcs", ("count", 100.0)),
+    ("6 pack", ("count", 6.0)), ("Pack of 4", ("count", 4.0)), ("1 dozen", ("count", 12.0)),
+    ("2 dozen", ("count", 24.0)), ("", None),
+]
+NUTRIENT_NOISE = ["12g Protein", "20g protein", "5g Total Sugars", "3g Dietary Fiber", "0g Added Sugars",
+                  "21g Plant Protein", "2g Saturated Fat"]
+FILLER_NOISE = ["Family Size", "Vitamin D", "Organic", "Value Pack", "100% Natural", "Gluten Free", "No. 1"]
+
+# Retail titles and the package size parse_quantity must read from them:
+# (title, (dimension, canonical amount)) or (title, None). More real titles
+# are in UNIT_CONFORMANCE.
+UNIT_CASES = [
+    ("Chobani Greek Yogurt 5.3 oz, 12g protein", ("weight", 5.3 * _OZ)),
+    ("Quest Protein Bar 2.12 oz 21g Protein", ("weight", 2.12 * _OZ)),
+    ("Optimum Nutrition Gold Standard 100% Whey, 24g Protein, 2 lb", ("weight", 2 * _LB)),
+    ("Orgain Organic Protein Powder, 21g Plant Protein, 2.03 lb", ("weight", 2.03 * _LB)),
+    ("Kind Bar, 5g Total Sugars, 1.4 oz", ("weight", 1.4 * _OZ)),
+    ("Kleenex Ultra Soft Facial Tissues, 3 pack 120 count", ("count", 120.0)),
+    ("Great Value Whole Milk, 1/2 gal", ("volume", 0.5 * _GAL)),
+    ("Horizon Organic Whole Milk, 1/2 Gallon", ("volume", 0.5 * _GAL)),
+    ("80/20 Ground Beef, 1 1/2 lb", ("weight", 1.5 * _LB)),
+    ("Coca-Cola Soda, 6 x 12 fl oz Cans", ("volume", 72 * _FL_OZ)),
+    ("Coca-Cola Soda 12 fl oz, 12 pack", ("volume", 144 * _FL_OZ)),
+    ("Fairlife 2% Reduced Fat Milk, 52 fl oz (1.54 L)", ("volume", 52 * _FL_OZ)),
+    ("Pepsi Cola 2 L Bottle", ("volume", 2.0)),
+    ("Tide Liquid Laundry Detergent, 92 fl oz", ("volume", 92 * _FL_OZ)),
+    ("Heinz Tomato Ketchup 32 oz, Pack of 2", ("weight", 64 * _OZ)),
+    ("Kirkland Signature Unsalted Butter 4 lb", ("weight", 4 * _LB)),
+    ("Great Value Large White Eggs, 18 Count", ("count", 18.0)),
+    ("Eggland's Best Large Eggs, 1 dozen", ("count", 12.0)),
+    ("Bounty Paper Towels, 6 pack", ("count", 6.0)),
+    ("Nature's Own Honey Wheat Bread", None),
+    ("Store Milk 1/0 gal", None),
+    ("Store Milk 1/0 gal, 64 fl oz", ("volume", 64 * _FL_OZ)),
+]
+# (title, size) pairs that title_matches_quantity must accept
+UNIT_MATCH_CASES = [
+    ("Chobani Greek Yogurt 5.3 oz, 12g protein", "5.3 oz"),
+    ("Great Value Whole Milk, 1/2 gal", "64 fl oz"),
+    ("Kleenex Ultra Soft Facial Tissues, 3 pack 120 count", "120 ct"),
+]
+SAMPLE_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test.json")
+
+
+def synthetic_results(n: int, seed: int = 7) -> List[dict]:
+    """Generate ``n`` HasData-like result dicts with realistic grocery titles."""
+    rng = random.Random(seed)
+    results = []
+    for i in range(n):
+        title = " ".join(x for x in (rng.choice(BRANDS), rng.choice(ITEMS), rng.choice(SIZES)) if x)
+        results.append({
+            "position": i + 1,
+            "title": title,
+            "extractedPrice": round(rng.uniform(1.0, 15.0), 2),
+            "source": rng.choice(STORES),
+        })
+    return results
+
+
+def time_it(fn: Callable[[], object], repeat: int) -> float:
+    """Return the median wall time of ``fn`` in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def bench_embed(sizes: List[int], repeat: int) -> None:
+    """Compare one embedding_scores call per title against one batched call.
+
+    The per-pair and batched columns run with a cold embedding cache; the warm
+    column repeats the batched call with every title already cached.
+    """
+    if not pms.load_embedding_model():
+        print("❌ sentence-transformers is not available; nothing to benchmark")
+        return
+    query = pms.normalize_text("whole milk 1 gallon")
+
+    def cold(fn: Callable[[], object]) -> Callable[[], object]:
+        def run():
+            pms._EMBED_CACHE.clear()
+            return fn()
+        return run
+
+    print(f"{'candidates':>10} {'per-pair ms':>12} {'batched ms':>11} {'warm ms':>8} {'speedup':>8}")
+    for n in sizes:
+        titles = [pms.normalize_text(r["title"]) for r in synthetic_results(n)]
+        per_pair = time_it(cold(lambda: [pms.embedding_scores(query, [t]) for t in titles]), repeat)
+        batched = time_it(cold(lambda: pms.embedding_scores(query, titles)), repeat)
+        warm = time_it(lambda: pms.embedding_scores(query, titles), repeat)
+        print(f"{n:>10} {per_pair:>12.1f} {batched:>11.1f} {warm:>8.2f} {per_pair / max(batched, 1e-9):>7.1f}x")
+    print(f"cache: {pms._EMBED_CACHE.stats()}")
+
+
+def bench_backends(backends: List[str], candidates: int, repeat: int) -> None:
+    """Compare match selections and latency of each embedding backend against torch.
+
+    Runs the fixed query corpus through select_best_product with each backend
+    swapped in (embedding cache and persistent store bypassed) and reports
+    how often the selected product agrees with the torch baseline.
+    """
+    results = synthetic_results(candidates)
+    titles = [pms.normalize_text(r["title"]) for r in results]
+    saved = (pms._EMBED_MODEL, pms._EMBED_STORE)
+    pms._EMBED_STORE = None
+    baseline = None
+    print(f"{'backend':>10} {'encode ms':>10} {'match ms':>9} {'agree':>7} {'max |Δembed|':>13}")
+    try:
+        for name in ["torch"] + [b for b in backends if b != "torch"]:
+            if not embedding_backends.backend_available(name):
+                print(f"{name:>10} (dependencies not installed)")
+                continue
+            try:
+                pms._EMBED_MODEL = embedding_backends.create_backend(name, pms.EMBED_MODEL_NAME, pms.EMBED_ONNX_DIR)
+            except Exception as e:
+                print(f"{name:>10} (unavailable: {e})")
+                continue
+            pms._EMBED_CACHE.clear()
+            encode_ms = time_it(lambda: pms._EMBED_MODEL.encode(titles), repeat)
+
+            picks, embeds = [], []
+            t0 = time.perf_counter()
+            for q in CORPUS_QUERIES:
+                pms._EMBED_CACHE.clear()
+                res = pms.select_best_product(q, results)
+                picks.append((res.get("selected") or {}).get("title"))
+                embeds.append(pms.embedding_scores(pms.normalize_text(q), titles))
+            match_ms = (time.perf_counter() - t0) * 1000 / len(CORPUS_QUERIES)
+
+            if baseline is None:
+                if name != "torch":
+                    print("❌ torch baseline is required for the comparison")
+                    return
+                baseline = (picks, embeds)
+            agree = sum(a == b for a, b in zip(picks, baseline[0])) / len(picks)
+            drift = max(abs(x - y) for e, be in zip(embeds, baseline[1]) for x, y in zip(e, be))
+            print(f"{name:>10} {encode_ms:>10.1f} {match_ms:>9.1f} {agree:>6.0%} {drift:>13.4f}")
+    finally:
+        pms._EMBED_MODEL, pms._EMBED_STORE = saved
+        pms._EMBED_CACHE.clear()
+
+
+def bench_cascade(top_k: int, candidates: int, seeds: int) -> None:
+    """Check cascaded scoring against full scoring on a regression corpus.
+
+    For every corpus query and several synthetic result sets, compares the
+    selected product and reason of select_best_product with the cascade
+    disabled and enabled, and counts the titles sent to the embedding model.
+    """
+    if not pms.load_embedding_model():
+        print("❌ sentence-transformers is not available; nothing to benchmark")
+        return
+    model = pms._EMBED_MODEL
+    saved_store = pms._EMBED_STORE
+    pms._EMBED_STORE = None
+    encoded = {"texts": 0}
+
+    class CountingModel:
+        def encode(self, texts, **kwargs):
+            encoded["texts"] += len(texts)
+            return model.encode(texts, **kwargs)
+
+        def get_sentence_embedding_dimension(self):
+            return model.get_sentence_embedding_dimension()
+
+    def run(k):
+        pms._EMBED_CACHE.clear()
+        encoded["texts"] = 0
+        picks = []
+        t0 = time.perf_counter()
+        for seed in range(seeds):
+            results = synthetic_results(candidates, seed=seed)
+            for q in CORPUS_QUERIES:
+                for tie_delta in (0.10, 0.20, 0.25):
+                    pms._EMBED_CACHE.clear()
+                    res = pms.select_best_product(q, results, tie_delta=tie_delta, cascade_top_k=k)
+                    picks.append(((res.get("selected") or {}).get("title"), res.get("reason")))
+        return picks, encoded["texts"], (time.perf_counter() - t0) * 1000
+
+    pms._EMBED_MODEL = CountingModel()
+    try:
+        full, full_texts, full_ms = run(0)
+        cascaded, cascaded_texts, cascaded_ms = run(top_k)
+    finally:
+        pms._EMBED_MODEL = model
+        pms._EMBED_STORE = saved_store
+        pms._EMBED_CACHE.clear()
+
+    same = sum(a == b for a, b in zip(full, cascaded))
+    print(f"cases: {len(full)}  identical selections: {same}/{len(full)}")
+    print(f"{'mode':>10} {'texts encoded':>14} {'total ms':>9}")
+    print(f"{'full':>10} {full_texts:>14} {full_ms:>9.0f}")
+    print(f"{'top-' + str(top_k):>10} {cascaded_texts:>14} {cascaded_ms:>9.0f}")
+
+
+def bench_fuzzy(sizes: List[int], repeat: int, cutoff: float) -> None:
+    """Compare per-pair token_set/partial scoring against the cdist batch API."""
+    query = pms.normalize_text("great value whole milk 1 gallon")
+    print(f"{'candidates':>10} {'per-pair ms':>12} {'cdist ms':>9} {'cutoff ms':>10} {'speedup':>8}")
+    for n in sizes:
+        titles = [pms.normalize_text(r["title"]) for r in synthetic_results(n)]
+        per_pair = time_it(lambda: [(pms.token_set_score(query, t), pms.partial_score(query, t)) for t in titles], repeat)
+        batched = time_it(lambda: pms.fuzzy_scores(query, titles, score_cutoff=0.0), repeat)
+        with_cutoff = time_it(lambda: pms.fuzzy_scores(query, titles, score_cutoff=cutoff), repeat)
+        print(f"{n:>10} {per_pair:>12.2f} {batched:>9.2f} {with_cutoff:>10.2f} {per_pair / max(batched, 1e-9):>7.1f}x")
+
+
+def legacy_parse_volume_to_liters(title: str) -> Optional[float]:
+    """The original sequential regex cascade (volume only), kept as a timing reference."""
+    t = title.lower()
+    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:gal|gallon|gallons)\b", t)
+    if m:
+        return float(m.group(1)) * 3.78541
+    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:fl\s*oz|fluid\s*oz|oz)\b", t)
+    if m:
+        return float(m.group(1)) * 0.0295735
+    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:l|litre|liter|liters)\b", t)
+    if m:
+        return float(m.group(1))
+    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:ml|milliliter|millilitre|milliliters)\b", t)
+    if m:
+        return float(m.group(1)) / 1000.0
+    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:qt|quart|quarts)\b", t)
+    if m:
+        return float(m.group(1)) * 0.946353
+    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:pt|pint|pints)\b", t)
+    if m:
+        return float(m.group(1)) * 0.473176
+    m = re.search(r"(\d+(?:\.\d+)?)(gal|gallon|gallons)\b", t)
+    if m:
+        return float(m.group(1)) * 3.78541
+    return None
+
+
+def load_unit_expectations(paths: List[str]) -> List[tuple]:
+    """(title, (dimension, amount) or None) rows from JSONL expectation files."""
+    cases = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    want = (row["dimension"], row["amount"]) if row.get("dimension") else None
+                    cases.append((row["title"], want))
+    return cases
+
+
+def generated_unit_cases(n: int, seed: int = 11) -> List[tuple]:
+    """``n`` synthetic titles whose package size is known by construction.
+
+    Each title holds one size from SIZE_TRUTH at a random position, and may
+    carry a nutrient weight, size-free filler words and (for volume and
+    weight sizes) an "N Pack" that multiplies it.
+    """
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(n):
+        size, want = rng.choice(SIZE_TRUTH)
+        parts = [rng.choice(BRANDS), rng.choice(ITEMS)]
+        parts.insert(rng.randint(0, len(parts)), size)
+        if rng.random() < 0.3:
+            parts.insert(rng.randint(0, len(parts)), rng.choice(NUTRIENT_NOISE))
+        if rng.random() < 0.3:
+            parts.insert(rng.randint(0, len(parts)), rng.choice(FILLER_NOISE))
+        if want is not None and want[0] != "count" and " x " not in size and rng.random() < 0.3:
+            k = rng.randint(2, 24)
+            parts.append(f"{k} Pack")
+            want = (want[0], want[1] * k)
+        cases.append((", ".join(x for x in parts if x), want))
+    return cases
+
+
+def unit_noise_titles(n: int, seed: int = 13) -> List[str]:
+    """Titles with several or malformed sizes from UNIT_SIZES (checked for invariants only)."""
+    rng = random.Random(seed)
+    titles = []
+    for _ in range(n):
+        parts = [rng.choice(BRANDS), rng.choice(ITEMS)]
+        for _ in range(rng.randint(0, 3)):
+            parts.insert(rng.randint(0, len(parts)), rng.choice(UNIT_SIZES))
+        titles.append(" ".join(x for x in parts if x))
+    return titles
+
+
+def quantity_problem(title: str) -> Optional[str]:
+    """Why parse_quantity's result for ``title`` breaks an invariant, or None."""
+    try:
+        got = pms.parse_quantity(title)
+        raw = pms.parse_quantity.__wrapped__(title)
+    except Exception as e:
+        return f"raised {e!r}"
+    if got != raw:
+        return f"cached {got} differs from uncached {raw}"
+    if got is None:
+        return None
+    if got.dimension not in pms.DIMENSIONS:
+        return f"unknown dimension {got.dimension!r}"
+    for value in (got.amount, got.fluid_liters):
+        if value is not None and not (math.isfinite(value) and value >= 0):
+            return f"bad amount in {got}"
+    if got.amount > 0 and not pms.quantities_match(got, got):
+        return f"{got} does not match itself"
+    return None
+
+
+def bench_units(n: int, repeat: int, dump: Optional[str], golden: List[str], record: Optional[str]) -> int:
+    """Check parse_quantity at corpus scale, then time it.
+
+    Expected sizes come from UNIT_CASES, the ``golden`` JSONL files (real
+    titles, test.json included) and ``n`` generated titles whose size is
+    known by construction. Every title, plus the ``dump`` titles and
+    malformed-size noise, must also parse without raising to a finite,
+    non-negative amount that is the same cached and uncached. ``record``
+    writes the dump titles with their current parse in the golden format,
+    for review before adding them to a golden file. Returns non-zero on any
+    failed check.
+    """
+    groups = [
+        ("cases", UNIT_CASES),
+        ("golden", load_unit_expectations(golden)),
+        ("generated", generated_unit_cases(n)),
+    ]
+    dump_titles = []
+    if dump:
+        with open(dump, "r", encoding="utf-8") as f:
+            dump_titles = list(dict.fromkeys(iter_dump_titles(f)))
+    titles = [t for _, cases in groups for t, _ in cases] + dump_titles + unit_noise_titles(n // 5)
+
+    failures = 0
+    print(f"{'group':>10} {'titles':>7} {'failures':>9}")
+    for name, cases in groups:
+        failed = []
+        for title, want in cases:
+            got = pms.parse_quantity(title)
+            ok = (got is None if want is None else
+                  got is not None and got.dimension == want[0] and math.isclose(got.amount, want[1], rel_tol=1e-6))
+            if not ok:
+                failed.append(f"{title!r}: want {want} got {got}")
+        if name == "cases":
+            failed += [f"{title!r} does not match {size!r}" for title, size in UNIT_MATCH_CASES
+                       if not pms.title_matches_quantity(title, pms.parse_quantity(size))]
+        print(f"{name:>10} {len(cases):>7} {len(failed):>9}")
+        for line in failed[:10]:
+            print(f"  ❌ {line}")
+        failures += len(failed)
+    problems = [(t, p) for t in titles for p in [quantity_problem(t)] if p]
+    print(f"{'invariants':>10} {len(titles):>7} {len(problems):>9}")
+    for title, problem in problems[:10]:
+        print(f"  ❌ {title!r}: {problem}")
+    failures += len(problems)
+
+    if record:
+        with open(record, "w", encoding="utf-8") as f:
+            for title in dump_titles:
+                q = pms.parse_quantity(title)
+                f.write(json.dumps({"title": title, "dimension": q.dimension if q else None,
+                                    "amount": round(q.amount, 9) if q else None}) + "\n")
+        print(f"recorded {len(dump_titles)} dump titles to {record} for review")
+
+    legacy = time_it(lambda: [legacy_parse_volume_to_liters(t) for t in titles], repeat)
+    engine = time_it(lambda: [pms.parse_quantity.__wrapped__(t) for t in titles], repeat)
+    pms.parse_quantity.cache_clear()
+    [pms.parse_quantity(t) for t in titles]
+    cached = time_it(lambda: [pms.parse_quantity(t) for t in titles], repeat)
+    dims = {}
+    for t in titles:
+        q = pms.parse_quantity(t)
+        dims[q.dimension if q else None] = dims.get(q.dimension if q else None, 0) + 1
+    per_title = 1e6 / len(titles)
+    print(f"titles: {len(titles)}  dimensions: {dims}")
+    print(f"{'parser':>10} {'total ms':>9} {'µs/title':>9}")
+    print(f"{'cascade':>10} {legacy:>9.2f} {legacy * per_title / 1000:>9.2f}   (volume only)")
+    print(f"{'quantity':>10} {engine:>9.2f} {engine * per_title / 1000:>9.2f}")
+    print(f"{'cached':>10} {cached:>9.2f} {cached * per_title / 1000:>9.2f}")
+    print("✅ conformance" if not failures else "❌ conformance failures")
+    return 1 if failures else 0
+
+
+def bench_llm(concurrency: int, latency_ms: float) -> None:
+    """Exercise call_openai_extract_components against a local stub of the API.
+
+    Reports event-loop lag while ``concurrency`` extractions are in flight
+    (the stub shares this process, so its threads add some GIL contention),
+    per-call latency with a warm keep-alive pool, the handling of 401, 429,
+    500 and timeout responses, and extraction cache hits per tier.
+    """
+    stub = StubOpenAIServer(latency_ms=latency_ms).start()
+    saved_client, saved_key = pms._OPENAI_CLIENT, os.environ.get("OPENAI_API_KEY")
+    saved_cache = pms._EXTRACTION_CACHE
+    saved_breaker, saved_latency = pms._OPENAI_BREAKER, pms._OPENAI_LATENCY
+    pms._OPENAI_CLIENT = OpenAIClient(base_url=stub.base_url)
+    pms._OPENAI_BREAKER, pms._OPENAI_LATENCY = CircuitBreaker(), LatencyTracker(max_s=pms._OPENAI_CLIENT.read_timeout)
+    os.environ["OPENAI_API_KEY"] = "sk-stub-0000000000"
+    logging_level = pms.logger.level
+    pms.logger.setLevel("CRITICAL")
+
+    async def run():
+        lags = []
+
+        async def ticker(stop: asyncio.Event):
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append((time.perf_counter() - t0) * 1000 - 5)
+
+        # first round opens the pooled connections; measure the second
+        await asyncio.gather(*[pms.call_openai_extract_components("warm up") for _ in range(concurrency)])
+        stop = asyncio.Event()
+        tick = asyncio.create_task(ticker(stop))
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*[
+            pms.call_openai_extract_components(f"whole milk {i} gallon") for i in range(concurrency)
+        ])
+        wall = (time.perf_counter() - t0) * 1000
+        stop.set()
+        await tick
+        ok = sum(r is not None for r in results)
+        print(f"{concurrency} concurrent calls: {ok} ok in {wall:.0f} ms "
+              f"(stub latency {latency_ms:.0f} ms), max loop lag {max(lags or [0]):.1f} ms")
+
+        samples = []
+        for _ in range(10):
+            t0 = time.perf_counter()
+            await pms.call_openai_extract_components("eggs dozen")
+            samples.append((time.perf_counter() - t0) * 1000 - latency_ms)
+        print(f"sequential overhead over stub latency (pooled): median {statistics.median(samples):.2f} ms")
+
+        for label, query, timeout in (("429", "status=429", None), ("500", "status=500", None),
+                                      ("timeout", "slow", latency_ms / 2000.0), ("401", "status=401", None)):
+            t0 = time.perf_counter()
+            res = await pms.call_openai_extract_components(query, timeout_seconds=timeout)
+            print(f"{label:>8}: result={res} in {(time.perf_counter() - t0) * 1000:.0f} ms")
+        disabled = await pms.call_openai_extract_components("milk")
+        print(f"after 401: disabled={pms._OPENAI_DISABLED_FOR_FINGERPRINT is not None} result={disabled}")
+        pms._OPENAI_DISABLED_FOR_FINGERPRINT = pms._OPENAI_DISABLED_REASON = None
+
+        # extraction cache: memory tier, a second "worker" reading the SQLite tier, negative entries
+        with tempfile.TemporaryDirectory() as tmp:
+            db = os.path.join(tmp, "extractions.sqlite")
+            pms._EXTRACTION_CACHE = ExtractionCache(db_path=db, negative_ttl_s=60)
+            for label, query in (("miss", "Whole Milk 1 Gallon"), ("memory hit", "whole milk 1 gallon")):
+                before, t0 = stub.requests, time.perf_counter()
+                await pms.extract_query_components(query)
+                print(f"{label:>14}: {(time.perf_counter() - t0) * 1000:7.2f} ms, upstream calls {stub.requests - before}")
+            pms._EXTRACTION_CACHE = ExtractionCache(db_path=db)
+            before, t0 = stub.requests, time.perf_counter()
+            await pms.extract_query_components("whole milk 1 gallon")
+            print(f"{'disk hit':>14}: {(time.perf_counter() - t0) * 1000:7.2f} ms, upstream calls {stub.requests - before}")
+            before = stub.requests
+            for _ in range(3):
+                await pms.extract_query_components("status=500 eggs")
+            print(f"{'negative':>14}: 3 lookups of a failing query, upstream calls {stub.requests - before}")
+            print(f"cache: {pms._EXTRACTION_CACHE.stats()}")
+        await pms._OPENAI_CLIENT.aclose()
+
+    try:
+        asyncio.run(run())
+        print(f"client: {pms._OPENAI_CLIENT.stats()}  stub requests: {stub.requests}")
+    finally:
+        stub.stop()
+        pms._OPENAI_CLIENT = saved_client
+        pms._EXTRACTION_CACHE = saved_cache
+        pms._OPENAI_BREAKER, pms._OPENAI_LATENCY = saved_breaker, saved_latency
+        pms._OPENAI_DISABLED_FOR_FINGERPRINT = pms._OPENAI_DISABLED_REASON = None
+        pms.logger.setLevel(logging_level)
+        if saved_key is None:
+            os.environ.pop("OPENAI_API_KEY", None)
+        else:
+            os.environ["OPENAI_API_KEY"] = saved_key
+
+
+def bench_singleflight(callers: int, latency_ms: float) -> int:
+    """Fire ``callers`` identical extractions at a stub and count upstream calls.
+
+    Runs once with coroutines through extract_query_components and once with
+    threads sharing a SingleFlight around a blocking call. Returns non-zero if
+    either made more than one upstream call, or if extraction keys merge
+    queries that differ in more than case and spacing.
+    """
+    key = pms.extraction_cache_key
+    keys_ok = (key("1/2 gallon milk") != key("1 2 gallon milk")
+               and key("Whole Milk  1 Gallon") == key("whole milk 1 gallon"))
+    print(f"extraction keys: fractions kept apart, case/spacing merged: {keys_ok}")
+    stub = StubOpenAIServer(latency_ms=latency_ms).start()
+    saved = (pms._OPENAI_CLIENT, pms._EXTRACTION_CACHE, os.environ.get("OPENAI_API_KEY"))
+    pms._OPENAI_CLIENT = OpenAIClient(base_url=stub.base_url)
+    pms._EXTRACTION_CACHE = ExtractionCache(max_entries=0)  # no cache: coalescing alone must dedupe
+    os.environ["OPENAI_API_KEY"] = "sk-stub-0000000000"
+    level = pms.logger.level
+    pms.logger.setLevel("CRITICAL")
+    failures = int(not keys_ok)
+    try:
+        async def run():
+            t0 = time.perf_counter()
+            results = await asyncio.gather(*[
+                pms.extract_query_components("Whole Milk 1 Gallon" if i % 2 else "whole milk 1 gallon")
+                for i in range(callers)
+            ])
+            await pms._OPENAI_CLIENT.aclose()
+            return results, (time.perf_counter() - t0) * 1000
+
+        before = stub.requests
+        results, wall = asyncio.run(run())
+        upstream = stub.requests - before
+        same = all(r == results[0] and r is not None for r in results)
+        print(f"async:   {callers} callers, {upstream} upstream call(s), identical results: {same}, {wall:.0f} ms")
+        failures += upstream != 1 or not same
+
+        flights = pms.SingleFlight()
+        body = {"messages": [{"role": "user", "content": "identify brand, item and quantity in this: eggs"}]}
+
+        def blocking_call():
+            req = urlrequest.Request(f"{stub.base_url}/chat/completions", data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+            with urlrequest.urlopen(req, timeout=10) as resp:
+                return json.loads(resp.read())
+
+        before = stub.requests
+        barrier = threading.Barrier(callers)
+
+        def worker(out, i):
+            barrier.wait()
+            out[i] = flights.do_sync("eggs", blocking_call)
+
+        out = [None] * callers
+        threads = [threading.Thread(target=worker, args=(out, i)) for i in range(callers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        upstream = stub.requests - before
+        print(f"threads: {callers} callers, {upstream} upstream call(s), flights: {flights.stats()}")
+        failures += upstream != 1 or any(o is None for o in out)
+    finally:
+        stub.stop()
+        pms._OPENAI_CLIENT, pms._EXTRACTION_CACHE = saved[0], saved[1]
+        pms.logger.setLevel(level)
+        if saved[2] is None:
+            os.environ.pop("OPENAI_API_KEY", None)
+        else:
+            os.environ["OPENAI_API_KEY"] = saved[2]
+    print("✅ coalesced" if not failures else "❌ duplicate upstream calls")
+    return 1 if failures else 0
+
+
+def bench_speculative(latency_ms: float, candidates: int, budget_ms: float, repeat: int) -> None:
+    """Time /match-products-for-stores with classic scoring overlapping the LLM call.
+
+    The query makes the stub fail after ``latency_ms``, so every store falls
+    back to the classic matches. Compares the LLM call and classic scoring on
+    their own, run back to back, and overlapped by the endpoint, with the
+    budget disabled and set to ``budget_ms``.
+    """
+    pms.load_embedding_model()
+    stub = StubOpenAIServer(latency_ms=latency_ms).start()
+    saved = (pms._OPENAI_CLIENT, pms._EXTRACTION_CACHE, os.environ.get("OPENAI_API_KEY"), pms.LLM_LATENCY_BUDGET_MS,
+             pms._OPENAI_BREAKER)
+    pms._OPENAI_CLIENT = OpenAIClient(base_url=stub.base_url)
+    pms._EXTRACTION_CACHE = ExtractionCache(max_entries=0)  # every round calls the stub
+    pms._OPENAI_BREAKER = CircuitBreaker(failure_threshold=10 ** 9)  # the failures here are deliberate
+    os.environ["OPENAI_API_KEY"] = "sk-stub-0000000000"
+    level = pms.logger.level
+    pms.logger.setLevel("CRITICAL")
+
+    query = "great value whole milk 1 gallon status=500"
+    results = synthetic_results(candidates)
+    store_results = {}
+    for r in results:
+        store_results.setdefault(r["source"], []).append(r)
+    mapping = {s: s for s in store_results}
+    request = {"query": query, "hasdata_results": results, "nearby_stores": list(store_results)}
+
+    async def timed(make) -> float:
+        samples = []
+        for _ in range(repeat):
+            pms._EMBED_CACHE.clear()
+            t0 = time.perf_counter()
+            await make()
+            samples.append((time.perf_counter() - t0) * 1000)
+        return statistics.median(samples)
+
+    async def sequential():
+        await pms.extract_query_components(query)
+        await pms.classic_store_matches(query, mapping, store_results)
+
+    async def endpoint(budget: float):
+        pms.LLM_LATENCY_BUDGET_MS = budget
+        return await pms.match_stores_for_query(request)
+
+    async def run():
+        rows = [
+            ("llm only", await timed(lambda: pms.extract_query_components(query))),
+            ("classic only", await timed(lambda: pms.classic_store_matches(query, mapping, store_results))),
+            ("sequential", await timed(sequential)),
+            ("overlapped", await timed(lambda: endpoint(0))),
+            (f"budget {budget_ms:.0f}", await timed(lambda: endpoint(budget_ms))),
+        ]
+        check = await endpoint(0)
+        await asyncio.sleep(latency_ms / 1000.0)  # let abandoned extractions land
+        await pms._OPENAI_CLIENT.aclose()
+        return rows, check
+
+    try:
+        rows, check = asyncio.run(run())
+    finally:
+        stub.stop()
+        pms._OPENAI_CLIENT, pms._EXTRACTION_CACHE = saved[0], saved[1]
+        pms.LLM_LATENCY_BUDGET_MS, pms._OPENAI_BREAKER = saved[3], saved[4]
+        pms.logger.setLevel(level)
+        if saved[2] is None:
+            os.environ.pop("OPENAI_API_KEY", None)
+        else:
+            os.environ["OPENAI_API_KEY"] = saved[2]
+
+    print(f"{len(store_results)} stores, {candidates} results, stub latency {latency_ms:.0f} ms, "
+          f"embeddings: {'on' if pms.embeddings_ready() else 'off'}")
+    print(f"matched stores: {check['matched_stores']}/{check['total_stores']}")
+    print(f"{'path':>14} {'median ms':>10}")
+    for name, ms in rows:
+        print(f"{name:>14} {ms:>10.1f}")
+
+
+def bench_breaker(latency_ms: float, slow_ms: float, hang_ms: float, reset_s: float, max_s: float) -> int:
+    """Drive extract_query_components through a slowdown, an OpenAI hang and recovery.
+
+    A healthy stub (``latency_ms``) trains the adaptive read timeout. The stub
+    then slows to ``slow_ms``, past 2x the learned p95: the first call times
+    out and the timeout backs off until the slow replies fit, without opening
+    the circuit. Then it hangs for ``hang_ms`` and calls time out (backing
+    off toward ``max_s``, the client's read timeout) until the circuit opens.
+    While it is open extractions return at once (the stores endpoint goes
+    straight to the classic matcher); after ``reset_s`` a probe with the full
+    timeout against the recovered stub closes it again. Returns non-zero if
+    the slowdown opened the circuit or the probe did not close it.
+    """
+    stub = StubOpenAIServer(latency_ms=latency_ms).start()
+    saved = (pms._OPENAI_CLIENT, pms._EXTRACTION_CACHE, pms._OPENAI_BREAKER, pms._OPENAI_LATENCY,
+             os.environ.get("OPENAI_API_KEY"))
+    pms._OPENAI_CLIENT = OpenAIClient(base_url=stub.base_url, read_timeout=max_s)
+    pms._EXTRACTION_CACHE = ExtractionCache(max_entries=0)
+    pms._OPENAI_BREAKER = CircuitBreaker(failure_threshold=5, reset_timeout_s=reset_s)
+    pms._OPENAI_LATENCY = LatencyTracker(max_s=pms._OPENAI_CLIENT.read_timeout)
+    os.environ["OPENAI_API_KEY"] = "sk-stub-0000000000"
+    level = pms.logger.level
+    pms.logger.setLevel("CRITICAL")
+    counter = iter(range(10 ** 6))
+
+    async def phase(label: str, calls: int) -> int:
+        before, samples, ok = stub.requests, [], 0
+        for _ in range(calls):
+            t0 = time.perf_counter()
+            ok += await pms.extract_query_components(f"whole milk {next(counter)} gallon") is not None
+            samples.append((time.perf_counter() - t0) * 1000)
+        print(f"{label:>10}: {calls} extractions, {ok} ok, {stub.requests - before} upstream, "
+              f"median {statistics.median(samples):7.1f} ms, max {max(samples):7.1f} ms, "
+              f"circuit {pms._OPENAI_BREAKER.state}, read timeout {pms._OPENAI_LATENCY.timeout():.2f}s")
+        return ok
+
+    async def run() -> List[str]:
+        problems = []
+        await phase("healthy", 30)
+        stub.latency_ms = slow_ms
+        if await phase("slow", 10) < 8 or pms._OPENAI_BREAKER.opened:
+            problems.append("the adaptive timeout did not adapt to the slowdown")
+        stub.latency_ms = hang_ms
+        await phase("hang", 10)
+        await phase("open", 50)
+        stub.latency_ms = latency_ms
+        await asyncio.sleep(reset_s)
+        await phase("recovered", 10)
+        if pms._OPENAI_BREAKER.state != CircuitBreaker.CLOSED:
+            problems.append("the half-open probe did not close the circuit")
+        await pms._OPENAI_CLIENT.aclose()
+        return problems
+
+    try:
+        problems = asyncio.run(run())
+        print(f"breaker: {pms._OPENAI_BREAKER.stats()}")
+        print(f"timeout: {pms._OPENAI_LATENCY.stats()}")
+    finally:
+        stub.stop()
+        pms._OPENAI_CLIENT, pms._EXTRACTION_CACHE, pms._OPENAI_BREAKER, pms._OPENAI_LATENCY = saved[:4]
+        pms.logger.setLevel(level)
+        if saved[4] is None:
+            os.environ.pop("OPENAI_API_KEY", None)
+        else:
+            os.environ["OPENAI_API_KEY"] = saved[4]
+    for problem in problems:
+        print(f"❌ {problem}")
+    print("✅ breaker and timeout recovered" if not problems else "❌ breaker check failed")
+    return 1 if problems else 0
+
+
+def bench_batch(queries: int, batch_size: int, latency_ms: float) -> int:
+    """Batched vs per-query LLM extraction for a shopping list, against the stub.
+
+    Counts upstream calls and wall time for ``queries`` distinct queries
+    extracted one by one (sequentially and concurrently) and through
+    extract_query_components_batch, then checks the fallbacks for a reply
+    that drops a query and a malformed reply, and runs /match-shopping-list
+    end to end. Returns non-zero if a batch result differs from the single
+    extraction of the same query.
+    """
+    stub = StubOpenAIServer(latency_ms=latency_ms).start()
+    saved = (pms._OPENAI_CLIENT, pms._EXTRACTION_CACHE, pms._OPENAI_BREAKER, os.environ.get("OPENAI_API_KEY"))
+    pms._OPENAI_CLIENT = OpenAIClient(base_url=stub.base_url)
+    pms._OPENAI_BREAKER = CircuitBreaker(failure_threshold=10 ** 9)
+    os.environ["OPENAI_API_KEY"] = "sk-stub-0000000000"
+    level = pms.logger.level
+    pms.logger.setLevel("CRITICAL")
+    shopping = [f"{item} no. {i}" for i, item in enumerate(ITEMS * (queries // len(ITEMS) + 1))][:queries]
+    failures = 0
+
+    async def measure(label: str, make) -> list:
+        pms._EXTRACTION_CACHE = ExtractionCache(max_entries=0)
+        before, t0 = stub.requests, time.perf_counter()
+        out = await make()
+        print(f"{label:>22}: {stub.requests - before:3d} upstream calls, {(time.perf_counter() - t0) * 1000:7.0f} ms")
+        return out
+
+    async def sequential():
+        return [await pms.extract_query_components(q) for q in shopping]
+
+    async def run():
+        nonlocal failures
+        singles = await measure("single, sequential", sequential)
+        await measure("single, concurrent", lambda: asyncio.gather(*[pms.extract_query_components(q) for q in shopping]))
+        batched = await measure(f"batch (chunks of {batch_size})",
+                                lambda: pms.extract_query_components_batch(shopping, batch_size))
+        failures += batched != singles
+        print(f"batch results identical to single extraction: {batched == singles}")
+
+        dropped = shopping[:5] + ["eggs drop"]
+        out = await measure("reply drops 1 of 6", lambda: pms.extract_query_components_batch(dropped, batch_size))
+        failures += any(r is None for r in out)
+        broken = shopping[:5] + ["malformed"]
+        out = await measure("malformed reply (6)", lambda: pms.extract_query_components_batch(broken, batch_size))
+        failures += any(r is None for r in out)
+
+        results = synthetic_results(300)
+        request = {"items": [{"query": q, "hasdata_results": results} for q in shopping[:10] + ["great value whole milk 1 gal"]]}
+        response = await measure("/match-shopping-list", lambda: pms.match_shopping_list(request))
+        ordered = [r["query"] for r in response["results"]] == [i["query"] for i in request["items"]]
+        failures += not ordered
+        print(f"shopping list: {response['total_items']} items, {response['llm_extractions']} via LLM, "
+              f"{response['local_extractions']} local, in order: {ordered}")
+        await pms._OPENAI_CLIENT.aclose()
+
+    try:
+        asyncio.run(run())
+        print(f"batches: {pms._BATCH_STATS}")
+    finally:
+        stub.stop()
+        pms._OPENAI_CLIENT, pms._EXTRACTION_CACHE, pms._OPENAI_BREAKER = saved[:3]
+        pms.logger.setLevel(level)
+        if saved[3] is None:
+            os.environ.pop("OPENAI_API_KEY", None)
+        else:
+            os.environ["OPENAI_API_KEY"] = saved[3]
+    print("✅ batch extraction consistent" if not failures else "❌ batch extraction mismatch")
+    return 1 if failures else 0
+
+
+# Brands the synthetic titles never mention, so the lexicon cannot know them
+def bench_pool(requests: int, candidates: int, workers: int, max_queue: int, process: bool) -> int:
+    """Event-loop responsiveness and admission control of the match executor.
+
+    Fires ``requests`` concurrent /match-products calls while a probe awaits
+    the health check every 10 ms, once with matching inline on the event
+    loop and once in a thread pool of ``workers``. A last round with a queue
+    of ``max_queue`` must turn the overflow into 503s.
+    """
+    pms.load_embedding_model()
+    saved, level = pms._MATCH_POOL, pms.logger.level
+    pms.logger.setLevel("CRITICAL")
+    results = synthetic_results(candidates)
+    queries = [f"{random.Random(i).choice(BRANDS)} {random.Random(i).choice(ITEMS)} {i}" for i in range(requests)]
+
+    async def round_trip(pool) -> tuple:
+        pms._MATCH_POOL = pool
+        pms._EMBED_CACHE.clear()
+        lags, stop = [], asyncio.Event()
+
+        async def probe():
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                await pms.health_check()
+                await asyncio.sleep(0.01)
+                lags.append((time.perf_counter() - t0) * 1000 - 10)
+
+        prober = asyncio.ensure_future(probe())
+        t0 = time.perf_counter()
+        outcomes = await asyncio.gather(*(
+            pms.score_match_request(pms.ProductMatchRequest(query=q, hasdata_results=results)) for q in queries
+        ), return_exceptions=True)
+        wall = (time.perf_counter() - t0) * 1000
+        stop.set()
+        await prober
+        rejected = sum(isinstance(o, pms.PoolSaturated) for o in outcomes)
+        errors = [o for o in outcomes if isinstance(o, Exception) and not isinstance(o, pms.PoolSaturated)]
+        if errors:
+            raise errors[0]
+        return wall, max(lags or [0.0]), rejected, pool.stats()
+
+    async def run():
+        rows = []
+        pools = [("inline", pms.MatchExecutor("inline", 1, 0)),
+                 (f"thread x{workers}", pms.MatchExecutor("thread", workers, requests))]
+        if process:
+            warm = pms.MatchExecutor("process", workers, requests)
+            await asyncio.gather(*(warm.run(len, "") for _ in range(workers)))  # spawn + model load
+            pools.append((f"process x{workers}", warm))
+        pools.append((f"queue {max_queue}", pms.MatchExecutor("thread", workers, max_queue)))
+        for name, pool in pools:
+            try:
+                rows.append((name, *await round_trip(pool)))
+            finally:
+                pool.shutdown()
+        return rows
+
+    try:
+        rows = asyncio.run(run())
+    finally:
+        pms._MATCH_POOL = saved
+        pms.logger.setLevel(level)
+
+    print(f"{requests} concurrent /match-products calls, {candidates} candidates each, "
+          f"embeddings: {'on' if pms.embeddings_ready() else 'off'}")
+    print(f"{'executor':>12} {'wall ms':>9} {'max loop lag ms':>16} {'503s':>5} {'mean wait ms':>13}")
+    for name, wall, lag, rejected, stats in rows:
+        wait = f"{stats['queue_wait_ms']['mean']:.1f}" if stats["kind"] != "inline" else "-"
+        print(f"{name:>12} {wall:>9.1f} {lag:>16.1f} {rejected:>5} {wait:>13}")
+    if requests > workers + max_queue and not rows[-1][3]:
+        print(f"❌ expected rejections with {requests} requests and a queue of {max_queue}")
+        return 1
+    return 0
+
+
+def bench_stores(store_counts: List[int], per_store: int, workers: int, repeat: int, process: bool) -> int:
+    """/match-products-for-stores with per-store matching serial vs fanned out.
+
+    Builds ``per_store`` results for each of N synthetic stores and runs a
+    classic-path query (no OpenAI key) and a locally extracted one through
+    the endpoint with a one-worker pool (every store in one job, as before)
+    and with ``workers`` threads (and processes with ``process``). Store
+    matches must be identical and in ``nearby_stores`` order.
+    """
+    pms.load_embedding_model()
+    saved, level, key = pms._MATCH_POOL, pms.logger.level, os.environ.pop("OPENAI_API_KEY", None)
+    pms.logger.setLevel("CRITICAL")
+    queries = ["horizon organic skim milk half gallon", "great value whole milk 1 gallon"]
+
+    def request(n: int, query: str) -> dict:
+        rng = random.Random(n)
+        stores = [f"Store {i:02d}" for i in range(n)]
+        results = []
+        for store in stores:
+            for r in synthetic_results(per_store, seed=rng.randrange(1 << 30)):
+                results.append(dict(r, source=store))
+        rng.shuffle(stores)  # response order must follow nearby_stores, not HasData order
+        return {"query": query, "hasdata_results": results, "nearby_stores": stores}
+
+    async def timed(pool, req) -> tuple:
+        pms._MATCH_POOL = pool
+        out = await pms.match_stores_for_query(req)  # warm this pool's embedding caches
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            out = await pms.match_stores_for_query(req)
+            samples.append((time.perf_counter() - t0) * 1000)
+        return statistics.median(samples), out
+
+    async def run():
+        pools = [("serial", pms.MatchExecutor("thread", 1, 1024)),
+                 (f"thread x{workers}", pms.MatchExecutor("thread", workers, 1024))]
+        if process:
+            warm = pms.MatchExecutor("process", workers, 1024)
+            await asyncio.gather(*(warm.run(len, "") for _ in range(workers)))  # spawn + model load
+            pools.append((f"process x{workers}", warm))
+        rows, ok = [], True
+        try:
+            for n in store_counts:
+                for query in queries:
+                    req = request(n, query)
+                    times, baseline = [], None
+                    for _, pool in pools:
+                        ms, out = await timed(pool, req)
+                        picks = [(s, (m.get("product") or {}).get("position"), m.get("reason"))
+                                 for s, m in out["store_matches"].items()]
+                        ok &= list(out["store_matches"]) == [s for s in req["nearby_stores"] if s in out["store_matches"]]
+                        if baseline is None:
+                            baseline = picks
+                        ok &= picks == baseline
+                        times.append(ms)
+                    rows.append((n, out["extraction_source"] if out["extraction_source"] == "local" else "classic",
+                                 out["matched_stores"], times))
+        finally:
+            for _, pool in pools:
+                pool.shutdown()
+        return [name for name, _ in pools], rows, ok
+
+    try:
+        names, rows, ok = asyncio.run(run())
+    finally:
+        pms._MATCH_POOL = saved
+        pms.logger.setLevel(level)
+        if key is not None:
+            os.environ["OPENAI_API_KEY"] = key
+
+    print(f"{per_store} results per store, {os.cpu_count()} CPUs, warm caches, "
+          f"embeddings: {'on' if pms.embeddings_ready() else 'off'}")
+    print(f"{'stores':>6} {'path':>8} {'matched':>8} " + " ".join(f"{name + ' ms':>14}" for name in names))
+    for n, path, matched, times in rows:
+        print(f"{n:>6} {path:>8} {matched:>8} " + " ".join(f"{ms:>14.1f}" for ms in times))
+    print("✅ identical matches in nearby_stores order" if ok else "❌ fan-out changed the store matches")
+    return 0 if ok else 1
+
+
+def bench_rescore(sizes: List[int], repeat: int) -> int:
+    """Feature block built per pass vs built once and rescored.
+
+    For each candidate count, times the shortlist plus the two weight
+    profiles of classic_store_match with a fresh FeatureBlock per pass, and
+    with one block shared by all three (embeddings cached, so this is the
+    feature cost). Selections and scores must match.
+    """
+    pms.load_embedding_model()
+    level = pms.logger.level
+    pms.logger.setLevel("CRITICAL")
+    profiles = [
+        ({"token_set": 0.50, "embed": 0.30, "partial": 0.15, "brand": 0.05}, 0.15, 0.20),
+        ({"token_set": 0.40, "embed": 0.20, "partial": 0.30, "brand": 0.10}, 0.10, 0.25),
+    ]
+    ok = True
+    print(f"{'candidates':>10} {'rebuilt ms':>11} {'reused ms':>10} {'speedup':>8}")
+    try:
+        for n in sizes:
+            results = synthetic_results(n, seed=n)
+            query = random.Random(n).choice(CORPUS_QUERIES)
+
+            def rebuilt():
+                pms.cascade_shortlist(query, results)
+                return [pms.select_best_product(query, results, w, c, t, include_candidates=False, general=False)
+                        for w, c, t in profiles]
+
+            def reused():
+                block = pms.FeatureBlock(query, results)
+                pms.cascade_shortlist(query, results, block=block)
+                return [pms.select_from_block(block, w, c, t, include_candidates=False) for w, c, t in profiles]
+
+            a, b = rebuilt(), reused()  # also warms the embedding cache
+            ok &= all(x["selected"] is y["selected"] and x["score"] == y["score"] and x["reason"] == y["reason"]
+                      for x, y in zip(a, b))
+            slow, fast = time_it(rebuilt, repeat), time_it(reused, repeat)
+            print(f"{n:>10} {slow:>11.2f} {fast:>10.2f} {slow / fast:>7.1f}x")
+    finally:
+        pms.logger.setLevel(level)
+    print("✅ identical selections" if ok else "❌ reused block changed a selection")
+    return 0 if ok else 1
+
+
+def bench_multi(requests: int, candidates: int, duplicates: float, concurrency: int, repeat: int) -> int:
+    """/match-multiple-products: sequential loop vs dedup + union embedding + concurrency.
+
+    A batch of ``requests`` match requests over overlapping candidate pools,
+    a ``duplicates`` share of them repeated verbatim, is run through the old
+    per-request loop and through the endpoint (cold embedding cache each
+    time). Selections must match, in input order. The batch is then run
+    against a one-worker pool with no queue: the items it rejects must come
+    back as 503 entries next to the others' results.
+    """
+    pms.load_embedding_model()
+    saved, level = pms.MATCH_BATCH_CONCURRENCY, pms.logger.level
+    pms.logger.setLevel("CRITICAL")
+    rng = random.Random(3)
+    pool = synthetic_results(candidates * 3)
+    distinct = max(1, int(round(requests * (1 - duplicates))))
+    base = [pms.ProductMatchRequest(query=rng.choice(CORPUS_QUERIES), hasdata_results=rng.sample(pool, candidates))
+            for _ in range(distinct)]
+    batch = base + [rng.choice(base) for _ in range(requests - distinct)]
+    rng.shuffle(batch)
+
+    async def sequential():
+        return [await pms.score_match_request(r) for r in batch]
+
+    async def timed(make) -> tuple:
+        samples, out, encodes = [], None, 0
+        for _ in range(repeat):
+            pms._EMBED_CACHE.clear()
+            batches = pms._EMBED_BATCHER.batches if pms._EMBED_BATCHER is not None else 0
+            t0 = time.perf_counter()
+            out = await make()
+            samples.append((time.perf_counter() - t0) * 1000)
+            encodes = (pms._EMBED_BATCHER.batches if pms._EMBED_BATCHER is not None else 0) - batches
+        return statistics.median(samples), out, encodes
+
+    async def run():
+        pms.MATCH_BATCH_CONCURRENCY = concurrency
+        seq = await timed(sequential)
+        multi = await timed(lambda: pms.match_multiple_products(batch))
+        pms._MATCH_POOL = pms.MatchExecutor("thread", 1, 0)
+        try:
+            saturated = await pms.match_multiple_products(batch)
+        finally:
+            pms._MATCH_POOL.shutdown()
+        return seq, multi, saturated
+
+    saved_pool = pms._MATCH_POOL
+    try:
+        (seq_ms, seq_out, seq_encodes), (multi_ms, multi_out, multi_encodes), saturated = asyncio.run(run())
+    finally:
+        pms.MATCH_BATCH_CONCURRENCY, pms._MATCH_POOL = saved, saved_pool
+        pms.logger.setLevel(level)
+
+    ok = all(a.selected_product == b.selected_product and a.score == b.score
+             for a, b in zip(seq_out, multi_out["results"])) and len(multi_out["results"]) == len(batch)
+    print(f"{len(batch)} requests ({multi_out['unique_requests']} unique), {candidates} candidates each, "
+          f"concurrency {concurrency}, embeddings: {'on' if pms.embeddings_ready() else 'off'}")
+    print(f"{'path':>12} {'median ms':>10} {'encode batches':>15}")
+    print(f"{'sequential':>12} {seq_ms:>10.1f} {seq_encodes:>15}")
+    print(f"{'batched':>12} {multi_ms:>10.1f} {multi_encodes:>15}")
+    slowest = max(multi_out["timings"], key=lambda t: t["queue_ms"] + t["processing_time_ms"])
+    print(f"slowest item: queued {slowest['queue_ms']:.1f} ms, processed {slowest['processing_time_ms']:.1f} ms")
+    print("✅ identical selections in input order" if ok else "❌ batched selections differ")
+    rejected = sum(isinstance(r, dict) and r.get("status_code") == 503 for r in saturated["results"])
+    served = sum(not isinstance(r, dict) for r in saturated["results"])
+    print(f"saturated pool (1 worker, no queue): {served} served, {rejected} rejected with 503")
+    if len(saturated["results"]) != len(batch) or served + rejected != len(batch) or (concurrency > 1 and not rejected):
+        print("❌ a saturated pool should reject single items, not the batch")
+        ok = False
+    return 0 if ok else 1
+
+
+def bench_respcache(sizes: List[int], repeat: int) -> int:
+    """Whole-response cache on /match-products and /match-products-for-stores.
+
+    For each candidate count, times a miss (full matching) and the median
+    hit, both calling the handler directly and over HTTP with the test
+    client, which includes request parsing. Checks the X-Cache headers, that
+    a hit returns the miss's exact body, that a query differing only in
+    case and spacing hits, that another store list or tie_delta misses, that
+    queries normalize_text conflates ("1/2" vs "1 2") get different keys,
+    and that the SQLite tier stays within its bounds.
+    """
+    from fastapi.testclient import TestClient
+
+    pms.load_embedding_model()
+    saved, level, key = pms._RESPONSE_CACHE, pms.logger.level, os.environ.pop("OPENAI_API_KEY", None)
+    pms._RESPONSE_CACHE = ResponseCache(max_entries=256, ttl_s=300, negative_ttl_s=0)
+    pms.logger.setLevel("CRITICAL")
+    client = TestClient(pms.app)
+    ok = True
+
+    def median_us(fn) -> float:
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1e6)
+        return statistics.median(samples)
+
+    async def handler_hit_us(handler, request) -> float:
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            await handler(request)
+            samples.append((time.perf_counter() - t0) * 1e6)
+        return statistics.median(samples)
+
+    print(f"{'endpoint':>26} {'candidates':>10} {'miss ms':>8} {'hit us':>8} {'http hit us':>12} {'key us':>7}")
+    try:
+        for n in sizes:
+            results = synthetic_results(n, seed=n)
+            stores = sorted({r["source"] for r in results})
+            cases = [
+                ("/match-products", pms.match_products,
+                 lambda q: pms.ProductMatchRequest(query=q, hasdata_results=results),
+                 lambda q: {"query": q, "hasdata_results": results},
+                 {"query": "great value whole milk 1 gallon", "hasdata_results": results, "tie_delta": 0.2}),
+                ("/match-products-for-stores", pms.match_products_for_stores,
+                 lambda q: {"query": q, "hasdata_results": results, "nearby_stores": stores},
+                 lambda q: {"query": q, "hasdata_results": results, "nearby_stores": stores},
+                 {"query": "great value whole milk 1 gallon", "hasdata_results": results,
+                  "nearby_stores": stores[::-1]}),
+            ]
+            for path, handler, make, body, other in cases:
+                pms._RESPONSE_CACHE.clear()
+                query = "great value whole milk 1 gallon"
+                t0 = time.perf_counter()
+                miss = asyncio.run(handler(make(query)))
+                miss_ms = (time.perf_counter() - t0) * 1000
+                hit = asyncio.run(handler(make(query)))
+                ok &= miss.headers["X-Cache"] == "MISS" and hit.headers["X-Cache"] == "HIT" and hit.body == miss.body
+                ok &= client.post(path, json=body("  Great Value   WHOLE milk 1 gallon ")).headers["X-Cache"] == "HIT"
+                ok &= client.post(path, json=other).headers["X-Cache"] == "MISS"
+                hit_us = asyncio.run(handler_hit_us(handler, make(query)))
+                http_us = median_us(lambda: client.post(path, json=body(query)))
+                key_us = median_us(lambda: pms.response_cache_key(path, query, results))
+                print(f"{path:>26} {n:>10} {miss_ms:>8.1f} {hit_us:>8.0f} {http_us:>12.0f} {key_us:>7.0f}")
+    finally:
+        pms._RESPONSE_CACHE = saved
+        pms.logger.setLevel(level)
+        if key is not None:
+            os.environ["OPENAI_API_KEY"] = key
+
+    for a, b in [("1/2 gallon milk", "1 2 gallon milk"), ("M&M", "M M"), ("2% milk", "2 milk")]:
+        if pms.response_cache_key("/match-products", a, []) == pms.response_cache_key("/match-products", b, []):
+            print(f"  ❌ {a!r} and {b!r} share a cache key")
+            ok = False
+
+    with tempfile.TemporaryDirectory() as tmp:
+        disk = ResponseCache(max_entries=0, ttl_s=300, negative_ttl_s=0, db_path=os.path.join(tmp, "responses.sqlite"),
+                             db_max_entries=50, db_max_bytes=64 * 1024)
+        body = json.dumps(synthetic_results(10))
+        t0 = time.perf_counter()
+        for i in range(500):
+            disk.put(f"k{i}", body)
+        put_us = (time.perf_counter() - t0) * 1e6 / 500
+        count = "SELECT COUNT(*), SUM(size) FROM responses"
+        rows, size = disk._conn().execute(count).fetchone()
+        disk.prune()
+        pruned_rows, pruned_size = disk._conn().execute(count).fetchone()
+        print(f"sqlite tier: 500 puts of {len(body)} bytes -> {rows} rows, {size / 1024:.1f} KiB after "
+              f"{disk.prunes - 1} prunes, {pruned_rows} rows, {pruned_size / 1024:.1f} KiB after prune() "
+              f"(bounds 50 rows, 64 KiB), {put_us:.0f} us/put")
+        ok &= rows <= 50 + _DB_PRUNE_EVERY and pruned_rows <= 50 and pruned_size <= 64 * 1024
+        ok &= disk.get("k499") == body
+    print("✅ headers and cached bodies consistent" if ok else "❌ response cache misbehaved")
+    return 0 if ok else 1
+
+
+UNSEEN_BRANDS = ["Chobani", "Oatly", "Tillamook", "Dave's Killer", "Silk", "Seventh Generation"]
+
+
+def replay_corpus(n: int, seed: int = 5) -> List[tuple]:
+    """(query, truth) pairs in the shapes users type; truth is None for unseen brands."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        brand, item, size = rng.choice(BRANDS), rng.choice(ITEMS), rng.choice([s for s in SIZES if s])
+        shape = rng.random()
+        if shape < 0.4:
+            parts = (brand, item, size)
+        elif shape < 0.6:
+            parts = (None, item, size)
+        elif shape < 0.8:
+            parts = (None, item, None)
+        elif shape < 0.9:
+            parts = (brand, item, None)
+        else:
+            parts = (rng.choice(UNSEEN_BRANDS), item, None)
+        query = " ".join(x for x in parts if x)
+        corpus.append((query, None if parts[0] in UNSEEN_BRANDS else parts))
+    return corpus
+
+
+def bench_local(n: int, queries_path: Optional[str], dump: Optional[str], min_confidence: float) -> None:
+    """Replay queries through the local extractor and count LLM calls avoided.
+
+    The lexicon is mined from synthetic results, test.json and ``--dump``.
+    On the synthetic corpus the confident extractions are checked against
+    the brand, item and size each query was built from; ``--queries`` (one
+    query per line, or JSONL with a "query" key) replays real traffic.
+    """
+    titles = [r["title"] for r in synthetic_results(2000)]
+    for path in (SAMPLE_RESULTS, dump):
+        if path and os.path.exists(path):
+            titles += brand_lexicon.read_titles(path)
+    mined = brand_lexicon.mine_lexicon(titles)
+    path = os.path.join(tempfile.mkdtemp(), "lexicon.json")
+    brand_lexicon.save_lexicon(mined, path)
+    extractor = pms.build_local_extractor(path)
+    print(f"lexicon: {len(mined.brands)} mined brands, {len(mined.items)} mined item words from {len(titles)} titles")
+
+    if queries_path:
+        with open(queries_path, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        corpus = []
+        for line in lines:
+            try:
+                doc = json.loads(line)
+                query = doc.get("query") if isinstance(doc, dict) else None
+            except ValueError:
+                query = line
+            if query:
+                corpus.append((query, None))
+        checked = False
+    else:
+        corpus = replay_corpus(n)
+        checked = True
+
+    def norm(x):
+        return " ".join(k for k, _, _ in brand_lexicon.lexicon_tokens(x or "")) or None
+
+    local = correct = 0
+    t0 = time.perf_counter()
+    results = [(q, truth, extractor.extract(q)) for q, truth in corpus]
+    per_query_us = (time.perf_counter() - t0) * 1e6 / max(1, len(corpus))
+    for query, truth, res in results:
+        if res.confidence < min_confidence:
+            continue
+        local += 1
+        if truth is not None:
+            brand, item, size = truth
+            c = res.components
+            correct += (norm(c["brand"]) == norm(brand) and norm(c["item"]) == norm(item)
+                        and pms.parse_quantity(c["quantity"]) == pms.parse_quantity(size))
+
+    print(f"queries: {len(corpus)}  threshold: {min_confidence}  extraction: {per_query_us:.1f} µs/query")
+    print(f"LLM calls avoided: {local}/{len(corpus)} ({local / max(1, len(corpus)):.1%})")
+    if checked:
+        print(f"confident extractions matching the source components: {correct}/{local}")
+        deferred = [q for q, _, r in results if r.confidence < min_confidence][:5]
+        print(f"sample deferred to the LLM: {deferred}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Product Matcher micro-benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p_embed = sub.add_parser("embed", help="Per-pair vs batched SBERT encoding")
+    p_embed.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200])
+    p_embed.add_argument("--repeat", type=int, default=5)
+
+    p_backends = sub.add_parser("backends", help="Accuracy vs latency of embedding backends")
+    p_backends.add_argument("--backends", nargs="+", default=list(embedding_backends.BACKENDS))
+    p_backends.add_argument("--candidates", type=int, default=60)
+    p_backends.add_argument("--repeat", type=int, default=5)
+
+    p_cascade = sub.add_parser("cascade", help="Cascaded vs full scoring on a regression corpus")
+    p_cascade.add_argument("--top-k", type=int, default=pms.CASCADE_TOP_K or 16)
+    p_cascade.add_argument("--candidates", type=int, default=80)
+    p_cascade.add_argument("--seeds", type=int, default=5)
+
+    p_fuzzy = sub.add_parser("fuzzy", help="Per-pair RapidFuzz vs process.cdist")
+    p_fuzzy.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000])
+    p_fuzzy.add_argument("--repeat", type=int, default=5)
+    p_fuzzy.add_argument("--cutoff", type=float, default=0.5)
+
+    p_units = sub.add_parser("units", help="Unit engine conformance at corpus scale, and its speed")
+    p_units.add_argument("--titles", type=int, default=5000, help="Generated titles with known sizes")
+    p_units.add_argument("--dump", help="JSONL dump of HasData results with more real titles (invariants)")
+    p_units.add_argument("--golden", nargs="+", default=[UNIT_CONFORMANCE],
+                         help="JSONL files of {title, dimension, amount} expectations")
+    p_units.add_argument("--record", help="Write the dump titles' current parses here in the golden format")
+    p_units.add_argument("--repeat", type=int, default=5)
+
+    p_llm = sub.add_parser("llm", help="Async OpenAI client against a local stub server")
+    p_llm.add_argument("--concurrency", type=int, default=50)
+    p_llm.add_argument("--latency-ms", type=float, default=300.0)
+
+    p_flight = sub.add_parser("singleflight", help="Coalescing of identical concurrent LLM extractions")
+    p_flight.add_argument("--callers", type=int, default=100)
+    p_flight.add_argument("--latency-ms", type=float, default=200.0)
+
+    p_spec = sub.add_parser("speculative", help="Classic scoring overlapped with the LLM call on the stores endpoint")
+    p_spec.add_argument("--latency-ms", type=float, default=400.0)
+    p_spec.add_argument("--candidates", type=int, default=600)
+    p_spec.add_argument("--budget-ms", type=float, default=250.0)
+    p_spec.add_argument("--repeat", type=int, default=5)
+
+    p_breaker = sub.add_parser("breaker", help="Circuit breaker and adaptive timeout through an OpenAI hang")
+    p_breaker.add_argument("--latency-ms", type=float, default=80.0)
+    p_breaker.add_argument("--slow-ms", type=float, default=1500.0)
+    p_breaker.add_argument("--hang-ms", type=float, default=15000.0)
+    p_breaker.add_argument("--reset-s", type=float, default=2.0)
+    p_breaker.add_argument("--max-s", type=float, default=4.0, help="Client read timeout (adaptive ceiling)")
+
+    p_batch = sub.add_parser("batch", help="Batched vs per-query LLM extraction for a shopping list")
+    p_batch.add_argument("--queries", type=int, default=50)
+    p_batch.add_argument("--batch-size", type=int, default=pms.EXTRACT_BATCH_SIZE)
+    p_batch.add_argument("--latency-ms", type=float, default=300.0)
+
+    p_resp = sub.add_parser("respcache", help="Whole-response cache: miss vs hit latency and X-Cache headers")
+    p_resp.add_argument("--sizes", type=int, nargs="+", default=[50, 200])
+    p_resp.add_argument("--repeat", type=int, default=50)
+
+    p_multi = sub.add_parser("multi", help="Sequential vs deduplicated, concurrent /match-multiple-products")
+    p_multi.add_argument("--requests", type=int, default=40)
+    p_multi.add_argument("--candidates", type=int, default=60)
+    p_multi.add_argument("--duplicates", type=float, default=0.25, help="Share of requests repeated verbatim")
+    p_multi.add_argument("--concurrency", type=int, default=pms.MATCH_BATCH_CONCURRENCY)
+    p_multi.add_argument("--repeat", type=int, default=3)
+
+    p_rescore = sub.add_parser("rescore", help="Feature block rebuilt per weight profile vs built once")
+    p_rescore.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000])
+    p_rescore.add_argument("--repeat", type=int, default=7)
+
+    p_stores = sub.add_parser("stores", help="Serial vs fanned-out per-store matching on the stores endpoint")
+    p_stores.add_argument("--stores", type=int, nargs="+", default=[5, 20, 50])
+    p_stores.add_argument("--per-store", type=int, default=40)
+    p_stores.add_argument("--workers", type=int, default=max(2, pms._MATCH_POOL.workers))
+    p_stores.add_argument("--repeat", type=int, default=3)
+    p_stores.add_argument("--process", action="store_true", help="Also time a spawned process pool")
+
+    p_pool = sub.add_parser("pool", help="Event-loop lag and 503 admission control of the match executor")
+    p_pool.add_argument("--requests", type=int, default=32)
+    p_pool.add_argument("--candidates", type=int, default=300)
+    p_pool.add_argument("--workers", type=int, default=pms._MATCH_POOL.workers)
+    p_pool.add_argument("--max-queue", type=int, default=4)
+    p_pool.add_argument("--process", action="store_true", help="Also time a spawned process pool")
+
+    p_local = sub.add_parser("local", help="LLM extractions avoided by the local rule-based extractor")
+    p_local.add_argument("--queries", help="Replay corpus: one query per line, or JSONL with a \"query\" key")
+    p_local.add_argument("--dump", help="JSONL dump of HasData results to mine the lexicon from")
+    p_local.add_argument("--n", type=int, default=2000, help="Synthetic replay queries when --queries is not given")
+    p_local.add_argument("--min-confidence", type=float, default=pms.LOCAL_EXTRACT_MIN_CONFIDENCE)
+
+    args = parser.parse_args()
+    if args.bench == "embed":
+        bench_embed(args.sizes, args.repeat)
+    elif args.bench == "backends":
+        bench_backends(args.backends, args.candidates, args.repeat)
+    elif args.bench == "cascade":
+        bench_cascade(args.top_k, args.candidates, args.seeds)
+    elif args.bench == "fuzzy":
+        bench_fuzzy(args.sizes, args.repeat, args.cutoff)
+    elif args.bench == "units":
+        return bench_units(args.titles, args.repeat, args.dump, args.golden, args.record)
+    elif args.bench == "llm":
+        bench_llm(args.concurrency, args.latency_ms)
+    elif args.bench == "singleflight":
+        return bench_singleflight(args.callers, args.latency_ms)
+    elif args.bench == "speculative":
+        bench_speculative(args.latency_ms, args.candidates, args.budget_ms, args.repeat)
+    elif args.bench == "breaker":
+        return bench_breaker(args.latency_ms, args.slow_ms, args.hang_ms, args.reset_s, args.max_s)
+    elif args.bench == "batch":
+        return bench_batch(args.queries, args.batch_size, args.latency_ms)
+    elif args.bench == "respcache":
+        return bench_respcache(args.sizes, args.repeat)
+    elif args.bench == "multi":
+        return bench_multi(args.requests, args.candidates, args.duplicates, args.concurrency, args.repeat)
+    elif args.bench == "rescore":
+        return bench_rescore(args.sizes, args.repeat)
+    elif args.bench == "stores":
+        return bench_stores(args.stores, args.per_store, args.workers, args.repeat, args.process)
+    elif args.bench == "pool":
+        return bench_pool(args.requests, args.candidates, args.workers, args.max_queue, args.process)
+    elif args.bench == "local":
+        bench_local(args.n, args.queries, args.dump, args.min_confidence)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Brand and item lexicon mined from HasData product titles.
+
+Titles usually lead with the brand ("Great Value Whole Milk 1 gal"), so a
+brand is a short title prefix that recurs across several different products.
+The words that follow a brand make up the item vocabulary. The local query
+extractor in product_matcher_service.py uses both to recognise brand and
+item in queries without an LLM call.
+
+Lexicon file (JSON):
+    {"titles": 1200, "brands": {"great value": 57, ...}, "items": {"milk": 88, ...}}
+
+Keys are lexicon tokens: lowercase, apostrophes dropped ("kellogg's" ->
+"kelloggs"), joined by single spaces.
+
+CLI:
+    python brand_lexicon.py mine --input hasdata_dump.jsonl --out brand_lexicon.json
+    python brand_lexicon.py show --lexicon brand_lexicon.json [--top 30]
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from embedding_store import iter_dump_titles
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "brand_lexicon.json")
+
+_TOKEN_RE = re.compile(r"[a-z0-9&%]+(?:['’.\-][a-z0-9&]+)*")
+
+
+def lexicon_tokens(text: str) -> List[Tuple[str, int, int]]:
+    """(key, start, end) for every word of ``text``; spans index the lowercased text."""
+    return [
+        (m.group(0).replace("'", "").replace("’", ""), m.start(), m.end())
+        for m in _TOKEN_RE.finditer(text.lower())
+    ]
+
+
+def _has_digit(key: str) -> bool:
+    return any(c.isdigit() for c in key)
+
+
+class BrandLexicon:
+    """Known brands (multi-word phrases) and item words, with their title counts."""
+
+    def __init__(self, brands: Optional[Dict[str, int]] = None, items: Optional[Dict[str, int]] = None,
+                 titles: int = 0):
+        self.brands: Dict[str, int] = dict(brands or {})
+        self.items: Dict[str, int] = dict(items or {})
+        self.titles = titles
+        self._reindex()
+
+    def _reindex(self) -> None:
+        # first word -> candidate phrases (as word tuples), longest first
+        index: Dict[str, List[Tuple[str, ...]]] = defaultdict(list)
+        for brand in self.brands:
+            words = tuple(brand.split())
+            if words:
+                index[words[0]].append(words)
+        for phrases in index.values():
+            phrases.sort(key=len, reverse=True)
+        self._by_first = dict(index)
+
+    def add_brands(self, brands: Iterable[str]) -> None:
+        for brand in brands:
+            key = " ".join(k for k, _, _ in lexicon_tokens(brand))
+            if key:
+                self.brands.setdefault(key, 0)
+        self._reindex()
+
+    def add_items(self, words: Iterable[str]) -> None:
+        for word in words:
+            for key, _, _ in lexicon_tokens(word):
+                self.items.setdefault(key, 0)
+
+    def find_brand(self, keys: List[str]) -> Optional[Tuple[int, int]]:
+        """Token range [start, end) of the leftmost, then longest, brand in ``keys``."""
+        for i, key in enumerate(keys):
+            for words in self._by_first.get(key, ()):
+                if tuple(keys[i:i + len(words)]) == words:
+                    return i, i + len(words)
+        return None
+
+    def is_item_word(self, key: str) -> bool:
+        """Whether ``key`` (or its singular/plural) is a known item word."""
+        items = self.items
+        return key in items or (key.endswith("s") and key[:-1] in items) or (key + "s") in items
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"titles": self.titles, "brands": self.brands, "items": self.items}
+
+    def stats(self) -> Dict[str, int]:
+        return {"brands": len(self.brands), "items": len(self.items), "titles": self.titles}
+
+
+def mine_lexicon(titles: Iterable[str], min_count: int = 3, min_continuations: int = 2,
+                 max_brand_words: int = 3, stopwords: Iterable[str] = ()) -> BrandLexicon:
+    """Mine brands and item words from product titles.
+
+    A title prefix of up to ``max_brand_words`` words is a brand when it
+    starts at least ``min_count`` titles, is followed by at least
+    ``min_continuations`` different words, and is not made only of
+    ``stopwords`` (generic words such as "organic" or "fresh"). A prefix
+    replaces a shorter one it extends only when it accounts for 80% of its
+    titles ("great" -> "great value"). Item words are the non-numeric words
+    after the brand that occur in at least ``min_count`` titles.
+    """
+    stop = {k for w in stopwords for k, _, _ in lexicon_tokens(w)}
+    tokenized = []
+    prefix_counts: Counter = Counter()
+    continuations: Dict[str, set] = defaultdict(set)
+    for title in titles:
+        keys = [k for k, _, _ in lexicon_tokens(title)]
+        if len(keys) < 2:
+            continue
+        tokenized.append(keys)
+        for n in range(1, min(max_brand_words, len(keys) - 1) + 1):
+            if _has_digit(keys[n - 1]):
+                break
+            prefix = " ".join(keys[:n])
+            prefix_counts[prefix] += 1
+            continuations[prefix].add(keys[n])
+
+    candidates = {
+        p: c for p, c in prefix_counts.items()
+        if c >= min_count and len(continuations[p]) >= min_continuations
+        and not all(w in stop for w in p.split())
+    }
+
+    def dominates(longer: str, shorter: str) -> bool:
+        return longer.startswith(shorter + " ") and candidates[longer] >= 0.8 * candidates[shorter]
+
+    # keep a prefix only if it replaces every shorter candidate it extends
+    # (product lines like "kelloggs frosted" stay under "kelloggs") and no
+    # extension replaces it
+    brands = {
+        p: c for p, c in candidates.items()
+        if all(dominates(p, r) for r in candidates if p.startswith(r + " "))
+        and not any(dominates(q, p) for q in candidates)
+    }
+
+    lexicon = BrandLexicon(brands, titles=len(tokenized))
+    item_counts: Counter = Counter()
+    for keys in tokenized:
+        found = lexicon.find_brand(keys[:max_brand_words])
+        start = found[1] if found is not None and found[0] == 0 else 0
+        item_counts.update({k for k in keys[start:] if not _has_digit(k) and len(k) > 1})
+    lexicon.items = {w: c for w, c in item_counts.items() if c >= min_count and w not in brands}
+    return lexicon
+
+
+def load_lexicon(path: Optional[str]) -> BrandLexicon:
+    """Load a mined lexicon; a missing or unreadable file gives an empty one."""
+    if not path or not os.path.exists(path):
+        return BrandLexicon()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read brand lexicon {path}: {e}")
+        return BrandLexicon()
+    return BrandLexicon(doc.get("brands"), doc.get("items"), int(doc.get("titles") or 0))
+
+
+def save_lexicon(lexicon: BrandLexicon, path: str) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(lexicon.to_dict(), f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def read_titles(path: str) -> List[str]:
+    """Titles from a JSONL dump of HasData results, or from a single JSON document."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        json.loads(text)
+        lines = [text]
+    except ValueError:
+        lines = text.splitlines()
+    return list(iter_dump_titles(lines))
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Brand/item lexicon for local query extraction")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_mine = sub.add_parser("mine", help="Mine a lexicon from HasData results")
+    p_mine.add_argument("--input", nargs="+", required=True, help="JSONL dumps or JSON files of HasData results")
+    p_mine.add_argument("--out", default=DEFAULT_LEXICON_PATH)
+    p_mine.add_argument("--min-count", type=int, default=3)
+    p_mine.add_argument("--min-continuations", type=int, default=2)
+
+    p_show = sub.add_parser("show", help="Print the most frequent brands and item words")
+    p_show.add_argument("--lexicon", default=DEFAULT_LEXICON_PATH)
+    p_show.add_argument("--top", type=int, default=30)
+
+    args = parser.parse_args()
+    if args.cmd == "mine":
+        titles = [t for path in args.input for t in read_titles(path)]
+        lexicon = mine_lexicon(titles, args.min_count, args.min_continuations)
+        save_lexicon(lexicon, args.out)
+        print(f"📚 {len(lexicon.brands)} brands and {len(lexicon.items)} item words "
+              f"from {lexicon.titles} titles -> {args.out}")
+    elif args.cmd == "show":
+        lexicon = load_lexicon(args.lexicon)
+        print(f"📚 {args.lexicon}: {lexicon.stats()}")
+        for name, table in (("brands", lexicon.brands), ("items", lexicon.items)):
+            top = sorted(table.items(), key=lambda kv: (-kv[1], kv[0]))[:args.top]
+            print(f"{name}: " + ", ".join(f"{k} ({c})" for k, c in top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
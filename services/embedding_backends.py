@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Pluggable CPU inference backends for title embeddings.
+
+Backends (selected with EMBED_BACKEND):
+    torch      - SentenceTransformer on PyTorch (default, the original path)
+    onnx       - ONNX Runtime export of the same transformer
+    onnx-int8  - the ONNX export with dynamically int8-quantized weights
+
+Every backend exposes ``encode(texts) -> np.ndarray`` and
+``get_sentence_embedding_dimension()``, matching the SentenceTransformer API
+the matcher already uses. The ONNX backends reproduce the model's pooling
+(attention-masked mean) and L2 normalisation in NumPy.
+
+Export the ONNX models offline once (requires torch, transformers, onnx and
+onnxruntime):
+    python embedding_backends.py export --out ./onnx_model
+"""
+
+import argparse
+import importlib.util
+import inspect
+import logging
+import os
+import sys
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_model")
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model-int8.onnx"
+MAX_SEQ_LENGTH = 256
+
+
+def backend_available(backend: str) -> bool:
+    """Whether the libraries a backend needs are importable (without importing them)."""
+    if backend == "torch":
+        return importlib.util.find_spec("sentence_transformers") is not None
+    if backend in ("onnx", "onnx-int8"):
+        return all(importlib.util.find_spec(m) is not None for m in ("onnxruntime", "transformers"))
+    return False
+
+
+def model_id(model_name: str, backend: str) -> str:
+    """Identifier for vectors produced by a backend (used to key persistent stores)."""
+    return model_name if backend == "torch" else f"{model_name}:{backend}"
+
+
+class OnnxEmbeddingBackend:
+    """Sentence embeddings from an exported transformer run with ONNX Runtime."""
+
+    def __init__(self, model_dir: str, quantized: bool = False, batch_size: int = 32):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; run `python embedding_backends.py export --out {model_dir}`")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self._dim = int(self.session.get_outputs()[0].shape[-1])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dim
+
+    def encode(self, texts: List[str], **_: object) -> np.ndarray:
+        out = []
+        for i in range(0, len(texts), self.batch_size):
+            enc = self.tokenizer(list(texts[i:i + self.batch_size]), padding=True, truncation=True,
+                                 max_length=MAX_SEQ_LENGTH, return_tensors="np")
+            feed = {k: v.astype(np.int64) for k, v in enc.items() if k in self._input_names}
+            hidden = self.session.run(None, feed)[0]
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            out.append(pooled / np.clip(norms, 1e-12, None))
+        if not out:
+            return np.empty((0, self._dim), dtype=np.float32)
+        return np.vstack(out).astype(np.float32)
+
+
+def create_backend(backend: str, model_name: str, onnx_dir: str = DEFAULT_ONNX_DIR):
+    """Construct the named embedding backend."""
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend == "onnx":
+        return OnnxEmbeddingBackend(onnx_dir)
+    if backend == "onnx-int8":
+        return OnnxEmbeddingBackend(onnx_dir, quantized=True)
+    raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {BACKENDS}")
+
+
+def export_onnx(model_name: str, out_dir: str, quantize: bool = True, opset: int = 14) -> None:
+    """Export the SentenceTransformer's transformer to ONNX, plus an int8 variant."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(out_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer(["great value whole milk 1 gallon"], return_tensors="pt")
+    input_names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in sample]
+    dynamic = {k: {0: "batch", 1: "sequence"} for k in input_names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    class _Wrapper(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return self.model(**dict(zip(input_names, args))).last_hidden_state
+
+    onnx_path = os.path.join(out_dir, ONNX_FILE)
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # newer torch defaults to the dynamo exporter; keep the TorchScript one
+        export_kwargs["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            _Wrapper(transformer),
+            tuple(sample[k] for k in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=opset,
+            **export_kwargs,
+        )
+    print(f"✅ Exported {onnx_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(out_dir, ONNX_INT8_FILE)
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"✅ Quantized {int8_path}")
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Embedding backend tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_export = sub.add_parser("export", help="Export the model to ONNX (and a dynamically quantized int8 copy)")
+    p_export.add_argument("--model", default="all-MiniLM-L6-v2")
+    p_export.add_argument("--out", default=DEFAULT_ONNX_DIR)
+    p_export.add_argument("--no-quantize", action="store_true")
+    p_export.add_argument("--opset", type=int, default=14)
+
+    args = parser.parse_args()
+    if args.cmd == "export":
+        export_onnx(args.model, args.out, quantize=not args.no_quantize, opset=args.opset)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Persistent, memory-mapped store of title embeddings.
+
+Layout of a store directory:
+    meta.json     - {"dim": 384, "dtype": "float16", "model": "all-MiniLM-L6-v2"}
+    vectors.bin   - append-only row-major matrix of ``dim`` values per row
+    index.bin     - append-only (uint64 key hash, uint64 row) records
+
+Vectors are appended before their index record, so any row referenced by the
+index is complete. Readers mmap both files read-only and share the pages with
+every other process on the host; appends from several uvicorn workers are
+serialised with an advisory file lock. Stale or duplicate rows are dropped by
+``compact``.
+
+CLI:
+    python embedding_store.py build --store ./embed_store --input hasdata_dump.jsonl
+    python embedding_store.py compact --store ./embed_store [--dtype float16]
+    python embedding_store.py stats --store ./embed_store
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sys
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.bin"
+INDEX_FILE = "index.bin"
+LOCK_FILE = ".lock"
+
+_INDEX_DTYPE = np.dtype([("key", "<u8"), ("row", "<u8")])
+SUPPORTED_DTYPES = ("float16", "float32")
+
+
+def key_hash(key: str) -> int:
+    """Stable 64-bit hash of a (normalized) title."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class EmbeddingStore:
+    """Append-only on-disk embedding matrix with a hash -> row index."""
+
+    def __init__(self, path: str, dim: int, model_name: str, dtype: str = "float16", writable: bool = True):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported dtype {dtype!r}; expected one of {SUPPORTED_DTYPES}")
+        self.path = path
+        self.writable = writable
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("dim") != dim or meta.get("model") != model_name:
+                raise ValueError(
+                    f"Embedding store at {path} was built for {meta.get('model')} (dim={meta.get('dim')}), "
+                    f"not {model_name} (dim={dim})"
+                )
+            dtype = meta.get("dtype", dtype)
+        else:
+            _write_meta(path, {"dim": dim, "dtype": dtype, "model": model_name})
+            for name in (VECTORS_FILE, INDEX_FILE):
+                open(os.path.join(path, name), "ab").close()
+
+        self.dim = dim
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self._row_bytes = self.dim * self.dtype.itemsize
+        self._index: Dict[int, int] = {}
+        self._index_bytes_read = 0
+        self._vectors_inode: Optional[int] = None
+        self._mm: Optional[mmap.mmap] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._refresh()
+
+    # -- reading --
+
+    def _refresh(self) -> None:
+        """Pick up rows appended by other processes, or reopen after a compaction."""
+        vec_path = os.path.join(self.path, VECTORS_FILE)
+        idx_path = os.path.join(self.path, INDEX_FILE)
+        st = os.stat(vec_path)
+        if st.st_ino != self._vectors_inode:
+            # compaction swapped the files (and may have changed the row dtype): start over
+            self._load_meta()
+            self._close_map()
+            self._index.clear()
+            self._index_bytes_read = 0
+            self._vectors_inode = st.st_ino
+
+        idx_size = os.path.getsize(idx_path)
+        usable = idx_size - (idx_size % _INDEX_DTYPE.itemsize)
+        if usable > self._index_bytes_read:
+            with open(idx_path, "rb") as f:
+                f.seek(self._index_bytes_read)
+                records = np.frombuffer(f.read(usable - self._index_bytes_read), dtype=_INDEX_DTYPE)
+            self._index.update(zip(records["key"].tolist(), records["row"].tolist()))
+            self._index_bytes_read = usable
+
+        rows = st.st_size // self._row_bytes
+        if self._matrix is None or self._matrix.shape[0] != rows:
+            self._close_map()
+            if rows:
+                with open(vec_path, "rb") as f:
+                    self._mm = mmap.mmap(f.fileno(), rows * self._row_bytes, access=mmap.ACCESS_READ)
+                self._matrix = np.frombuffer(self._mm, dtype=self.dtype).reshape(rows, self.dim)
+            else:
+                self._matrix = np.empty((0, self.dim), dtype=self.dtype)
+
+    def _load_meta(self) -> None:
+        with open(os.path.join(self.path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("dim") != self.dim or meta.get("model") != self.model_name:
+            raise ValueError(f"Embedding store at {self.path} was rebuilt for {meta.get('model')} "
+                             f"(dim={meta.get('dim')}); reopen it")
+        self.dtype = np.dtype(meta.get("dtype", self.dtype.name))
+        self._row_bytes = self.dim * self.dtype.itemsize
+
+    def _close_map(self) -> None:
+        self._matrix = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # a caller still holds a view; leave the old mapping to the GC
+                pass
+            self._mm = None
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """Return a float32 vector per key, or None where the store has no row."""
+        hashes = [key_hash(k) for k in keys]
+        with self._lock:
+            if any(h not in self._index for h in hashes):
+                with _FileLock(os.path.join(self.path, LOCK_FILE), shared=True):
+                    self._refresh()
+            out: List[Optional[np.ndarray]] = []
+            for h in hashes:
+                row = self._index.get(h)
+                if row is None or row >= self._matrix.shape[0]:
+                    out.append(None)
+                else:
+                    # copy out so no caller pins a mapping that a later refresh replaces
+                    out.append(np.array(self._matrix[row], dtype=np.float32))
+            return out
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    # -- writing --
+
+    def add_many(self, keys: List[str], vectors: np.ndarray) -> int:
+        """Append vectors for keys not already present. Returns rows written."""
+        if not self.writable or not keys:
+            return 0
+        with self._lock, _FileLock(os.path.join(self.path, LOCK_FILE)):
+            # refresh first: a compaction may have changed the row dtype
+            self._refresh()
+            vectors = np.asarray(vectors, dtype=self.dtype).reshape(len(keys), self.dim)
+            fresh: Dict[int, int] = {}
+            for i, k in enumerate(keys):
+                h = key_hash(k)
+                if h not in self._index and h not in fresh:
+                    fresh[h] = i
+            if not fresh:
+                return 0
+            vec_path = os.path.join(self.path, VECTORS_FILE)
+            with open(vec_path, "r+b") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size % self._row_bytes:
+                    # drop a torn row left behind by a crashed writer
+                    size -= size % self._row_bytes
+                    f.truncate(size)
+                    f.seek(size)
+                start = size // self._row_bytes
+                f.write(vectors[list(fresh.values())].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            records = np.empty(len(fresh), dtype=_INDEX_DTYPE)
+            records["key"] = list(fresh.keys())
+            records["row"] = np.arange(start, start + len(fresh))
+            with open(os.path.join(self.path, INDEX_FILE), "ab") as f:
+                f.write(records.tobytes())
+            self._refresh()
+            return len(fresh)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = 0 if self._matrix is None else self._matrix.shape[0]
+            return {
+                "path": self.path,
+                "entries": len(self._index),
+                "rows": rows,
+                "dtype": self.dtype.name,
+                "bytes": rows * self._row_bytes,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_map()
+
+
+class _FileLock:
+    """Advisory lock shared by all processes using a store.
+
+    Writers and compaction take it exclusively; readers take it shared while
+    refreshing so they never see a half-swapped pair of files.
+    """
+
+    def __init__(self, path: str, shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self._fh = None
+
+    def __enter__(self):
+        self._fh = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        self._fh.close()
+        self._fh = None
+
+
+def _write_meta(path: str, meta: Dict[str, Any]) -> None:
+    tmp = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+
+def compact_store(path: str, dtype: Optional[str] = None) -> Dict[str, int]:
+    """Rewrite a store keeping one row per indexed key, optionally changing dtype.
+
+    The new files and meta.json are swapped in under the exclusive lock;
+    running readers and writers notice the new inode on their next refresh
+    and reload both, including a changed dtype.
+    """
+    with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    src_dtype = np.dtype(meta["dtype"])
+    dst_dtype = np.dtype(dtype or meta["dtype"])
+    dim = int(meta["dim"])
+
+    with _FileLock(os.path.join(path, LOCK_FILE)):
+        raw_idx = np.fromfile(os.path.join(path, INDEX_FILE), dtype=np.uint8)
+        raw_idx = raw_idx[: len(raw_idx) - len(raw_idx) % _INDEX_DTYPE.itemsize]
+        records = raw_idx.view(_INDEX_DTYPE)
+        matrix = np.fromfile(os.path.join(path, VECTORS_FILE), dtype=src_dtype)
+        matrix = matrix[: len(matrix) - len(matrix) % dim].reshape(-1, dim)
+
+        latest: Dict[int, int] = {}
+        for k, r in zip(records["key"].tolist(), records["row"].tolist()):
+            if r < matrix.shape[0]:
+                latest[k] = r
+        keys = np.fromiter(latest.keys(), dtype=np.uint64, count=len(latest))
+        rows = np.fromiter(latest.values(), dtype=np.int64, count=len(latest))
+
+        new_idx = np.empty(len(keys), dtype=_INDEX_DTYPE)
+        new_idx["key"] = keys
+        new_idx["row"] = np.arange(len(keys))
+        tmp_vec = os.path.join(path, VECTORS_FILE + ".tmp")
+        tmp_idx = os.path.join(path, INDEX_FILE + ".tmp")
+        matrix[rows].astype(dst_dtype).tofile(tmp_vec)
+        new_idx.tofile(tmp_idx)
+        os.replace(tmp_vec, os.path.join(path, VECTORS_FILE))
+        os.replace(tmp_idx, os.path.join(path, INDEX_FILE))
+        if dst_dtype != src_dtype:
+            _write_meta(path, {**meta, "dtype": dst_dtype.name})
+
+    return {"rows_before": int(matrix.shape[0]), "rows_after": int(len(keys))}
+
+
+def iter_dump_titles(lines: Iterable[str]) -> Iterator[str]:
+    """Yield product titles from a JSONL dump of HasData results.
+
+    Each line may be a single result ({"title": ...}), a list of results, or a
+    response/request object holding results under a known key.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            doc = json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning("Skipping malformed JSONL line")
+            continue
+        stack = [doc]
+        while stack:
+            obj = stack.pop()
+            if isinstance(obj, list):
+                stack.extend(obj)
+            elif isinstance(obj, dict):
+                if isinstance(obj.get("title"), str):
+                    yield obj["title"]
+                for k in ("hasdata_results", "shopping_results", "results", "products"):
+                    if isinstance(obj.get(k), list):
+                        stack.append(obj[k])
+
+
+def _cmd_build(args) -> int:
+    import embedding_backends
+    import product_matcher_service as pms
+
+    if not pms.load_embedding_model():
+        print("❌ sentence-transformers is not available; cannot build embeddings")
+        return 1
+    store = EmbeddingStore(args.store, dim=pms._EMBED_MODEL.get_sentence_embedding_dimension(),
+                           model_name=embedding_backends.model_id(pms.EMBED_MODEL_NAME, pms.EMBED_BACKEND),
+                           dtype=args.dtype)
+    with open(args.input, "r", encoding="utf-8") as f:
+        keys = list(dict.fromkeys(pms.normalize_text(t) for t in iter_dump_titles(f)))
+    keys = [k for k, v in zip(keys, store.get_many(keys)) if k and v is None]
+    print(f"📦 {len(keys)} new titles to embed")
+    written = 0
+    for i in range(0, len(keys), args.batch_size):
+        batch = keys[i:i + args.batch_size]
+        written += store.add_many(batch, pms._EMBED_MODEL.encode(batch))
+        print(f"   {min(i + args.batch_size, len(keys))}/{len(keys)}")
+    print(f"✅ Wrote {written} rows; store stats: {store.stats()}")
+    return 0
+
+
+def _cmd_compact(args) -> int:
+    result = compact_store(args.store, args.dtype)
+    print(f"✅ Compacted {args.store}: {result['rows_before']} -> {result['rows_after']} rows")
+    return 0
+
+
+def _cmd_stats(args) -> int:
+    with open(os.path.join(args.store, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    store = EmbeddingStore(args.store, dim=meta["dim"], model_name=meta["model"], writable=False)
+    print(json.dumps({**meta, **store.stats()}, indent=2))
+    return 0
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Manage the persistent embedding store")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="Prebuild the store from a JSONL dump of HasData results")
+    p_build.add_argument("--store", required=True)
+    p_build.add_argument("--input", required=True)
+    p_build.add_argument("--dtype", choices=SUPPORTED_DTYPES, default="float16")
+    p_build.add_argument("--batch-size", type=int, default=256)
+
+    p_compact = sub.add_parser("compact", help="Drop stale rows and optionally change dtype")
+    p_compact.add_argument("--store", required=True)
+    p_compact.add_argument("--dtype", choices=SUPPORTED_DTYPES, default=None)
+
+    p_stats = sub.add_parser("stats", help="Print store size and metadata")
+    p_stats.add_argument("--store", required=True)
+
+    args = parser.parse_args()
+    return {"build": _cmd_build, "compact": _cmd_compact, "stats": _cmd_stats}[args.cmd](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
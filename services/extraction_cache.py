@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Two-tier TTL caches for LLM brand/item/quantity extractions and whole responses.
+
+Tier 1 is an in-process LRU; tier 2 is an optional SQLite file shared by every
+worker on the host (WAL mode, so readers never wait on a writer). Entries
+expire after a TTL. Failed extractions are cached too ("negative" entries,
+stored as NULL) with a much shorter TTL, so an outage or rate limit is not
+retried by every request.
+
+Every 64th put, and the first put after 30 s without a prune, deletes the
+table's expired rows. ``db_max_entries`` and ``db_max_bytes`` also bound the
+SQLite tier: once either is exceeded at a prune, the rows closest to expiry
+are deleted until the table is back under 90% of it. Between prunes each
+worker can overshoot a bound by up to 64 rows. Without bounds (the default
+for extractions) only expiry shrinks the table.
+
+Inspect or clear the shared file offline:
+    python extraction_cache.py stats --db ./extractions.sqlite
+    python extraction_cache.py purge --db ./extractions.sqlite [--expired-only]
+    python extraction_cache.py stats --db ./responses.sqlite --table responses
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Sentinel distinguishing "not cached" from a cached failure (None)
+MISS = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    expires_at REAL NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0
+)
+"""
+_INDEX = "CREATE INDEX IF NOT EXISTS {table}_expires ON {table} (expires_at, size)"
+
+# A bounded SQLite tier is trimmed to this share of its bounds
+_DB_TRIM_TO = 0.9
+# The SQLite tier is pruned every this many puts, or on the first put this long after the last prune
+_DB_PRUNE_EVERY = 64
+_DB_PRUNE_INTERVAL_S = 30.0
+
+_TABLE_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _size(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return len(json.dumps(value))
+
+
+class TTLCache:
+    """LRU + SQLite cache mapping a key to a JSON-serializable value (or None).
+
+    ``max_bytes`` (0 = unbounded) also bounds the in-process tier by the
+    size of the values; strings count their length, anything else its JSON.
+    ``db_max_entries`` and ``db_max_bytes`` (0 = unbounded) bound the SQLite
+    tier. ``table`` defaults to the class's TABLE.
+    """
+
+    TABLE = "cache"
+
+    def __init__(self, max_entries: int = 4096, ttl_s: float = 7 * 24 * 3600,
+                 negative_ttl_s: float = 60.0, db_path: Optional[str] = None,
+                 table: Optional[str] = None, max_bytes: int = 0,
+                 db_max_entries: int = 0, db_max_bytes: int = 0):
+        table = table or self.TABLE
+        if not _TABLE_RE.match(table):
+            raise ValueError(f"Invalid cache table name {table!r}")
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self.db_max_entries = max(0, int(db_max_entries))
+        self.db_max_bytes = max(0, int(db_max_bytes))
+        self.ttl_s = float(ttl_s)
+        self.negative_ttl_s = float(negative_ttl_s)
+        self.db_path = db_path
+        self.table = table
+        self._bytes = 0
+        self._entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+        self._puts_since_prune = 0
+        self._pruned_at = 0.0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self.prunes = 0
+
+    # -- SQLite tier --------------------------------------------------------
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if not self.db_path:
+            return None
+        # connections must not cross fork(); reopen in each worker
+        if self._db is None or self._db_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(_SCHEMA.format(table=self.table))
+            columns = {row[1] for row in db.execute(f"PRAGMA table_info({self.table})")}
+            if "size" not in columns:
+                try:  # a file written before rows recorded their size
+                    db.execute(f"ALTER TABLE {self.table} ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                except sqlite3.OperationalError:
+                    pass  # another worker added it first
+            db.execute(_INDEX.format(table=self.table))
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    def _disk_get(self, key: str, now: float):
+        db = self._conn()
+        if db is None:
+            return MISS
+        try:
+            row = db.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            return MISS
+        if row is None:
+            return MISS
+        if row[1] <= now:
+            return None, row[1]
+        value = json.loads(row[0]) if row[0] is not None else None
+        return value, row[1]
+
+    def _disk_put(self, key: str, value: Any, expires_at: float) -> None:
+        db = self._conn()
+        if db is None:
+            return
+        text = json.dumps(value) if value is not None else None
+        try:
+            db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, size) VALUES (?, ?, ?, ?)",
+                (key, text, expires_at, len(text) if text is not None else 0),
+            )
+            self._puts_since_prune += 1
+            now = time.time()
+            if self._puts_since_prune >= _DB_PRUNE_EVERY or now - self._pruned_at >= _DB_PRUNE_INTERVAL_S:
+                self._disk_prune(db, now)
+        except sqlite3.Error:
+            pass  # the shared tier is best effort
+
+    def _disk_prune(self, db: sqlite3.Connection, now: float) -> None:
+        """Delete expired rows, then trim the rows closest to expiry past the bounds."""
+        self._puts_since_prune, self._pruned_at = 0, now
+        self.prunes += 1
+        db.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+        if not (self.db_max_entries or self.db_max_bytes):
+            return
+        count, total = db.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        if count <= (self.db_max_entries or count) and total <= (self.db_max_bytes or total):
+            return
+        keep_entries = int(self.db_max_entries * _DB_TRIM_TO) if self.db_max_entries else count
+        keep_bytes = int(self.db_max_bytes * _DB_TRIM_TO) if self.db_max_bytes else total
+        db.execute(
+            f"DELETE FROM {self.table} WHERE key IN ("
+            f"SELECT key FROM (SELECT key, ROW_NUMBER() OVER w AS n, SUM(size) OVER w AS kept FROM {self.table} "
+            f"WINDOW w AS (ORDER BY expires_at DESC, key)) WHERE n > ? OR kept > ?)",
+            (keep_entries, keep_bytes),
+        )
+
+    # -- public API ---------------------------------------------------------
+
+    def prune(self) -> None:
+        """Prune the SQLite tier now instead of at the next scheduled put."""
+        with self._lock:
+            db = self._conn()
+            if db is None:
+                return
+            try:
+                self._disk_prune(db, time.time())
+            except sqlite3.Error:
+                pass
+
+    def get(self, key: str):
+        """Cached value (None for a cached failure), or ``MISS``."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    if entry[0] is None:
+                        self.negative_hits += 1
+                    return entry[0]
+                self._forget(key)
+                self.expired += 1
+            found = self._disk_get(key, now)
+            if found is not MISS and found[1] <= now:
+                if entry is None:
+                    self.expired += 1
+                found = MISS
+            if found is MISS:
+                self.misses += 1
+                return MISS
+            self.disk_hits += 1
+            if found[0] is None:
+                self.negative_hits += 1
+            self._remember(key, found[0], found[1])
+            return found[0]
+
+    def put(self, key: str, value: Any, ttl_s: Optional[float] = None) -> None:
+        """Cache a value; ``None`` records a failure for ``negative_ttl_s``.
+
+        ``ttl_s`` overrides the lifetime of this entry.
+        """
+        ttl = ttl_s if ttl_s is not None else self.ttl_s if value is not None else self.negative_ttl_s
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        with self._lock:
+            self.stores += 1
+            self._remember(key, value, expires_at)
+            self._disk_put(key, value, expires_at)
+
+    def _remember(self, key: str, value: Any, expires_at: float) -> None:
+        if self.max_entries <= 0:
+            return
+        size = _size(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+        self._forget(key)
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+
+    def _forget(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "db_path": self.db_path,
+                "db_max_entries": self.db_max_entries,
+                "db_max_bytes": self.db_max_bytes,
+                "ttl_s": self.ttl_s,
+                "negative_ttl_s": self.negative_ttl_s,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "stores": self.stores,
+                "prunes": self.prunes,
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+            }
+
+
+class ExtractionCache(TTLCache):
+    """LLM extractions keyed by model + lowercased query, failures included."""
+
+    TABLE = "extractions"
+
+
+class ResponseCache(TTLCache):
+    """Whole serialized endpoint responses keyed by a content hash of the request."""
+
+    TABLE = "responses"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="LLM extraction and response cache tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_stats = sub.add_parser("stats", help="Show entry counts")
+    p_stats.add_argument("--db", required=True)
+    p_stats.add_argument("--table", default="extractions", help="extractions or responses")
+    p_purge = sub.add_parser("purge", help="Delete entries")
+    p_purge.add_argument("--db", required=True)
+    p_purge.add_argument("--table", default="extractions", help="extractions or responses")
+    p_purge.add_argument("--expired-only", action="store_true")
+
+    args = parser.parse_args()
+    cache = TTLCache(db_path=args.db, table=args.table)
+    db = cache._conn()
+    now = time.time()
+    if args.cmd == "stats":
+        total, negative, expired, size = db.execute(
+            f"SELECT COUNT(*), SUM(value IS NULL), SUM(expires_at <= ?), SUM(size) FROM {args.table}",
+            (now,)).fetchone()
+        print(f"📦 {total} entries ({negative or 0} negative, {expired or 0} expired, "
+              f"{(size or 0) / 1024:.1f} KiB) in {args.db}")
+    elif args.cmd == "purge":
+        if args.expired_only:
+            n = db.execute(f"DELETE FROM {args.table} WHERE expires_at <= ?", (now,)).rowcount
+        else:
+            n = db.execute(f"DELETE FROM {args.table}").rowcount
+        db.execute("VACUUM")
+        print(f"🧹 Deleted {n} entries from {args.db}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
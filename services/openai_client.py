@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Async HTTP client for the OpenAI chat completions API.
+
+One ``OpenAIClient`` keeps a pool of keep-alive connections (httpx) and a
+single SSL context for the life of the process, so LLM calls neither block
+the event loop nor pay a TLS handshake each time. Without httpx the client
+falls back to urllib in a worker thread (non-blocking, but no keep-alive).
+
+Configuration (environment):
+    OPENAI_BASE_URL          API root (default https://api.openai.com/v1)
+    OPENAI_CONNECT_TIMEOUT   seconds to establish a connection (default 3)
+    OPENAI_READ_TIMEOUT      seconds to wait for a response (default 12)
+    OPENAI_MAX_CONNECTIONS   pooled connections (default 20)
+    OPENAI_BREAKER_FAILURES  consecutive failures that open the circuit (default 5)
+    OPENAI_BREAKER_RESET_S   seconds the circuit stays open before a probe (default 30)
+    OPENAI_TIMEOUT_P95_MULTIPLIER  adaptive read timeout = p95 latency x this (default 2)
+    OPENAI_TIMEOUT_MIN_S     floor of the adaptive read timeout (default 1)
+
+``CircuitBreaker`` stops calling an API that keeps timing out or failing
+(closed -> open -> half-open probe -> closed), and ``LatencyTracker`` derives
+the read timeout from observed latency instead of a fixed worst case.
+
+A local stub of the API simulates latency and error responses for
+development and benchmarks:
+    python openai_client.py stub --port 8089 --latency-ms 800 [--force-status 500]
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python start_service.py dev
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import ssl
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib import request as urlrequest, error as urlerror
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import certifi
+
+    _SSL_CAFILE = certifi.where()
+except ImportError:
+    _SSL_CAFILE = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+class OpenAIHTTPError(Exception):
+    """Non-2xx response; ``body`` is the decoded JSON error (or raw text)."""
+
+    def __init__(self, status: int, reason: str, body: Any):
+        super().__init__(f"HTTP {status}: {reason}")
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+    @property
+    def error_code(self) -> Optional[str]:
+        if isinstance(self.body, dict):
+            return (self.body.get("error") or {}).get("code")
+        return None
+
+
+class OpenAITransportError(Exception):
+    """Connection failure or timeout."""
+
+
+class OpenAITimeoutError(OpenAITransportError):
+    """No response within the read timeout."""
+
+
+def create_ssl_context(cafile: Optional[str] = _SSL_CAFILE) -> ssl.SSLContext:
+    return ssl.create_default_context(cafile=cafile) if cafile else ssl.create_default_context()
+
+
+def _decode(raw: bytes) -> Any:
+    text = raw.decode("utf-8", errors="replace")
+    try:
+        return json.loads(text) if text else {}
+    except ValueError:
+        return text
+
+
+class OpenAIClient:
+    """Pooled async client; create once and share across requests."""
+
+    def __init__(self, base_url: Optional[str] = None, connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None, max_connections: Optional[int] = None):
+        env = os.environ.get
+        self.base_url = (base_url or env("OPENAI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.connect_timeout = connect_timeout or float(env("OPENAI_CONNECT_TIMEOUT", "3"))
+        self.read_timeout = read_timeout or float(env("OPENAI_READ_TIMEOUT", "12"))
+        self.max_connections = max_connections or int(env("OPENAI_MAX_CONNECTIONS", "20"))
+        self.ssl_context = create_ssl_context()
+        self.backend = "httpx" if httpx is not None else "urllib"
+        self._http = {}  # event loop -> httpx.AsyncClient
+        self._requests = 0
+        self._errors = 0
+
+    def _client(self):
+        # httpx pools are bound to the event loop that first used them, so each
+        # loop gets its own and a pool in use on another thread's loop is never
+        # replaced under it. Pools of loops that have since closed are dropped
+        # (their sockets are released with them).
+        loop = asyncio.get_running_loop()
+        http = self._http.get(loop)
+        if http is None:
+            for stale in [l for l in list(self._http) if l.is_closed()]:
+                self._http.pop(stale, None)
+            http = self._http[loop] = httpx.AsyncClient(
+                verify=self.ssl_context,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return http
+
+    async def post_json(self, path: str, body: Dict[str, Any], api_key: str,
+                        read_timeout: Optional[float] = None) -> Dict[str, Any]:
+        """POST ``body`` to ``path`` and return the decoded JSON response.
+
+        Raises OpenAIHTTPError for non-2xx responses and OpenAITransportError
+        for connection failures and timeouts (OpenAITimeoutError when the
+        request went out but no reply came within the read timeout).
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+        data = json.dumps(body).encode("utf-8")
+        self._requests += 1
+        try:
+            if httpx is not None:
+                return await self._post_httpx(url, data, headers, read_timeout)
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._post_urllib, url, data, headers, read_timeout)
+        except Exception:
+            self._errors += 1
+            raise
+
+    async def _post_httpx(self, url: str, data: bytes, headers: Dict[str, str],
+                          read_timeout: Optional[float]) -> Dict[str, Any]:
+        timeout = httpx.Timeout(read_timeout or self.read_timeout, connect=self.connect_timeout)
+        try:
+            resp = await self._client().post(url, content=data, headers=headers, timeout=timeout)
+        except httpx.ReadTimeout as e:
+            raise OpenAITimeoutError(f"timeout: {e!r}") from e
+        except httpx.TimeoutException as e:
+            raise OpenAITransportError(f"timeout: {e!r}") from e
+        except httpx.TransportError as e:
+            raise OpenAITransportError(str(e) or repr(e)) from e
+        body = _decode(resp.content)
+        if resp.status_code >= 400:
+            raise OpenAIHTTPError(resp.status_code, resp.reason_phrase, body)
+        return body
+
+    def _post_urllib(self, url: str, data: bytes, headers: Dict[str, str],
+                     read_timeout: Optional[float]) -> Dict[str, Any]:
+        req = urlrequest.Request(url=url, data=data, headers=headers, method="POST")
+        try:
+            with urlrequest.urlopen(req, timeout=read_timeout or self.read_timeout, context=self.ssl_context) as resp:
+                return _decode(resp.read())
+        except urlerror.HTTPError as e:
+            raise OpenAIHTTPError(e.code, str(e.reason), _decode(e.read() or b"")) from e
+        except TimeoutError as e:
+            raise OpenAITimeoutError(f"timeout: {e!r}") from e
+        except (urlerror.URLError, OSError) as e:
+            raise OpenAITransportError(str(e)) from e
+
+    async def aclose(self) -> None:
+        """Close the pool of the running event loop."""
+        http = self._http.pop(asyncio.get_running_loop(), None)
+        if http is not None:
+            await http.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "base_url": self.base_url,
+            "requests": self._requests,
+            "errors": self._errors,
+            "connect_timeout_s": self.connect_timeout,
+            "read_timeout_s": self.read_timeout,
+            "max_connections": self.max_connections,
+        }
+
+
+# ------------------------ Resilience ------------------------
+
+class CircuitBreaker:
+    """Closed / open / half-open circuit breaker.
+
+    Closed: calls pass; ``failure_threshold`` consecutive failures open the
+    circuit. Open: calls are rejected until ``reset_timeout_s`` has passed,
+    then the circuit is half-open and lets ``half_open_max_calls`` probes
+    through. A successful probe closes it, a failed one opens it again.
+    Callers pair every allowed call with record_success, record_failure or
+    (for outcomes that say nothing about the API's health) release.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: Optional[int] = None, reset_timeout_s: Optional[float] = None,
+                 half_open_max_calls: int = 1):
+        env = os.environ.get
+        self.failure_threshold = failure_threshold or int(env("OPENAI_BREAKER_FAILURES", "5"))
+        self.reset_timeout_s = reset_timeout_s or float(env("OPENAI_BREAKER_RESET_S", "30"))
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.opened = 0
+        self.rejected = 0
+        self.last_failure: Optional[str] = None
+
+    def allow(self) -> bool:
+        """Whether a call may be made now (a half-open probe counts as one)."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout_s:
+                    self.rejected += 1
+                    return False
+                self.state, self._probes = self.HALF_OPEN, 0
+                logger.info("🔌 OpenAI circuit half-open; probing")
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self.rejected += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("✅ OpenAI circuit closed")
+            self.state, self._failures, self._probes = self.CLOSED, 0, 0
+
+    def record_failure(self, reason: str = "") -> None:
+        with self._lock:
+            self.last_failure = reason or None
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                    logger.warning(f"🔌 OpenAI circuit open for {self.reset_timeout_s:.0f}s after "
+                                   f"{self._failures} failure(s): {reason}")
+                self.state, self._opened_at, self._probes = self.OPEN, time.monotonic(), 0
+
+    def release(self) -> None:
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = 0.0
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self.reset_timeout_s - (time.monotonic() - self._opened_at))
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_s": self.reset_timeout_s,
+                "retry_in_s": round(retry_in, 3),
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "last_failure": self.last_failure,
+            }
+
+
+class LatencyTracker:
+    """Recent call latencies and a read timeout derived from them.
+
+    The timeout is ``multiplier`` x the p95 of the last ``window`` latencies,
+    clamped to [min_s, max_s]; with fewer than ``min_samples`` it is max_s.
+    A call that timed out is a sample at the timeout it hit and backs the
+    timeout off by another ``multiplier`` (up to max_s), so latency that
+    moves past the p95 is learned instead of timing out every call; each
+    success takes one backoff step away again.
+    """
+
+    def __init__(self, max_s: float, min_s: Optional[float] = None, multiplier: Optional[float] = None,
+                 window: int = 200, min_samples: int = 20):
+        env = os.environ.get
+        self.max_s = max_s
+        self.min_s = min(max_s, min_s or float(env("OPENAI_TIMEOUT_MIN_S", "1")))
+        self.multiplier = multiplier or float(env("OPENAI_TIMEOUT_P95_MULTIPLIER", "2"))
+        self.min_samples = min_samples
+        self._samples: "deque[float]" = deque(maxlen=window)
+        self._backoff = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self._backoff = max(0, self._backoff - 1)
+
+    def observe_timeout(self, seconds: float) -> None:
+        """Record a call that gave up after ``seconds`` and back off one step."""
+        with self._lock:
+            self._samples.append(seconds)
+            if self._timeout() < self.max_s:
+                self._backoff += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            return self._percentile(q)
+
+    def _percentile(self, q: float) -> Optional[float]:
+        samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def timeout(self) -> float:
+        with self._lock:
+            return self._timeout()
+
+    def _timeout(self) -> float:
+        if len(self._samples) < self.min_samples:
+            return self.max_s
+        adaptive = max(self.min_s, self._percentile(0.95) * self.multiplier)
+        return min(self.max_s, adaptive * self.multiplier ** self._backoff)
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.50), self.percentile(0.95)
+        with self._lock:
+            n, backoff = len(self._samples), self._backoff
+        return {
+            "samples": n,
+            "backoff_steps": backoff,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "read_timeout_s": round(self.timeout(), 3),
+            "min_s": self.min_s,
+            "max_s": self.max_s,
+            "multiplier": self.multiplier,
+        }
+
+
+# ------------------------ Stub Server ------------------------
+
+class StubOpenAIServer:
+    """Local stand-in for the chat completions endpoint.
+
+    Replies after ``latency_ms`` with a JSON extraction of the prompt. A
+    prompt containing ``status=401``, ``status=429`` or ``status=500`` gets
+    that error instead (401 carries ``invalid_api_key`` like the real API);
+    ``force_status`` returns that error for every prompt (an outage).
+
+    Batch prompts (numbered queries, one per line) get {"results": [...]}
+    with one entry per line. A line containing ``drop`` is left out of the
+    reply, and ``malformed`` in any line makes the whole reply invalid JSON.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                 force_status: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.force_status = force_status
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+            wbufsize = 65536  # one write per response (no Nagle / delayed-ACK stalls)
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with stub._lock:
+                    stub.requests += 1
+                time.sleep(stub.latency_ms / 1000.0)
+                status, payload = stub.respond(body)
+                raw = json.dumps(payload).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(raw)))
+                    self.end_headers()
+                    self.wfile.write(raw)
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # client gave up (timeout test)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def respond(self, body: Dict[str, Any]):
+        prompt = (body.get("messages") or [{}])[-1].get("content", "")
+        if self.force_status:
+            prompt = f"status={self.force_status}"
+        for status, code in ((401, "invalid_api_key"), (429, "rate_limit_exceeded"), (500, "server_error")):
+            if f"status={status}" in prompt:
+                return status, {"error": {"message": f"stub {status}", "type": "stub", "code": code}}
+        numbered = re.findall(r"^(\d+)\. (.*)$", prompt, re.M)
+        if numbered:
+            if any("malformed" in q for _, q in numbered):
+                content = "Here are the results: 1) ..."
+            else:
+                content = json.dumps({"results": [
+                    {"index": int(i), "Brand": None, "Item": q.strip() or None, "Quantity": None}
+                    for i, q in numbered if "drop" not in q
+                ]})
+        else:
+            query = prompt.split(":", 1)[-1].strip()
+            content = json.dumps({"Brand": None, "Item": query or None, "Quantity": None})
+        return 200, {
+            "id": f"stub-{self.requests}",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        }
+
+    def start(self) -> "StubOpenAIServer":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="openai-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="OpenAI client tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_stub = sub.add_parser("stub", help="Run a local stub of the chat completions API")
+    p_stub.add_argument("--host", default="127.0.0.1")
+    p_stub.add_argument("--port", type=int, default=8089)
+    p_stub.add_argument("--latency-ms", type=float, default=800.0)
+    p_stub.add_argument("--force-status", type=int, choices=(401, 429, 500), help="Fail every request")
+
+    args = parser.parse_args()
+    if args.cmd == "stub":
+        stub = StubOpenAIServer(args.host, args.port, args.latency_ms, args.force_status)
+        print(f"🧪 Stub OpenAI API on {stub.base_url} (latency {args.latency_ms:.0f} ms)")
+        try:
+            stub.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,25 +20,44 @@ Environment Variables:
     OPENAI_API_KEY=your-openai-api-key-here
 """
 
+import time
+
+# Import-to-ready is measured from here; see load_embedding_model()
+_IMPORT_STARTED = time.perf_counter()
+
 import re
 import os
 import json
-import time
-import ssl
-from urllib import request as urlrequest, error as urlerror
+import asyncio
+import hashlib
 import math
 import logging
-from typing import Optional, Dict, List, Any, Tuple
+import multiprocessing
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Optional, Dict, List, Any, Awaitable, Callable, NamedTuple, Tuple
 from datetime import datetime
 
 # FastAPI imports
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 
+import embedding_backends
+from brand_lexicon import DEFAULT_LEXICON_PATH, BrandLexicon, lexicon_tokens, load_lexicon
+from embedding_store import EmbeddingStore
+from extraction_cache import MISS, ExtractionCache, ResponseCache
+from openai_client import (CircuitBreaker, LatencyTracker, OpenAIClient, OpenAIHTTPError, OpenAITimeoutError,
+                           OpenAITransportError)
+
 # try imports that may be optional
 try:
-    from rapidfuzz import fuzz
+    from rapidfuzz import fuzz, process
 except ImportError:
     raise ImportError("rapidfuzz is required. Install with: pip install rapidfuzz")
 
@@ -49,22 +68,9 @@ except ImportError:
     raise ImportError("scikit-learn is required. Install with: pip install scikit-learn")
 
 try:
-    import certifi
-
-    _SSL_CAFILE = certifi.where()
-except ImportError:
-    _SSL_CAFILE = None
-
-# Optional embeddings for better semantic matching
-USE_EMBEDDINGS = True
-try:
-    from sentence_transformers import SentenceTransformer
     import numpy as np
-    _EMBED_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
 except ImportError:
-    USE_EMBEDDINGS = False
-    _EMBED_MODEL = None
-    logging.warning("sentence-transformers not available, using TF-IDF fallback")
+    raise ImportError("numpy is required. Install with: pip install numpy")
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -123,11 +129,20 @@ except Exception as e:
 
 _log_openai_key_fingerprint()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start loading the embedding model without holding up worker boot."""
+    start_background_model_load()
+    yield
+    await _OPENAI_CLIENT.aclose()
+    _MATCH_POOL.shutdown()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Product Matcher Service",
     description="Intelligent product matching from HasData responses",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -160,6 +175,25 @@ class HealthResponse(BaseModel):
     status: str = Field("healthy", description="Service status")
     timestamp: datetime = Field(default_factory=datetime.now)
     embeddings_available: bool = Field(False, description="Whether embeddings are available")
+    embedding_cache: Dict[str, Any] = Field({}, description="Embedding cache size and hit/miss counters")
+    embedding_store: Optional[Dict[str, Any]] = Field(None, description="Persistent embedding store stats, if enabled")
+    embedding_batcher: Dict[str, Any] = Field({}, description="Cross-request embedding batcher queue depth and batch-size histograms")
+    model_state: str = Field("unavailable", description="Embedding model state: loading, ready, failed or unavailable")
+    embedding_backend: str = Field("torch", description="Embedding inference backend: torch, onnx or onnx-int8")
+    llm_client: Dict[str, Any] = Field({}, description="OpenAI client backend, timeouts and request counts")
+    extraction_cache: Dict[str, Any] = Field({}, description="LLM extraction cache hit/miss counters")
+    extraction_flights: Dict[str, Any] = Field({}, description="Coalesced (single-flight) LLM extraction counters")
+    extraction_batches: Dict[str, Any] = Field({}, description="Batched (shopping list) LLM extraction counters")
+    llm_breaker: Dict[str, Any] = Field({}, description="OpenAI circuit breaker state and failure counts")
+    llm_timeout: Dict[str, Any] = Field({}, description="Observed OpenAI latency and the adaptive read timeout")
+    match_pool: Dict[str, Any] = Field({}, description="Matching executor load, rejections and queue-wait histogram")
+    response_cache: Dict[str, Any] = Field({}, description="Whole-response cache size and hit/miss counters")
+    local_extractor: Dict[str, Any] = Field({}, description="Local rule-based extraction lexicon size and LLM calls avoided")
+
+class ReadinessResponse(BaseModel):
+    ready: bool = Field(False, description="Whether the service has finished warming up")
+    model_state: str = Field("unavailable", description="Embedding model state: loading, ready, failed or unavailable")
+    timings_ms: Dict[str, float] = Field({}, description="Model load, warm-up and import-to-ready durations")
 
 # ------------------------ Core Matching Functions ------------------------
 
@@ -177,62 +211,169 @@ def normalize_text(s: str) -> str:
     s = re.sub(r"\s+", " ", s).strip()
     return s
 
-def parse_volume_to_liters(title: str) -> Optional[float]:
-    """Try to extract volume/size from a product title and convert to liters.
-    Returns liters (float) if found, otherwise None.
+# ------------------------ Unit Engine ------------------------
+
+# Canonical units: liters (volume), kilograms (weight), items (count)
+DIMENSIONS = ("volume", "weight", "count")
+CANONICAL_UNITS = {"volume": "liter", "weight": "kg", "count": "item"}
+
+# unit group -> (dimension, canonical units per unit)
+_UNITS = {
+    "gal": ("volume", 3.78541),
+    "floz": ("volume", 0.0295735),
+    "l": ("volume", 1.0),
+    "ml": ("volume", 0.001),
+    "qt": ("volume", 0.946353),
+    "pt": ("volume", 0.473176),
+    "lb": ("weight", 0.45359237),
+    "kg": ("weight", 1.0),
+    "g": ("weight", 0.001),
+    "oz": ("weight", 0.028349523125),  # bare "oz": weight, or fl oz when compared with a volume
+    "ct": ("count", 1.0),
+    "pack": ("count", 1.0),
+    "dozen": ("count", 12.0),
+}
+FL_OZ_LITERS = _UNITS["floz"][1]
+
+# Every quantity mention in one scan. "6 x 12 fl oz" carries its multipack
+# factor in ``mult``; "6 pack" / "pack of 6" are count mentions that also
+# multiply a size found elsewhere in the title. Amounts may be fractions
+# ("1/2 gal", "1 1/2 lb").
+_QUANTITY_RE = re.compile(
+    r"(?=[\dpd])(?:(?P<mult>\d+)\s*[x\u00d7]\s*)?"
+    r"(?:(?P<amount>(?:\d+\s+)?\d+/\d(?!\d)|\d+(?:\.\d+)?)[\s-]*(?:"
+    r"(?P<gal>gal|gallon|gallons)"
+    r"|(?P<floz>fl\.?\s*oz|fluid\s*oz|fluid\s*ounces?)"
+    r"|(?P<l>l|litre|liter|liters|litres)"
+    r"|(?P<ml>ml|milliliter|millilitre|milliliters|millilitres)"
+    r"|(?P<qt>qt|quart|quarts)"
+    r"|(?P<pt>pt|pint|pints)"
+    r"|(?P<lb>lb|lbs|pound|pounds)"
+    r"|(?P<kg>kg|kgs|kilo|kilos|kilogram|kilograms)"
+    r"|(?P<g>g|gr|gram|grams)"
+    r"|(?P<oz>oz|ounce|ounces)"
+    r"|(?P<ct>ct|count|pc|pcs|piece|pieces)"
+    r"|(?P<pack>pk|pack|packs)"
+    r"|(?P<dozen>dozen)"
+    r")\b"
+    r"|pack\s+of\s+(?P<pack_of>\d+)\b"
+    r"|\b(?P<one_dozen>dozen)\b)"
+)
+# A weight followed by a nutrient is a per-serving fact, not the package size
+_NUTRIENT_RE = re.compile(
+    r"\s*(?:(?:of|plant|whey|total|dietary|added|saturated|trans|net)\s+)*"
+    r"(?:protein|sugars?|fat|fiber|fibre|carbs?|carbohydrates?|sodium|caffeine|collagen)\b"
+)
 
-    Handles:
-      - gallons, gal
-      - fl oz, oz
-      - liters/litre, l, ml
-      - quart (qt)
-      - pint
+class Quantity(NamedTuple):
+    """A parsed size: ``amount`` canonical units of ``dimension``.
+
+    ``fluid_liters`` is set for bare "oz" sizes, which are read as weight but
+    compare as fluid ounces against a volume.
     """
-    t = title.lower()
-
-    # gallons: 1 gal, 0.5 gal, 1 gallon
-    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:gal|gallon|gallons)\b", t)
-    if m:
-        return float(m.group(1)) * 3.78541
-
-    # fluid ounces: 128 fl oz, 16 fl oz, just "128 oz" often used
-    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:fl\s*oz|fluid\s*oz|oz)\b", t)
-    if m:
-        return float(m.group(1)) * 0.0295735
-
-    # liters or milliliters
-    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:l|litre|liter|liters)\b", t)
-    if m:
-        return float(m.group(1))
-    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:ml|milliliter|millilitre|milliliters)\b", t)
-    if m:
-        return float(m.group(1)) / 1000.0
-
-    # quarts
-    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:qt|quart|quarts)\b", t)
-    if m:
-        return float(m.group(1)) * 0.946353
-
-    # pints
-    m = re.search(r"(\d+(?:\.\d+)?)\s*(?:pt|pint|pints)\b", t)
-    if m:
-        return float(m.group(1)) * 0.473176
-
-    # fallback: match patterns like '1 gallon' written as '1gal' (no space)
-    m = re.search(r"(\d+(?:\.\d+)?)(gal|gallon|gallons)\b", t)
-    if m:
-        return float(m.group(1)) * 3.78541
+    dimension: str
+    amount: float
+    fluid_liters: Optional[float] = None
+
+    def as_dimension(self, dimension: str) -> Optional[float]:
+        """Amount in ``dimension``'s canonical unit, or None if not convertible."""
+        if dimension == self.dimension:
+            return self.amount
+        if dimension == "volume":
+            return self.fluid_liters
+        return None
 
-    return None
+def _parse_amount(text: str) -> Optional[float]:
+    """"12", "1.75", "1/2" or "1 1/2" as a float; None for a zero denominator."""
+    if "/" not in text:
+        return float(text)
+    whole, _, frac = text.rpartition(" ")
+    num, den = frac.split("/")
+    if float(den) == 0:
+        return None
+    return (float(whole) if whole.strip() else 0.0) + float(num) / float(den)
+
+def _scan_quantities(text: str) -> List[Tuple[str, float, int]]:
+    """All (unit, amount, multipack factor) size mentions in ``text``, left to right.
 
-def parse_volume_to_liters_from_quantity_string(quantity_text: Optional[str]) -> Optional[float]:
-    """Parse a quantity string like '40 fl oz' to liters using the same rules."""
-    if not quantity_text:
+    Nutrient weights ("12g protein") and fractions over zero ("1/0 gal") are
+    skipped.
+    """
+    mentions = []
+    text = text.lower()
+    for m in _QUANTITY_RE.finditer(text):
+        unit = m.lastgroup
+        if unit == "pack_of":
+            mentions.append(("pack", float(m.group("pack_of")), 1))
+        elif unit == "one_dozen":
+            mentions.append(("dozen", 1.0, 1))
+        elif _UNITS[unit][0] == "weight" and _NUTRIENT_RE.match(text, m.end()):
+            continue
+        else:
+            amount, mult = m.group("amount", "mult")
+            amount = _parse_amount(amount)
+            if amount is not None:
+                mentions.append((unit, amount, int(mult) if mult else 1))
+    return mentions
+
+@lru_cache(maxsize=16384)
+def parse_quantity(text: Optional[str]) -> Optional[Quantity]:
+    """Parse a title or quantity string into a canonical ``Quantity``.
+
+    A volume wins over a weight, and either wins over a count; within a
+    dimension the first mention is the package size. Multipacks multiply the
+    size: "6 x 12 fl oz", "12 fl oz, 6 pack", "pack of 6". Counts prefer an
+    explicit "120 count" / "12 ct" / "dozen" over "3 pack".
+    Results are cached, so parsing the same title in every store is cheap.
+    """
+    if not text:
         return None
-    try:
-        return parse_volume_to_liters(str(quantity_text))
-    except Exception:
+    mentions = _scan_quantities(str(text))
+    if not mentions:
         return None
+    by_dim = {}
+    for x in mentions:
+        by_dim.setdefault(_UNITS[x[0]][0], []).append(x)
+    sizes = by_dim.get("volume") or by_dim.get("weight")
+    if sizes:
+        unit, amount, mult = sizes[0]
+        if mult == 1:
+            packs = [a for u, a, _ in mentions if u == "pack"]
+            if packs:
+                mult = packs[0]
+    else:
+        counts = [x for x in mentions if x[0] != "pack"] or mentions
+        unit, amount, mult = counts[0]
+    dimension, factor = _UNITS[unit]
+    total = amount * mult
+    fluid_liters = total * FL_OZ_LITERS if unit == "oz" else None
+    return Quantity(dimension, total * factor, fluid_liters)
+
+def quantity_from_liters(liters: Optional[float]) -> Optional[Quantity]:
+    return Quantity("volume", liters) if liters is not None else None
+
+def quantities_match(found: Optional[Quantity], desired: Optional[Quantity], tolerance: float = 0.15) -> bool:
+    """Whether ``found`` is within ``tolerance`` (relative) of ``desired``."""
+    if found is None or desired is None:
+        return False
+    value = found.as_dimension(desired.dimension)
+    target = desired.amount
+    if value is None and desired.fluid_liters is not None:
+        # bare "oz" query against a volume-labelled product
+        value, target = found.as_dimension("volume"), desired.fluid_liters
+    if value is None:
+        return False
+    return abs(value - target) <= (tolerance * target)
+
+def price_per_canonical_unit(price: Any, quantity: Optional[Quantity],
+                             dimension: Optional[str] = None) -> Optional[float]:
+    """Price per liter / kg / item (``dimension`` defaults to the quantity's own)."""
+    if quantity is None or not isinstance(price, (int, float)):
+        return None
+    amount = quantity.as_dimension(dimension or quantity.dimension)
+    if not amount:
+        return None
+    return price / amount
 
 def markdown_to_json(text: str) -> str:
     """Strip markdown code fences from a string that should contain JSON."""
@@ -243,14 +384,104 @@ def markdown_to_json(text: str) -> str:
     text = re.sub(r"\s*```\s*$", "", text.strip())
     return text.strip()
 
-def call_openai_extract_components(query: str, timeout_seconds: int = 12) -> Optional[Dict[str, Optional[str]]]:
-    """
-    Call OpenAI to identify brand, item and quantity in the user's query.
-    Returns dict: {"brand": str|None, "item": str|None, "quantity": str|None}
+# Shared pooled client (keep-alive connections, one SSL context); see openai_client.py
+_OPENAI_CLIENT = OpenAIClient()
+OPENAI_EXTRACT_MODEL = "gpt-4o-mini"
+
+# Timeouts, 429s and 5xx open the circuit so requests go straight to the
+# classic matcher; the read timeout follows observed p95 latency
+_OPENAI_BREAKER = CircuitBreaker()
+_OPENAI_LATENCY = LatencyTracker(max_s=_OPENAI_CLIENT.read_timeout)
+
+# Extractions keyed by model + normalized query: in-process LRU, plus a SQLite
+# file shared by all workers when EXTRACT_CACHE_DB is set. Failed calls are
+# cached for EXTRACT_CACHE_NEGATIVE_TTL_S so outages are not retried per request.
+_EXTRACTION_CACHE = ExtractionCache(
+    max_entries=int(os.environ.get("EXTRACT_CACHE_MAX_ENTRIES", "4096")),
+    ttl_s=float(os.environ.get("EXTRACT_CACHE_TTL_S", str(7 * 24 * 3600))),
+    negative_ttl_s=float(os.environ.get("EXTRACT_CACHE_NEGATIVE_TTL_S", "60")),
+    db_path=os.environ.get("EXTRACT_CACHE_DB") or None,
+)
 
-    Requires OPENAI_API_KEY in environment.
-    Gracefully returns None on any error.
+def parse_extraction_content(content: str) -> Dict[str, Optional[str]]:
+    """Parse the LLM's reply into {"brand", "item", "quantity"} (None for blanks)."""
+    content = markdown_to_json(content)
+    logger.info(f"📝 Cleaned LLM Content: {content}")
+
+    try:
+        parsed = json.loads(content)
+        logger.info(f"✅ Successfully parsed JSON: {parsed}")
+    except Exception as json_error:
+        logger.warning(f"⚠️ Failed to parse as JSON: {json_error}")
+        # Try to coerce simple bullet style the user showed into json
+        # Fallback heuristic parse
+        brand = None
+        item = None
+        quantity = None
+        for line in content.splitlines():
+            m = re.match(r"\s*\*\s*Brand:\s*(.+)", line, re.I)
+            if m:
+                brand = m.group(1).strip() or None
+            m = re.match(r"\s*\*\s*Item:\s*(.+)", line, re.I)
+            if m:
+                item = m.group(1).strip() or None
+            m = re.match(r"\s*\*\s*Quantity:\s*(.+)", line, re.I)
+            if m:
+                quantity = m.group(1).strip() or None
+        parsed = {"brand": brand, "item": item, "quantity": quantity}
+        logger.info(f"📋 Fallback parsed: {parsed}")
+
+    return normalize_components(parsed)
+
+def normalize_components(parsed: Any) -> Dict[str, Optional[str]]:
+    """{"brand", "item", "quantity"} from a parsed LLM object (None for blanks)."""
+    # Handle both lowercase and capitalized keys (Brand, Item, Quantity)
+    if isinstance(parsed, dict):
+        brand = parsed.get("brand") or parsed.get("Brand")
+        item = parsed.get("item") or parsed.get("Item")
+        quantity = parsed.get("quantity") or parsed.get("Quantity")
+    else:
+        brand = None
+        item = None
+        quantity = None
+
+    # Normalize blanks
+    def nz(x):
+        if x is None:
+            return None
+        xs = str(x).strip()
+        return xs if xs else None
+
+    return {"brand": nz(brand), "item": nz(item), "quantity": nz(quantity)}
+
+def parse_batch_extraction_content(content: str, n: int) -> Optional[List[Optional[Dict[str, Optional[str]]]]]:
+    """Parse a batch reply into one component dict per query (None where missing).
+
+    Accepts {"results": [...]} or a bare list; entries are matched by their
+    1-based "index", or by position when there is none. Returns None when
+    the reply is not JSON of that shape.
     """
+    try:
+        parsed = json.loads(markdown_to_json(content))
+    except ValueError:
+        return None
+    if isinstance(parsed, dict):
+        parsed = next((v for v in parsed.values() if isinstance(v, list)), None)
+    if not isinstance(parsed, list):
+        return None
+    out: List[Optional[Dict[str, Optional[str]]]] = [None] * n
+    for pos, entry in enumerate(parsed):
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get("index", pos + 1)
+        if isinstance(index, str) and index.strip().isdigit():
+            index = int(index)
+        if isinstance(index, int) and 1 <= index <= n:
+            out[index - 1] = normalize_components(entry)
+    return out
+
+def usable_openai_key() -> Optional[Tuple[str, str]]:
+    """(key, fingerprint) when LLM extraction can be attempted, else None (logged)."""
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         logger.warning("🔒 OPENAI_API_KEY not set; skipping LLM extraction")
@@ -276,112 +507,66 @@ def call_openai_extract_components(query: str, timeout_seconds: int = 12) -> Opt
         logger.info("🔄 OPENAI_API_KEY fingerprint changed (%s -> %s), re-enabling extraction", _OPENAI_DISABLED_FOR_FINGERPRINT, key_fp)
         _OPENAI_DISABLED_FOR_FINGERPRINT = None
         _OPENAI_DISABLED_REASON = None
+    return key, key_fp
 
-    # Use the exact prompt format as specified by the user
-    prompt = f"identify brand, item and quantity in this: {query}"
+async def _call_openai_chat(messages: List[Dict[str, str]], read_timeout: Optional[float] = None,
+                            observe_latency: bool = True) -> Optional[str]:
+    """One JSON-mode chat completion; returns the reply content or None on any error.
+
+    Outcomes are reported to the circuit breaker: timeouts, 429 and 5xx count
+    as failures. A 401 invalid_api_key disables the current key. Without an
+    explicit ``read_timeout`` the adaptive one is used, except for a half-open
+    probe, which gets the full timeout so a slow but healthy API can close
+    the circuit.
+    """
+    usable = usable_openai_key()
+    if usable is None:
+        _OPENAI_BREAKER.release()
+        return None
+    key, key_fp = usable
+    global _OPENAI_DISABLED_FOR_FINGERPRINT, _OPENAI_DISABLED_REASON
 
     body = {
-        "model": "gpt-4o-mini",
-        "messages": [
-            {"role": "system", "content": "You extract structured fields from product queries. Return JSON with keys: Brand, Item, Quantity. Use null if unknown."},
-            {"role": "user", "content": prompt}
-        ],
+        "model": OPENAI_EXTRACT_MODEL,
+        "messages": messages,
         "response_format": {"type": "json_object"},  # Request structured JSON output
         "temperature": 0,
     }
 
     # Always log the request details for debugging
     logger.info(f"📤 OpenAI API Request:")
-    logger.info(f"   URL: https://api.openai.com/v1/chat/completions")
+    logger.info(f"   URL: {_OPENAI_CLIENT.base_url}/chat/completions")
     logger.info(f"   Model: {body['model']}")
-    logger.info(f"   Prompt: {prompt}")
-    logger.info(f"   System Message: {body['messages'][0]['content']}")
+    logger.info(f"   Prompt: {messages[-1]['content']}")
+    logger.info(f"   System Message: {messages[0]['content']}")
     logger.info(f"   Request Body: {json.dumps(body, indent=2)}")
 
-    req = urlrequest.Request(
-        url="https://api.openai.com/v1/chat/completions",
-        data=json.dumps(body).encode("utf-8"),
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {key}",
-        },
-        method="POST",
-    )
-
+    adaptive = not read_timeout
+    if adaptive:
+        probing = _OPENAI_BREAKER.state == CircuitBreaker.HALF_OPEN
+        read_timeout = _OPENAI_LATENCY.max_s if probing else _OPENAI_LATENCY.timeout()
+    started = time.perf_counter()
     try:
-        logger.info(f"🚀 Making OpenAI API call...")
-        if _SSL_CAFILE:
-            ssl_ctx = ssl.create_default_context(cafile=_SSL_CAFILE)
+        logger.info(f"🚀 Making OpenAI API call (read timeout {read_timeout:.1f}s)...")
+        payload = await _OPENAI_CLIENT.post_json("chat/completions", body, key, read_timeout=read_timeout)
+        if observe_latency:
+            _OPENAI_LATENCY.observe(time.perf_counter() - started)
+        _OPENAI_BREAKER.record_success()
+
+        # Log the full response for debugging
+        logger.info(f"📥 OpenAI API Response: {json.dumps(payload, indent=2)}")
+
+        content = payload.get("choices", [{}])[0].get("message", {}).get("content", "")
+        logger.info(f"📝 Raw LLM Content: {content}")
+        return content
+    except OpenAIHTTPError as e:
+        logger.error(f"❌ OpenAI HTTP Error {e.status}: {e.reason}")
+        logger.error(f"❌ Error Response: {json.dumps(e.body, indent=2) if isinstance(e.body, dict) else e.body}")
+        if e.status == 429 or e.status >= 500:
+            _OPENAI_BREAKER.record_failure(f"HTTP {e.status}")
         else:
-            ssl_ctx = ssl.create_default_context()
-        with urlrequest.urlopen(req, timeout=timeout_seconds, context=ssl_ctx) as resp:
-            response_data = resp.read().decode("utf-8")
-            payload = json.loads(response_data)
-            
-            # Log the full response for debugging
-            logger.info(f"📥 OpenAI API Response Status: {resp.status}")
-            logger.info(f"📥 OpenAI API Response: {json.dumps(payload, indent=2)}")
-            
-            content = payload.get("choices", [{}])[0].get("message", {}).get("content", "")
-            logger.info(f"📝 Raw LLM Content: {content}")
-            
-            content = markdown_to_json(content)
-            logger.info(f"📝 Cleaned LLM Content: {content}")
-            
-            try:
-                parsed = json.loads(content)
-                logger.info(f"✅ Successfully parsed JSON: {parsed}")
-            except Exception as json_error:
-                logger.warning(f"⚠️ Failed to parse as JSON: {json_error}")
-                # Try to coerce simple bullet style the user showed into json
-                # Fallback heuristic parse
-                brand = None
-                item = None
-                quantity = None
-                for line in content.splitlines():
-                    m = re.match(r"\s*\*\s*Brand:\s*(.+)", line, re.I)
-                    if m:
-                        brand = m.group(1).strip() or None
-                    m = re.match(r"\s*\*\s*Item:\s*(.+)", line, re.I)
-                    if m:
-                        item = m.group(1).strip() or None
-                    m = re.match(r"\s*\*\s*Quantity:\s*(.+)", line, re.I)
-                    if m:
-                        quantity = m.group(1).strip() or None
-                parsed = {"brand": brand, "item": item, "quantity": quantity}
-                logger.info(f"📋 Fallback parsed: {parsed}")
-
-            # Handle both lowercase and capitalized keys (Brand, Item, Quantity)
-            if isinstance(parsed, dict):
-                brand = parsed.get("brand") or parsed.get("Brand")
-                item = parsed.get("item") or parsed.get("Item")
-                quantity = parsed.get("quantity") or parsed.get("Quantity")
-            else:
-                brand = None
-                item = None
-                quantity = None
-
-            # Normalize blanks
-            def nz(x):
-                if x is None:
-                    return None
-                xs = str(x).strip()
-                return xs if xs else None
-
-            result = {"brand": nz(brand), "item": nz(item), "quantity": nz(quantity)}
-            logger.info(f"🤖 LLM extracted components: {result}")
-            return result
-    except urlerror.HTTPError as e:
-        try:
-            error_body = e.read().decode("utf-8")
-            error_json = json.loads(error_body) if error_body else {}
-        except Exception:
-            error_body = str(e)
-            error_json = {}
-        logger.error(f"❌ OpenAI HTTP Error {e.code}: {e.reason}")
-        logger.error(f"❌ Error Response: {json.dumps(error_json, indent=2) if error_json else error_body}")
-        err_code = (error_json.get("error") or {}).get("code") if isinstance(error_json, dict) else None
-        if e.code == 401 and err_code == "invalid_api_key":
+            _OPENAI_BREAKER.release()
+        if e.status == 401 and e.error_code == "invalid_api_key":
             _OPENAI_DISABLED_FOR_FINGERPRINT = key_fp
             _OPENAI_DISABLED_REASON = "invalid_api_key (401)"
             logger.error(
@@ -390,116 +575,452 @@ def call_openai_extract_components(query: str, timeout_seconds: int = 12) -> Opt
                 key_fp,
             )
         return None
-    except urlerror.URLError as e:
+    except OpenAITimeoutError as e:
+        logger.error(f"❌ OpenAI timeout after {read_timeout:.1f}s: {e}")
+        if adaptive and observe_latency:
+            _OPENAI_LATENCY.observe_timeout(read_timeout)
+        _OPENAI_BREAKER.record_failure(str(e))
+        return None
+    except OpenAITransportError as e:
         logger.error(f"❌ OpenAI URL Error: {e}")
+        _OPENAI_BREAKER.record_failure(str(e))
         return None
+    except asyncio.CancelledError:
+        _OPENAI_BREAKER.release()
+        raise
     except Exception as e:
         logger.error(f"❌ OpenAI extraction error: {e}", exc_info=True)
+        _OPENAI_BREAKER.release()
+        return None
+
+async def call_openai_extract_components(query: str, timeout_seconds: Optional[float] = None) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Call OpenAI to identify brand, item and quantity in the user's query.
+    Returns dict: {"brand": str|None, "item": str|None, "quantity": str|None}
+
+    Requires OPENAI_API_KEY in environment.
+    Gracefully returns None on any error. ``timeout_seconds`` overrides the
+    adaptive read timeout (see LatencyTracker).
+    """
+    # Use the exact prompt format as specified by the user
+    prompt = f"identify brand, item and quantity in this: {query}"
+    content = await _call_openai_chat([
+        {"role": "system", "content": "You extract structured fields from product queries. Return JSON with keys: Brand, Item, Quantity. Use null if unknown."},
+        {"role": "user", "content": prompt}
+    ], read_timeout=timeout_seconds)
+    if content is None:
+        return None
+    try:
+        result = parse_extraction_content(content)
+    except Exception as e:
+        logger.error(f"❌ OpenAI extraction error: {e}", exc_info=True)
+        return None
+    logger.info(f"🤖 LLM extracted components: {result}")
+    return result
+
+BATCH_EXTRACT_PROMPT = "identify brand, item and quantity in each of these numbered queries:"
+
+async def call_openai_extract_batch(queries: List[str]) -> Optional[List[Optional[Dict[str, Optional[str]]]]]:
+    """Extract brand/item/quantity for several queries in one OpenAI call.
+
+    Returns one entry per query (None for queries missing from the reply),
+    an empty list when the reply is malformed, or None when the call failed.
+    Batch calls use the full OPENAI_READ_TIMEOUT and are kept out of the
+    adaptive-timeout latency window (their latency grows with the batch).
+    """
+    prompt = BATCH_EXTRACT_PROMPT + "\n" + "\n".join(f"{i}. {q}" for i, q in enumerate(queries, 1))
+    content = await _call_openai_chat([
+        {"role": "system", "content": "You extract structured fields from product queries. Return JSON "
+                                      "{\"results\": [{\"index\": n, \"Brand\": ..., \"Item\": ..., \"Quantity\": ...}]} "
+                                      "with one entry per numbered query. Use null if unknown."},
+        {"role": "user", "content": prompt}
+    ], read_timeout=_OPENAI_CLIENT.read_timeout, observe_latency=False)
+    if content is None:
+        return None
+    results = parse_batch_extraction_content(content, len(queries))
+    if results is None:
+        logger.warning(f"⚠️ Malformed batch extraction reply for {len(queries)} queries: {content[:200]!r}")
+        return []
+    logger.info(f"🤖 LLM batch extracted {sum(r is not None for r in results)}/{len(queries)} queries")
+    return results
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs the work; callers arriving
+    while it is in flight wait for the same result or exception. Flights are
+    ``concurrent.futures.Future`` objects, so coroutines (``do``) and plain
+    threads (``do_sync``) share them. An async leader's work runs as its own
+    task, so a cancelled leader does not fail its followers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._tasks = set()  # strong refs to async leaders' work
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return fut, False
+            fut = Future()
+            fut.set_running_or_notify_cancel()  # a waiter's cancel() must not cancel the flight
+            self._inflight[key] = fut
+            self.leaders += 1
+            return fut, True
+
+    def _land(self, key: str, fut: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        fut, leader = self._join(key)
+        if leader:
+            async def run():
+                try:
+                    result = await fn()
+                except BaseException as e:
+                    self._land(key, fut, error=e)
+                else:
+                    self._land(key, fut, result)
+            task = asyncio.ensure_future(run())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await asyncio.wrap_future(fut)
+
+    def do_sync(self, key: str, fn: Callable[[], Any]) -> Any:
+        fut, leader = self._join(key)
+        if leader:
+            try:
+                result = fn()
+            except BaseException as e:
+                self._land(key, fut, error=e)
+                raise
+            self._land(key, fut, result)
+            return result
+        return fut.result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"in_flight": len(self._inflight), "leaders": self.leaders, "coalesced": self.coalesced}
+
+# Identical extractions in flight at the same time share one OpenAI call
+_EXTRACTION_FLIGHTS = SingleFlight()
+
+def cache_query_text(query: str) -> str:
+    """The query as cache keys see it: lowercased and whitespace-collapsed only.
+
+    normalize_text drops characters ("1/2 gallon" vs "1 2 gallon") that
+    change the extraction and the match.
+    """
+    return " ".join(query.lower().split())
+
+def extraction_cache_key(query: str) -> str:
+    return f"{OPENAI_EXTRACT_MODEL}|{cache_query_text(query)}"
+
+async def extract_query_components(query: str) -> Optional[Dict[str, Optional[str]]]:
+    """LLM brand/item/quantity extraction through the extraction cache.
+
+    Concurrent misses for the same cache key are coalesced into one OpenAI
+    call. Nothing is cached while extraction is unavailable (no key, a key
+    disabled after a 401, or an open circuit), so setting a valid key takes
+    effect immediately.
+    """
+    key = extraction_cache_key(query)
+    cached = _EXTRACTION_CACHE.get(key)
+    if cached is not MISS:
+        logger.info(f"⚡ Extraction cache hit for '{query}': {cached}")
+        return cached
+    if usable_openai_key() is None:
         return None
 
+    async def fetch() -> Optional[Dict[str, Optional[str]]]:
+        # a flight that just landed may have filled the cache after our lookup
+        cached = _EXTRACTION_CACHE.get(key)
+        if cached is not MISS:
+            return cached
+        if not _OPENAI_BREAKER.allow():
+            logger.info(f"⏭️ OpenAI circuit {_OPENAI_BREAKER.state}; skipping LLM extraction for '{query}'")
+            return None
+        result = await call_openai_extract_components(query)
+        _EXTRACTION_CACHE.put(key, result)
+        return result
+
+    return await _EXTRACTION_FLIGHTS.do(key, fetch)
+
+# Queries per batched OpenAI call (shopping lists); chunks run concurrently
+EXTRACT_BATCH_SIZE = int(os.environ.get("EXTRACT_BATCH_SIZE", "20"))
+_BATCH_STATS = {"batches": 0, "queries": 0, "malformed": 0, "single_fallbacks": 0, "failed": 0}
+
+async def extract_query_components_batch(queries: List[str], batch_size: Optional[int] = None) -> List[Optional[Dict[str, Optional[str]]]]:
+    """extract_query_components for many queries in as few OpenAI calls as possible.
+
+    Cached queries are answered from the cache and queries with the same
+    cache key are extracted once. Misses go out in chunks of
+    EXTRACT_BATCH_SIZE, all chunks concurrently. Queries missing from a
+    chunk's reply (or every query of a malformed reply) fall back to single
+    extraction; a failed call is cached as a failure for each of its queries.
+    """
+    keys = [extraction_cache_key(q) for q in queries]
+    results: Dict[str, Optional[Dict[str, Optional[str]]]] = {}
+    pending: Dict[str, str] = {}
+    for query, key in zip(queries, keys):
+        if key in results or key in pending:
+            continue
+        cached = _EXTRACTION_CACHE.get(key)
+        if cached is not MISS:
+            results[key] = cached
+        else:
+            pending[key] = query
+    if not pending or usable_openai_key() is None:
+        return [results.get(k) for k in keys]
+
+    size = max(1, batch_size or EXTRACT_BATCH_SIZE)
+    items = list(pending.items())
+
+    async def run_chunk(chunk: List[Tuple[str, str]]) -> None:
+        retry = chunk
+        if len(chunk) > 1:
+            if not _OPENAI_BREAKER.allow():
+                logger.info(f"⏭️ OpenAI circuit {_OPENAI_BREAKER.state}; skipping batch of {len(chunk)} extractions")
+                return
+            _BATCH_STATS["batches"] += 1
+            _BATCH_STATS["queries"] += len(chunk)
+            extracted = await call_openai_extract_batch([q for _, q in chunk])
+            if extracted is None:
+                _BATCH_STATS["failed"] += 1
+                for key, _ in chunk:
+                    _EXTRACTION_CACHE.put(key, None)
+                return
+            if not extracted:
+                _BATCH_STATS["malformed"] += 1
+            retry = []
+            for i, (key, query) in enumerate(chunk):
+                found = extracted[i] if i < len(extracted) else None
+                if found is None:
+                    retry.append((key, query))
+                else:
+                    _EXTRACTION_CACHE.put(key, found)
+                    results[key] = found
+            if retry:
+                _BATCH_STATS["single_fallbacks"] += len(retry)
+                logger.info(f"↩️ Falling back to single extraction for {len(retry)} of {len(chunk)} batched queries")
+        singles = await asyncio.gather(*[extract_query_components(q) for _, q in retry])
+        for (key, _), found in zip(retry, singles):
+            results[key] = found
+
+    await asyncio.gather(*[run_chunk(items[i:i + size]) for i in range(0, len(items), size)])
+    return [results.get(k) for k in keys]
+
+# ------------------------ Local Extraction ------------------------
+
+# Product categories shared with is_general_query
+BASIC_CATEGORIES = {
+    'dairy': ['milk', 'cheese', 'butter', 'yogurt', 'cream'],
+    'grains': ['bread', 'cereal', 'rice', 'pasta', 'flour'],
+    'proteins': ['chicken', 'beef', 'fish', 'eggs', 'meat'],
+    'beverages': ['water', 'juice', 'soda', 'coffee', 'tea'],
+    'cleaning': ['detergent', 'soap', 'shampoo', 'toothpaste'],
+    'snacks': ['chips', 'cookies', 'crackers', 'nuts'],
+    'fruits': ['apples', 'bananas', 'oranges', 'fruits'],
+    'vegetables': ['carrots', 'lettuce', 'tomatoes', 'vegetables']
+}
+
+# Brands from is_general_query's brand patterns ("all" is left out: it is
+# far more often a plain word, as in "all purpose flour")
+SEED_BRANDS = ("ariel", "tide", "gain", "downy", "persil", "arm & hammer", "arm and hammer", "cheer",
+               "great value", "kirkland", "kirkland signature", "members mark")
+
+# Item words from is_general_query's quality/variant/size patterns, plus
+# common grocery words; a mined lexicon adds the rest
+ITEM_WORDS = (
+    "whole", "2%", "1%", "skim", "low", "fat", "non", "free", "lactose", "reduced", "organic", "natural",
+    "premium", "ultra", "concentrated", "heavy", "duty", "original", "classic", "traditional", "powder",
+    "liquid", "gel", "pods", "capsules", "tablets", "bars", "unscented", "fragrance", "scented", "fresh",
+    "clean", "color", "safe", "stain", "whitening", "family", "size", "bulk", "jumbo", "mini", "half",
+    "large", "white", "brown", "laundry", "dish", "orange", "apple", "greek", "shredded", "cheddar",
+    "mozzarella", "sliced", "ground", "sourdough", "wheat", "vegetable", "olive", "oil", "unsalted",
+    "salted", "chocolate", "vanilla", "strawberry", "sugar", "salt", "peanut", "sparkling", "spring",
+    "paper", "towels", "toilet", "tissue", "softener", "bleach", "cage", "grade", "frozen", "pizza",
+)
+
+# Not counted as evidence either way ("the", "for", ... as in is_general_query)
+FILLER_WORDS = frozenset(("the", "a", "an", "and", "or", "of", "for", "with", "in", "on", "at"))
+
+# Queries extracted locally at or above this confidence skip the LLM; above 1 disables
+LOCAL_EXTRACT_MIN_CONFIDENCE = float(os.environ.get("LOCAL_EXTRACT_MIN_CONFIDENCE", "0.9"))
+BRAND_LEXICON_PATH = os.environ.get("BRAND_LEXICON_PATH", DEFAULT_LEXICON_PATH)
+
+class LocalExtraction(NamedTuple):
+    components: Dict[str, Optional[str]]
+    confidence: float
+
+class LocalExtractor:
+    """Rule-based brand/item/quantity extraction for simple queries.
+
+    Quantities come from the unit engine's regex, brands from the lexicon
+    (longest phrase, leftmost first) and the item is what remains. The
+    confidence is the share of query words accounted for: brand words, the
+    quantity and known item words. Queries without an item score 0.
+    """
+
+    def __init__(self, lexicon: BrandLexicon, min_confidence: float = LOCAL_EXTRACT_MIN_CONFIDENCE):
+        self.lexicon = lexicon
+        self.min_confidence = min_confidence
+        self.confident = 0
+        self.deferred = 0
+
+    def extract(self, query: str) -> LocalExtraction:
+        text = (query or "").lower()
+        matches = list(_QUANTITY_RE.finditer(text))
+        quantity = " ".join(m.group(0).strip() for m in matches) or None
+        if quantity is not None and parse_quantity(quantity) is None:
+            quantity = None
+        for m in reversed(matches):
+            text = text[:m.start()] + " " * (m.end() - m.start()) + text[m.end():]
+
+        tokens = lexicon_tokens(text)
+        keys = [k for k, _, _ in tokens]
+        found = self.lexicon.find_brand(keys)
+        brand = text[tokens[found[0]][1]:tokens[found[1] - 1][2]] if found else None
+        item_tokens = [t for i, t in enumerate(tokens) if not (found and found[0] <= i < found[1])]
+        while item_tokens and item_tokens[0][0] in FILLER_WORDS:
+            item_tokens.pop(0)
+        while item_tokens and item_tokens[-1][0] in FILLER_WORDS:
+            item_tokens.pop()
+        item = " ".join(text[a:b] for _, a, b in item_tokens) or None
+
+        components = {"brand": brand, "item": item, "quantity": quantity}
+        if item is None:
+            return LocalExtraction(components, 0.0)
+        words = [k for k, _, _ in item_tokens if k not in FILLER_WORDS]
+        brand_words = (found[1] - found[0]) if found else 0
+        explained = brand_words + (quantity is not None) + sum(self.lexicon.is_item_word(k) for k in words)
+        total = brand_words + (quantity is not None) + len(words)
+        return LocalExtraction(components, explained / total)
+
+    def confident_components(self, query: str) -> Optional[Dict[str, Optional[str]]]:
+        """Local components when confident enough to skip the LLM, else None."""
+        local = self.extract(query)
+        if local.confidence >= self.min_confidence:
+            self.confident += 1
+            logger.info(f"🧩 Local extraction for '{query}' (confidence {local.confidence:.2f}): {local.components}")
+            return local.components
+        self.deferred += 1
+        logger.info(f"🧩 Local extraction not confident for '{query}' ({local.confidence:.2f}); asking the LLM")
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.confident + self.deferred
+        return {
+            **self.lexicon.stats(),
+            "min_confidence": self.min_confidence,
+            "local": self.confident,
+            "deferred_to_llm": self.deferred,
+            "llm_calls_avoided_rate": (self.confident / total) if total else 0.0,
+        }
+
+def build_local_extractor(path: Optional[str] = BRAND_LEXICON_PATH) -> LocalExtractor:
+    """Extractor over the mined lexicon at ``path`` plus the built-in seeds."""
+    lexicon = load_lexicon(path)
+    mined = len(lexicon.brands)
+    lexicon.add_brands(SEED_BRANDS)
+    lexicon.add_items(ITEM_WORDS)
+    lexicon.add_items(term for terms in BASIC_CATEGORIES.values() for term in terms)
+    if mined:
+        logger.info(f"📚 Loaded brand lexicon {path}: {mined} mined brands, {len(lexicon.items)} item words")
+    return LocalExtractor(lexicon)
+
+_LOCAL_EXTRACTOR = build_local_extractor()
+
 def title_contains_token(title_lower: str, token: Optional[str]) -> bool:
     if not token:
         return False
     return token.lower() in title_lower
 
-def title_matches_quantity_liters(title: str, desired_liters: Optional[float], tolerance: float = 0.15) -> bool:
-    if desired_liters is None:
-        return False
-    liters_in_title = parse_volume_to_liters(title)
-    if liters_in_title is None:
-        return False
-    # within tolerance (e.g., 15%)
-    diff = abs(liters_in_title - desired_liters)
-    return diff <= (tolerance * desired_liters)
+def title_matches_quantity(title: str, desired: Optional[Quantity], tolerance: float = 0.15) -> bool:
+    return quantities_match(parse_quantity(title), desired, tolerance)
 
-def pick_lowest_price(products: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
-    priced = [p for p in products if isinstance(p.get("extractedPrice"), (int, float))]
-    if not priced:
-        return None
-    return min(priced, key=lambda x: float(x.get("extractedPrice", 9e9)))
+def _priority_columns(store_products: List[Dict[str, Any]], item: Optional[str], brand: Optional[str],
+                      quantity: Optional[Quantity], tolerance: float = 0.15) -> Tuple[np.ndarray, ...]:
+    """Per-product columns for the priority conditions, each title parsed once.
 
-def select_by_priority_conditions(store_products: List[Dict[str, Any]], item: Optional[str], brand: Optional[str], quantity_liters: Optional[float]) -> Optional[Dict[str, Any]]:
+    Returns boolean ``item_hit``, ``brand_hit`` and ``qty_hit`` masks and a
+    float ``price`` column (NaN where extractedPrice is not a number).
+    """
+    n = len(store_products)
+    titles = [p.get("title", "") for p in store_products]
+    lowered = [t.lower() for t in titles]
+    item_hit = np.fromiter((title_contains_token(tl, item) for tl in lowered), dtype=bool, count=n)
+    brand_hit = np.fromiter((title_contains_token(tl, brand) for tl in lowered), dtype=bool, count=n)
+    if quantity is None:
+        qty_hit = np.zeros(n, dtype=bool)
+    else:
+        qty_hit = np.fromiter((title_matches_quantity(t, quantity, tolerance) for t in titles), dtype=bool, count=n)
+    price = np.array([
+        float(v) if isinstance(v, (int, float)) else np.nan
+        for v in (p.get("extractedPrice") for p in store_products)
+    ], dtype=np.float64)
+    return item_hit, brand_hit, qty_hit, price
+
+def select_by_priority_conditions(store_products: List[Dict[str, Any]], item: Optional[str], brand: Optional[str], quantity_liters: Optional[float],
+                                  quantity: Optional[Quantity] = None) -> Optional[Dict[str, Any]]:
     """
     Implements the four cases and their priority matching conditions.
     Returns the selected product or None if no match.
-    """
-    titles = [(p, p.get("title", ""), p.get("title", "").lower()) for p in store_products]
-
-    def filt(cond_fn):
-        return [p for (p, t, tl) in titles if cond_fn(p, t, tl)]
 
+    ``quantity`` (any dimension, see parse_quantity) takes precedence over
+    ``quantity_liters``. Titles are preprocessed once into columns; each
+    condition is a boolean mask and the cheapest product under the first
+    non-empty mask wins.
+    """
+    if quantity is None:
+        quantity = quantity_from_liters(quantity_liters)
     has_item = bool(item)
     has_brand = bool(brand)
-    has_qty = quantity_liters is not None
+    has_qty = quantity is not None
+
+    if not store_products or not (has_item or has_brand or has_qty):
+        # Nothing present; do not select here
+        return None
+
+    i, b, q, price = _priority_columns(store_products, item, brand, quantity)
+    priced = ~np.isnan(price)
+    everything = np.ones(len(store_products), dtype=bool)
 
-    # Highest priority case: brand AND item AND quantity
     if has_item and has_brand and has_qty:
-        # 1) item AND brand AND quantity
-        r = filt(lambda p, t, tl: title_contains_token(tl, item) and title_contains_token(tl, brand) and title_matches_quantity_liters(t, quantity_liters))
-        pick = pick_lowest_price(r)
-        if pick:
-            return pick
-        # 2) (item OR brand) AND quantity
-        r = filt(lambda p, t, tl: (title_contains_token(tl, item) or title_contains_token(tl, brand)) and title_matches_quantity_liters(t, quantity_liters))
-        pick = pick_lowest_price(r)
-        if pick:
-            return pick
-        # 3) item AND (brand OR quantity)
-        r = filt(lambda p, t, tl: title_contains_token(tl, item) and (title_contains_token(tl, brand) or title_matches_quantity_liters(t, quantity_liters)))
-        pick = pick_lowest_price(r)
-        if pick:
-            return pick
-        # 4) item OR brand OR quantity
-        r = filt(lambda p, t, tl: title_contains_token(tl, item) or title_contains_token(tl, brand) or title_matches_quantity_liters(t, quantity_liters))
-        pick = pick_lowest_price(r)
-        if pick:
-            return pick
-        # 5) fallback: cheapest overall
-        return pick_lowest_price(store_products)
-
-    # Second case: item AND brand
-    if has_item and has_brand and not has_qty:
-        # 1) item AND brand
-        r = filt(lambda p, t, tl: title_contains_token(tl, item) and title_contains_token(tl, brand))
-        pick = pick_lowest_price(r)
-        if pick:
-            return pick
-        # 2) item OR brand
-        r = filt(lambda p, t, tl: title_contains_token(tl, item) or title_contains_token(tl, brand))
-        pick = pick_lowest_price(r)
-        if pick:
-            return pick
-        # 3) fallback: cheapest
-        return pick_lowest_price(store_products)
-
-    # Third case: item AND quantity
-    if has_item and has_qty and not has_brand:
-        # 1) item AND quantity
-        r = filt(lambda p, t, tl: title_contains_token(tl, item) and title_matches_quantity_liters(t, quantity_liters))
-        pick = pick_lowest_price(r)
-        if pick:
-            return pick
-        # 2) item OR quantity
-        r = filt(lambda p, t, tl: title_contains_token(tl, item) or title_matches_quantity_liters(t, quantity_liters))
-        pick = pick_lowest_price(r)
-        if pick:
-            return pick
-        # 3) fallback: cheapest
-        return pick_lowest_price(store_products)
-
-    # Fourth case: only one of item/brand/quantity present
-    if has_item or has_brand or has_qty:
-        r = filt(lambda p, t, tl: (
-            (has_item and title_contains_token(tl, item)) or
-            (has_brand and title_contains_token(tl, brand)) or
-            (has_qty and title_matches_quantity_liters(t, quantity_liters))
-        ))
-        pick = pick_lowest_price(r)
-        if pick:
-            return pick
-        return pick_lowest_price(store_products)
-
-    # Nothing present; do not select here
+        # Highest priority case: brand AND item AND quantity
+        conditions = [
+            i & b & q,      # 1) item AND brand AND quantity
+            (i | b) & q,    # 2) (item OR brand) AND quantity
+            i & (b | q),    # 3) item AND (brand OR quantity)
+            i | b | q,      # 4) item OR brand OR quantity
+        ]
+    elif has_item and has_brand:
+        # Second case: item AND brand
+        conditions = [i & b, i | b]
+    elif has_item and has_qty:
+        # Third case: item AND quantity
+        conditions = [i & q, i | q]
+    else:
+        # Fourth case: only one of item/brand/quantity present (absent ones are all-False)
+        conditions = [i | b | q]
+    # fallback: cheapest overall
+    conditions.append(everything)
+
+    for mask in conditions:
+        idx = np.flatnonzero(mask & priced)
+        if len(idx):
+            # lowest price; argmin keeps the first product on ties
+            return store_products[int(idx[np.argmin(price[idx])])]
     return None
 
 def compute_price_per_liter(price: float, liters: Optional[float]) -> Optional[float]:
@@ -516,29 +1037,263 @@ def partial_score(q: str, title: str) -> float:
     """Partial ratio normalized"""
     return fuzz.partial_ratio(q, title) / 100.0
 
-def embedding_score(q: str, title: str) -> float:
-    """Return cosine similarity via SBERT if available; else return 0.0
-    Normalized to 0..1 where 0 = orthogonal and 1 = identical.
+# Batch fuzzy scoring: below FUZZY_SCORE_CUTOFF (0..1) a score short-circuits to 0;
+# FUZZY_WORKERS threads (-1 = all cores) are used once a batch has FUZZY_PARALLEL_MIN titles
+FUZZY_SCORE_CUTOFF = float(os.environ.get("FUZZY_SCORE_CUTOFF", "0"))
+FUZZY_WORKERS = int(os.environ.get("FUZZY_WORKERS", "-1"))
+FUZZY_PARALLEL_MIN = int(os.environ.get("FUZZY_PARALLEL_MIN", "256"))
+
+def fuzzy_scores(q: str, titles: List[str], score_cutoff: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """token_set and partial ratios of one query against many titles, normalized to 0..1.
+
+    Uses rapidfuzz.process.cdist so the whole batch is scored in C (and
+    multi-threaded for large batches). Titles scoring below ``score_cutoff``
+    are reported as 0.0 without finishing the comparison.
+    """
+    if not titles:
+        return np.zeros(0), np.zeros(0)
+    cutoff = (FUZZY_SCORE_CUTOFF if score_cutoff is None else score_cutoff) * 100.0
+    workers = FUZZY_WORKERS if len(titles) >= FUZZY_PARALLEL_MIN else 1
+    tok = process.cdist([q], titles, scorer=fuzz.token_set_ratio, dtype=np.float64,
+                        workers=workers, score_cutoff=cutoff or None)[0]
+    part = process.cdist([q], titles, scorer=fuzz.partial_ratio, dtype=np.float64,
+                         workers=workers, score_cutoff=cutoff or None)[0]
+    return tok / 100.0, part / 100.0
+
+# ------------------------ Embedding Cache ------------------------
+
+class EmbeddingCache:
+    """Thread-safe LRU cache of title embeddings bounded by a memory budget.
+
+    Keys are ``normalize_text(title)`` so cosmetic differences in HasData titles
+    share one entry. Only the vector bytes count towards the budget.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, key: str, vec: np.ndarray) -> None:
+        if self.max_bytes <= 0 or vec.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = vec
+            self._bytes += vec.nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+# Memory budget for cached title vectors (MiniLM: 384 float32 = 1.5 KB per title)
+_EMBED_CACHE = EmbeddingCache(int(float(os.environ.get("EMBED_CACHE_MAX_MB", "64")) * 1024 * 1024))
+
+def _open_embedding_store(model) -> Optional[EmbeddingStore]:
+    """Open the on-disk embedding store named by EMBED_STORE_DIR, if any."""
+    path = (os.environ.get("EMBED_STORE_DIR") or "").strip()
+    if not path or model is None:
+        return None
+    try:
+        store = EmbeddingStore(
+            path,
+            dim=model.get_sentence_embedding_dimension(),
+            model_name=embedding_backends.model_id(EMBED_MODEL_NAME, EMBED_BACKEND),
+            dtype=os.environ.get("EMBED_STORE_DTYPE", "float16"),
+            writable=os.environ.get("EMBED_STORE_READONLY", "").lower() not in ("1", "true", "yes"),
+        )
+        logger.info(f"✅ Embedding store opened at {path} ({len(store)} titles)")
+        return store
+    except Exception as e:
+        logger.warning(f"⚠️ Could not open embedding store at {path}: {e}")
+        return None
+
+_EMBED_STORE: Optional[EmbeddingStore] = None
+
+# ------------------------ Model Loading ------------------------
+
+# Optional embeddings for better semantic matching. The model itself is loaded
+# in the background after startup (see load_embedding_model); until then the
+# scorer uses the TF-IDF fallback. EMBED_BACKEND picks the inference runtime.
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "torch").strip().lower()
+EMBED_ONNX_DIR = os.environ.get("EMBED_ONNX_DIR") or embedding_backends.DEFAULT_ONNX_DIR
+USE_EMBEDDINGS = embedding_backends.backend_available(EMBED_BACKEND)
+_EMBED_MODEL = None
+if not USE_EMBEDDINGS:
+    logger.warning(f"Embedding backend '{EMBED_BACKEND}' not available, using TF-IDF fallback")
+
+_MODEL_STATE = "loading" if USE_EMBEDDINGS else "unavailable"
+_MODEL_LOCK = threading.Lock()
+_MODEL_TIMINGS: Dict[str, float] = {}
+
+def embeddings_ready() -> bool:
+    """True once the embedding model is loaded and warmed up."""
+    return _EMBED_MODEL is not None
+
+def service_ready() -> bool:
+    """Readiness: the model is ready, or will never be (TF-IDF only)."""
+    return _MODEL_STATE != "loading"
+
+def load_embedding_model() -> bool:
+    """Load and warm up the configured embedding backend, then publish it.
+
+    Safe to call from several threads; only the first call does the work.
+    The model is published only after a dummy batch has run, so requests
+    keep using the TF-IDF path instead of paying first-call latency.
     """
+    global _EMBED_MODEL, _EMBED_STORE, _MODEL_STATE
+    if not USE_EMBEDDINGS:
+        return False
+    with _MODEL_LOCK:
+        if _MODEL_STATE != "loading":
+            return _MODEL_STATE == "ready"
+        try:
+            t0 = time.perf_counter()
+            model = embedding_backends.create_backend(EMBED_BACKEND, EMBED_MODEL_NAME, EMBED_ONNX_DIR)
+            t1 = time.perf_counter()
+            model.encode(["whole milk 1 gallon", "great value large white eggs 12 ct"])
+            t2 = time.perf_counter()
+            _EMBED_STORE = _open_embedding_store(model)
+            _EMBED_MODEL = model
+            _MODEL_STATE = "ready"
+            _MODEL_TIMINGS.update({
+                "load_ms": (t1 - t0) * 1000,
+                "warmup_ms": (t2 - t1) * 1000,
+                "import_to_ready_ms": (t2 - _IMPORT_STARTED) * 1000,
+            })
+            logger.info(
+                f"✅ Embedding model ready ({EMBED_BACKEND}): load {_MODEL_TIMINGS['load_ms']:.0f}ms, "
+                f"warm-up {_MODEL_TIMINGS['warmup_ms']:.0f}ms, "
+                f"import-to-ready {_MODEL_TIMINGS['import_to_ready_ms']:.0f}ms"
+            )
+            return True
+        except Exception as e:
+            _MODEL_STATE = "failed"
+            _MODEL_TIMINGS["import_to_ready_ms"] = (time.perf_counter() - _IMPORT_STARTED) * 1000
+            logger.error(f"❌ Embedding model failed to load, staying on TF-IDF fallback: {e}", exc_info=True)
+            return False
+
+def warm_caches() -> None:
+    """Run one representative match so lazy imports, compiled regexes and
+    vectorizer code paths are initialised before workers are forked."""
+    sample = [
+        {"title": "Great Value Whole Milk 1 gal", "extractedPrice": 2.57, "source": "Walmart"},
+        {"title": "Good & Gather Whole Milk 1 gal", "extractedPrice": 2.69, "source": "Target"},
+        {"title": "Horizon Organic Whole Milk 64 fl oz", "extractedPrice": 4.99, "source": "Kroger"},
+    ]
+    try:
+        select_best_product("great value whole milk 1 gallon", sample)
+    except Exception as e:
+        logger.warning(f"⚠️ Cache warm-up failed: {e}")
+
+def start_background_model_load() -> None:
+    """Kick off load_embedding_model on a daemon thread if it is still pending."""
+    if _MODEL_STATE == "loading":
+        threading.Thread(target=load_embedding_model, name="embed-model-loader", daemon=True).start()
+
+def encode_texts(texts: List[str]) -> np.ndarray:
+    """Encode texts through the embedding cache and persistent store.
+
+    Lookups go LRU cache -> on-disk store -> model. All remaining misses are
+    encoded in a single batched model call and written back to both tiers.
+    Returns a float32 matrix with one row per text.
+    """
+    keys = [normalize_text(t) for t in texts]
+    rows: List[Optional[np.ndarray]] = [_EMBED_CACHE.get(k) for k in keys]
+    missing: Dict[str, List[int]] = {}
+    for i, (k, row) in enumerate(zip(keys, rows)):
+        if row is None:
+            missing.setdefault(k, []).append(i)
+
+    if missing and _EMBED_STORE is not None:
+        try:
+            stored = _EMBED_STORE.get_many(list(missing.keys()))
+        except Exception as e:
+            logger.warning(f"Embedding store lookup failed: {e}")
+            stored = [None] * len(missing)
+        for k, vec in zip(list(missing.keys()), stored):
+            if vec is not None:
+                _EMBED_CACHE.put(k, vec)
+                for i in missing.pop(k):
+                    rows[i] = vec
+
+    if missing:
+        to_encode = [texts[idxs[0]] for idxs in missing.values()]
+        vecs = np.asarray(_EMBED_MODEL.encode(to_encode), dtype=np.float32)
+        for (k, idxs), vec in zip(missing.items(), vecs):
+            _EMBED_CACHE.put(k, vec)
+            for i in idxs:
+                rows[i] = vec
+        if _EMBED_STORE is not None:
+            try:
+                _EMBED_STORE.add_many(list(missing.keys()), vecs)
+            except Exception as e:
+                logger.warning(f"Embedding store write failed: {e}")
+    return np.vstack(rows)
+
+def embedding_scores(query: str, titles: List[str]) -> List[float]:
+    """Cosine similarity of one query against many titles.
+
+    Encodes the query once and all titles in a single model call, then computes
+    cosine similarity as one matrix-vector product. Returns [0,1]-mapped scores
+    in the same order as ``titles``; all zeros if embeddings are unavailable.
+    """
+    if not titles:
+        return []
     if not USE_EMBEDDINGS or _EMBED_MODEL is None:
-        return 0.0
+        return [0.0] * len(titles)
     try:
-        q_vec = _EMBED_MODEL.encode([q])[0]
-        t_vec = _EMBED_MODEL.encode([title])[0]
-        # cosine similarity
-        dot = float((q_vec * t_vec).sum())
-        qn = float((q_vec * q_vec).sum()) ** 0.5
-        tn = float((t_vec * t_vec).sum()) ** 0.5
-        if qn == 0 or tn == 0:
-            return 0.0
-        cos = dot / (qn * tn)
-        # clip
-        cos = max(-1.0, min(1.0, cos))
-        # map from [-1,1] to [0,1]
-        return (cos + 1.0) / 2.0
+        vecs = encode_texts([query] + list(titles))
+        q_vec, t_mat = vecs[0], vecs[1:]
+        qn = float(np.linalg.norm(q_vec))
+        tn = np.linalg.norm(t_mat, axis=1)
+        if qn == 0:
+            return [0.0] * len(titles)
+        denom = tn * qn
+        cos = np.divide(t_mat @ q_vec, denom, out=np.zeros(len(titles), dtype=np.float32), where=denom > 0)
+        cos = np.clip(cos, -1.0, 1.0)
+        sims = (cos + 1.0) / 2.0
+        # a zero-norm vector scores 0.0, not 0.5
+        sims[denom <= 0] = 0.0
+        return [float(s) for s in sims]
     except Exception as e:
-        logger.warning(f"Embedding computation failed: {e}")
-        return 0.0
+        logger.warning(f"Batched embedding computation failed: {e}")
+        return [0.0] * len(titles)
 
 def tfidf_scores(query: str, titles: List[str]) -> List[float]:
     """TF-IDF fallback for embedding when embeddings not available"""
@@ -554,60 +1309,138 @@ def tfidf_scores(query: str, titles: List[str]) -> List[float]:
         logger.warning(f"TF-IDF computation failed: {e}")
         return [0.0] * len(titles)
 
-def compute_features_for_candidate(query: str, candidate: Dict[str, Any]) -> Dict[str, Any]:
-    """Compute all features for a single candidate product."""
-    title = normalize_text(candidate.get("title", ""))
-    q = normalize_text(query)
+# Embeddings are computed only for the stage-1 (RapidFuzz) top-K; 0 disables the cascade
+CASCADE_TOP_K = int(os.environ.get("CASCADE_TOP_K", "16"))
 
-    tok_set = token_set_score(q, title)
-    part = partial_score(q, title)
-    emb = embedding_score(q, title) if USE_EMBEDDINGS else 0.0
+DEFAULT_WEIGHTS = {"token_set": 0.50, "embed": 0.30, "partial": 0.15, "brand": 0.05}
 
-    # price & unit
-    price = candidate.get("extractedPrice")
-    liters = parse_volume_to_liters(candidate.get("title", ""))
-    p_per_l = compute_price_per_liter(price, liters) if price is not None else None
+# ------------------------ Columnar Features ------------------------
 
-    # attribute matches (brand naive): check if brand token exists in title
-    brand = candidate.get("source")
-    brand_match = 1.0 if brand and brand.lower() in title else 0.0
+# Column layout of FeatureBlock.X. The first four are the scored similarity
+# signals, in the order FeatureBlock.scores adds them up.
+FEATURE_COLUMNS = ("token_set", "embed", "partial", "brand_match", "price", "liters", "price_per_liter",
+                   "quantity", "price_per_unit")
+(COL_TOKEN_SET, COL_EMBED, COL_PARTIAL, COL_BRAND, COL_PRICE, COL_LITERS, COL_PPL,
+ COL_QTY, COL_PPU) = range(len(FEATURE_COLUMNS))
+N_SCORED_COLUMNS = 4
 
-    return {
-        "candidate": candidate,
-        "title_norm": title,
-        "token_set": tok_set,
-        "partial": part,
-        "embed": emb,
-        "price": price,
-        "liters": liters,
-        "price_per_liter": p_per_l,
-        "brand_match": brand_match,
-    }
+def weight_vector(weights: Dict[str, float]) -> np.ndarray:
+    """Weights aligned with the scored FEATURE_COLUMNS (DEFAULT_WEIGHTS for missing keys)."""
+    return np.array([
+        weights.get("token_set", 0.50),
+        weights.get("embed", 0.30),
+        weights.get("partial", 0.15),
+        weights.get("brand", 0.05),
+    ], dtype=np.float64)
 
-def normalize_component(x: Optional[float], default: float = 0.0) -> float:
-    """Normalize component to 0-1 range."""
-    if x is None:
-        return default
-    if math.isnan(x):
-        return default
-    return float(max(0.0, min(1.0, x)))
-
-def compute_final_score(feat: Dict[str, Any], weights: Dict[str, float]) -> float:
-    """Compute final weighted score from features."""
-    # ensure normalized pieces
-    token = normalize_component(feat.get("token_set", 0.0))
-    part = normalize_component(feat.get("partial", 0.0))
-    emb = normalize_component(feat.get("embed", 0.0))
-    brand = normalize_component(feat.get("brand_match", 0.0))
-
-    # Heavily weight query matching - this is the most important factor
-    score = (
-        weights.get("token_set", 0.50) * token  # Increased from 0.35 to 0.50
-        + weights.get("embed", 0.30) * emb     # Increased from 0.25 to 0.30
-        + weights.get("partial", 0.15) * part  # Keep same
-        + weights.get("brand", 0.05) * brand   # Reduced from 0.10 to 0.05
-    )
-    return float(score)
+def _as_float(x: Any) -> float:
+    try:
+        return float(x) if x is not None else math.nan
+    except (TypeError, ValueError):
+        return math.nan
+
+class FeatureBlock:
+    """Struct-of-arrays features for one query against a list of candidates.
+
+    ``X`` holds one row per candidate and one column per FEATURE_COLUMNS entry;
+    missing values (no price, no parsed size, embedding not computed) are
+    NaN. ``embedded`` marks rows whose embedding column has been filled in;
+    ``quantities`` holds each title's parsed ``Quantity``.
+    Per-candidate dicts are only built on demand by ``feature_dict``.
+    """
+
+    def __init__(self, query: str, candidates: List[Dict[str, Any]]):
+        self.query = query
+        self.query_norm = normalize_text(query)
+        self.candidates = candidates
+        self.titles = [normalize_text(c.get("title", "")) for c in candidates]
+        n = len(candidates)
+        self.X = np.full((n, len(FEATURE_COLUMNS)), np.nan, dtype=np.float64)
+        self.embedded = np.zeros(n, dtype=bool)
+        self.quantities = [parse_quantity(c.get("title", "")) for c in candidates]
+
+        tok, part = fuzzy_scores(self.query_norm, self.titles)
+        self.X[:, COL_TOKEN_SET] = tok
+        self.X[:, COL_PARTIAL] = part
+        for i, (c, title, qty) in enumerate(zip(candidates, self.titles, self.quantities)):
+            brand = c.get("source")
+            self.X[i, COL_BRAND] = 1.0 if brand and brand.lower() in title else 0.0
+            price = c.get("extractedPrice")
+            self.X[i, COL_PRICE] = _as_float(price)
+            if qty is None:
+                continue
+            liters = qty.as_dimension("volume")
+            self.X[i, COL_LITERS] = _as_float(liters)
+            if price is not None and liters:
+                self.X[i, COL_PPL] = _as_float(compute_price_per_liter(price, liters))
+            self.X[i, COL_QTY] = qty.amount
+            self.X[i, COL_PPU] = _as_float(price_per_canonical_unit(price, qty))
+
+    def __len__(self) -> int:
+        return len(self.candidates)
+
+    def set_embed(self, idxs: np.ndarray, sims: List[float]) -> None:
+        self.X[idxs, COL_EMBED] = sims
+        self.embedded[idxs] = True
+
+    def scores(self, weights: Dict[str, float], embed_fill: float = 0.0) -> np.ndarray:
+        """Weighted scores for every row, with each signal NaN-to-0 and clipped to 0..1.
+
+        Rows without an embedding use ``embed_fill`` (1.0 gives an upper bound).
+        """
+        w = weight_vector(weights)
+        S = np.clip(np.nan_to_num(self.X[:, :N_SCORED_COLUMNS], nan=0.0), 0.0, 1.0)
+        S[~self.embedded, COL_EMBED] = embed_fill
+        # accumulate column by column so every row sums its signals in the
+        # same order, whichever rows are rescored
+        out = S[:, 0] * w[0]
+        for j in range(1, N_SCORED_COLUMNS):
+            out = out + S[:, j] * w[j]
+        return out
+
+    def unit_prices(self, rows: np.ndarray) -> Tuple[Optional[str], np.ndarray]:
+        """Comparable price per canonical unit for ``rows`` (NaN where not comparable).
+
+        Uses the dimension most of the rows can be expressed in (volume first
+        on ties), so bare-"oz" titles compare with both gallons and pounds.
+        """
+        best, best_prices, best_count = None, np.full(len(rows), np.nan), 0
+        for dim in DIMENSIONS:
+            prices = np.array([
+                _as_float(price_per_canonical_unit(self.candidates[r].get("extractedPrice"), self.quantities[r], dim))
+                for r in rows
+            ], dtype=np.float64)
+            count = int((~np.isnan(prices)).sum())
+            if count > best_count:
+                best, best_prices, best_count = dim, prices, count
+        return best, best_prices
+
+    def feature_dict(self, i: int, score: float) -> Dict[str, Any]:
+        """The legacy per-candidate feature dict for row ``i``."""
+        c = self.candidates[i]
+        row = self.X[i]
+
+        def opt(v: float) -> Optional[float]:
+            return None if math.isnan(v) else float(v)
+
+        d = {
+            "candidate": c,
+            "title_norm": self.titles[i],
+            "token_set": float(row[COL_TOKEN_SET]),
+            "partial": float(row[COL_PARTIAL]),
+            "embed": opt(row[COL_EMBED]),
+            "price": c.get("extractedPrice"),
+            "liters": opt(row[COL_LITERS]),
+            "price_per_liter": opt(row[COL_PPL]),
+            "unit_dimension": self.quantities[i].dimension if self.quantities[i] else None,
+            "quantity": opt(row[COL_QTY]),
+            "price_per_unit": opt(row[COL_PPU]),
+            "brand_match": float(row[COL_BRAND]),
+            "score": float(score),
+        }
+        if not self.embedded[i]:
+            d["pruned"] = True
+        return d
 
 def is_general_query(query: str) -> bool:
     """
@@ -679,19 +1512,8 @@ def is_general_query(query: str) -> bool:
     
     # 3. Product category detection
     # Check if query contains only basic product categories
-    basic_categories = {
-        'dairy': ['milk', 'cheese', 'butter', 'yogurt', 'cream'],
-        'grains': ['bread', 'cereal', 'rice', 'pasta', 'flour'],
-        'proteins': ['chicken', 'beef', 'fish', 'eggs', 'meat'],
-        'beverages': ['water', 'juice', 'soda', 'coffee', 'tea'],
-        'cleaning': ['detergent', 'soap', 'shampoo', 'toothpaste'],
-        'snacks': ['chips', 'cookies', 'crackers', 'nuts'],
-        'fruits': ['apples', 'bananas', 'oranges', 'fruits'],
-        'vegetables': ['carrots', 'lettuce', 'tomatoes', 'vegetables']
-    }
-    
     query_category = None
-    for category, terms in basic_categories.items():
+    for category, terms in BASIC_CATEGORIES.items():
         if any(term in query_lower for term in terms):
             query_category = category
             break
@@ -815,16 +1637,95 @@ def find_cheapest_relevant_product(query: str, products: List[Dict[str, Any]]) -
     
     return top_product
 
+def _embed_upper_bound(weights: Dict[str, float]) -> float:
+    """Largest amount the embedding term can add to FeatureBlock.scores."""
+    return max(0.0, weights.get("embed", 0.30))
+
+def cascade_shortlist(query: str, candidates: List[Dict[str, Any]],
+                      weights: Optional[Dict[str, float]] = None,
+                      top_k: Optional[int] = None,
+                      block: Optional[FeatureBlock] = None) -> List[Dict[str, Any]]:
+    """Stage 1 of the cascaded ranker: the candidates whose embeddings will be needed.
+
+    Ranks by RapidFuzz/brand score alone and returns the top-K candidates
+    (all of them when the cascade is disabled). Used to prefetch embeddings.
+    ``block``, if already built for these candidates, is ranked instead.
+    """
+    top_k = CASCADE_TOP_K if top_k is None else top_k
+    if top_k <= 0 or len(candidates) <= top_k:
+        return list(candidates)
+    if block is None:
+        block = FeatureBlock(query, candidates)
+    cheap = block.scores(weights or DEFAULT_WEIGHTS)
+    order = np.argsort(-cheap, kind="stable")
+    return [candidates[i] for i in order[:top_k]]
+
+def shortlist_blocks(query: str, groups: List[List[Dict[str, Any]]],
+                     weights: Optional[Dict[str, float]] = None) -> Tuple[List[Optional[FeatureBlock]], List[str]]:
+    """Feature block of every candidate group and the titles of their cascade shortlists.
+
+    The blocks are weight-independent, so scoring reuses them instead of
+    recomputing the features (None for an empty group).
+    """
+    blocks = [FeatureBlock(query, g) if g else None for g in groups]
+    titles = [p.get("title", "") for g, b in zip(groups, blocks) for p in cascade_shortlist(query, g, weights, block=b)]
+    return blocks, titles
+
+def score_block_cascaded(block: FeatureBlock, weights: Dict[str, float],
+                         tie_delta: float, top_k: int) -> np.ndarray:
+    """Score a feature block, embedding only the rows that can matter.
+
+    Stage 1 scores every candidate without the embedding term and bounds it
+    from above by assuming a perfect embedding match. Stage 2 embeds the top-K
+    by that bound, then any other candidate whose bound still reaches the
+    near-top band (top score - tie_delta). Everything left is provably outside
+    the band, so the selection and tie-breaking match full scoring; those rows
+    keep their upper bound as score and stay un-embedded (``pruned``).
+    """
+    # un-embedded rows score as a perfect embedding match (or no match if the weight is <= 0)
+    fill = 1.0 if _embed_upper_bound(weights) > 0 else 0.0
+    upper = block.scores(weights, embed_fill=fill)
+    order = np.argsort(-upper, kind="stable")
+
+    def embed(idxs: np.ndarray) -> None:
+        idxs = idxs[~block.embedded[idxs]]
+        if len(idxs):
+            block.set_embed(idxs, embedding_scores(block.query_norm, [block.titles[i] for i in idxs]))
+
+    first = order if top_k <= 0 else order[:top_k]
+    if len(first) == 0:
+        return upper
+    embed(first)
+    scores = block.scores(weights, embed_fill=fill)
+    top = scores[block.embedded].max()
+    # small epsilon guards the bound against float rounding at the band edge
+    rest = order[len(first):]
+    rest = rest[scores[rest] >= top - tie_delta - 1e-9]
+    if len(rest):
+        embed(rest)
+        scores = block.scores(weights, embed_fill=fill)
+    return scores
+
 def select_best_product(query: str, hasdata_results: List[Dict[str, Any]],
                         weights: Optional[Dict[str, float]] = None,
                         conf_threshold: float = 0.30,  # Lowered default threshold
-                        tie_delta: float = 0.10) -> Dict[str, Any]:  # Increased tie delta
-    """Main product selection algorithm."""
-    if weights is None:
-        weights = {"token_set": 0.50, "embed": 0.30, "partial": 0.15, "brand": 0.05}
+                        tie_delta: float = 0.10,  # Increased tie delta
+                        cascade_top_k: Optional[int] = None,
+                        include_candidates: bool = True,
+                        general: Optional[bool] = None,
+                        block: Optional[FeatureBlock] = None) -> Dict[str, Any]:
+    """Main product selection algorithm.
+
+    ``cascade_top_k`` overrides CASCADE_TOP_K (see score_block_cascaded).
+    Pass ``include_candidates=False`` when the caller does not need the
+    per-candidate feature dicts in ``all_candidates``, and ``general`` when
+    ``is_general_query(query)`` is already known. ``block`` is a FeatureBlock
+    already built for ``query`` and ``hasdata_results``; it is rescored
+    rather than rebuilt (see select_from_block).
+    """
 
     # Check if this is a general query - if so, prioritize cheapest products
-    is_general = is_general_query(query)
+    is_general = is_general_query(query) if general is None else general
     
     if is_general:
         logger.info(f"🎯 General query detected: '{query}' - prioritizing cheapest products")
@@ -841,61 +1742,383 @@ def select_best_product(query: str, hasdata_results: List[Dict[str, Any]],
         else:
             return {"selected": None, "reason": "no_relevant_products_for_general_query"}
 
-    feats = [compute_features_for_candidate(query, c) for c in hasdata_results]
-
-    # If embeddings disabled, compute TF-IDF embedding substitutes
-    if not USE_EMBEDDINGS:
-        titles = [f["title_norm"] for f in feats]
-        tfidf_sims = tfidf_scores(normalize_text(query), titles)
-        for f, s in zip(feats, tfidf_sims):
-            f["embed"] = s
-
-    # compute scores
-    for f in feats:
-        f["score"] = compute_final_score(f, weights)
+    if not hasdata_results:
+        return {"selected": None, "reason": "no_candidates"}
 
-    # sort by score desc
-    feats.sort(key=lambda x: x["score"], reverse=True)
+    # Cheap features first; the embedding column is filled in below
+    if block is None:
+        block = FeatureBlock(query, hasdata_results)
+    return select_from_block(block, weights, conf_threshold, tie_delta, cascade_top_k, include_candidates)
 
-    if not feats:
-        return {"selected": None, "reason": "no_candidates"}
+def select_from_block(block: FeatureBlock, weights: Optional[Dict[str, float]] = None,
+                      conf_threshold: float = 0.30, tie_delta: float = 0.10,
+                      cascade_top_k: Optional[int] = None,
+                      include_candidates: bool = True) -> Dict[str, Any]:
+    """Score a feature block under ``weights`` and pick the best candidate.
 
-    top_score = feats[0]["score"]
-    # collect near-top candidates
-    near_top = [f for f in feats if (top_score - f["score"]) <= tie_delta]
+    The block keeps every embedding computed by an earlier pass, so
+    rescoring it under another weight profile is a weighted sum plus
+    whatever rows the new cascade band adds.
+    """
+    if weights is None:
+        weights = dict(DEFAULT_WEIGHTS)
+    if cascade_top_k is None:
+        cascade_top_k = CASCADE_TOP_K
 
-    # if multiple near_top, prefer the one with explicit price_per_liter (lowest) else absolute price
+    if embeddings_ready():
+        # Embed the query once and the shortlisted titles in one batch
+        scores = score_block_cascaded(block, weights, tie_delta, cascade_top_k)
+    else:
+        # Embeddings disabled or still loading: TF-IDF substitutes. The vectorizer
+        # is fit on every title, so this path is not pruned (IDF would shift).
+        if not block.embedded.all():
+            block.set_embed(np.arange(len(block)), tfidf_scores(block.query_norm, block.titles))
+        scores = block.scores(weights)
+
+    # sort by score desc (stable, like list.sort)
+    order = np.argsort(-scores, kind="stable")
+    ranked = scores[order]
+    top_score = ranked[0]
+    # collect near-top candidates (positions in ranked order)
+    near_top = np.flatnonzero((top_score - ranked) <= tie_delta)
+
+    # if multiple near_top, prefer the lowest price per liter / kg / item, else absolute price
     if len(near_top) > 1:
-        # prefer candidates with price_per_liter defined
-        with_ppl = [f for f in near_top if f.get("price_per_liter") is not None]
-        if with_ppl:
-            # choose min price_per_liter
-            chosen = min(with_ppl, key=lambda x: x["price_per_liter"])
-            reason = "tie_broken_by_price_per_liter"
-        else:
+        rows = order[near_top]
+        dimension, ppu = block.unit_prices(rows)
+        price = block.X[rows, COL_PRICE]
+        if dimension is not None:
+            # choose min price per canonical unit (first in rank order on ties)
+            pos = near_top[np.nanargmin(ppu)]
+            reason = f"tie_broken_by_price_per_{CANONICAL_UNITS[dimension]}"
+        elif not np.isnan(price).all():
             # fallback to absolute price
-            candidates_with_price = [f for f in near_top if f.get("price") is not None]
-            if candidates_with_price:
-                chosen = min(candidates_with_price, key=lambda x: x["price"])
-                reason = "tie_broken_by_abs_price"
-            else:
-                chosen = near_top[0]
-                reason = "tie_kept_top"
+            pos = near_top[np.nanargmin(price)]
+            reason = "tie_broken_by_abs_price"
+        else:
+            pos = near_top[0]
+            reason = "tie_kept_top"
     else:
-        chosen = near_top[0]
+        pos = near_top[0]
         reason = "top_single"
 
-    confidence = chosen["score"]
+    chosen = int(order[pos])
+    confidence = float(scores[chosen])
     low_confidence = confidence < conf_threshold
 
     return {
-        "selected": chosen.get("candidate"),
-        "score": chosen.get("score"),
+        "selected": block.candidates[chosen],
+        "score": confidence,
         "confidence_ok": not low_confidence,
         "reason": reason,
-        "all_candidates": feats,
+        "all_candidates": [block.feature_dict(int(i), scores[i]) for i in order] if include_candidates else [],
     }
 
+# ------------------------ Embedding Batcher ------------------------
+
+class Histogram:
+    """Fixed-bucket counter histogram; bucket ``le`` bounds are inclusive."""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, le in enumerate(self.buckets):
+            if value <= le:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.total,
+            "mean": (self.sum / self.total) if self.total else 0.0,
+        }
+
+class EmbeddingBatcher:
+    """Coalesces encode requests from concurrent handlers into one model call.
+
+    Requests queue up until ``max_batch_size`` texts are pending or
+    ``max_wait_ms`` has elapsed since the first one arrived; the combined batch
+    then runs through ``encode_texts`` on a dedicated thread so the event loop
+    keeps serving other requests, and each caller's future gets its own rows.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._pending: List[Tuple[List[str], "asyncio.Future"]] = []
+        self._pending_texts = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-batcher")
+        self.queue_depth_hist = Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256])
+        self.batch_size_hist = Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256])
+        self.batches = 0
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        """Return a float32 matrix with one row per text."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((list(texts), fut))
+        self._pending_texts += len(texts)
+        self.queue_depth_hist.observe(self._pending_texts)
+        if self._pending_texts >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_texts = self._pending, [], 0
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[List[str], "asyncio.Future"]]) -> None:
+        texts = [t for ts, _ in batch for t in ts]
+        self.batches += 1
+        self.batch_size_hist.observe(len(texts))
+        try:
+            vecs = await asyncio.get_running_loop().run_in_executor(self._executor, encode_texts, texts)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        offset = 0
+        for ts, fut in batch:
+            if not fut.done():
+                fut.set_result(vecs[offset:offset + len(ts)])
+            offset += len(ts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "pending_texts": self._pending_texts,
+            "batches": self.batches,
+            "queue_depth": self.queue_depth_hist.snapshot(),
+            "batch_size": self.batch_size_hist.snapshot(),
+        }
+
+_EMBED_BATCHER: Optional[EmbeddingBatcher] = None
+if USE_EMBEDDINGS and os.environ.get("EMBED_BATCHING", "1").lower() not in ("0", "false", "no"):
+    _EMBED_BATCHER = EmbeddingBatcher(
+        max_batch_size=int(os.environ.get("EMBED_BATCH_MAX_SIZE", "128")),
+        max_wait_ms=float(os.environ.get("EMBED_BATCH_MAX_WAIT_MS", "5")),
+    )
+
+async def prefetch_embeddings(texts: List[str]) -> None:
+    """Encode texts via the cross-request batcher so they land in the embedding cache.
+
+    The synchronous scorer (``select_best_product``) then finds every vector in
+    the cache instead of running the model on the event loop. No-op when
+    batching or the cache is disabled, in which case scoring encodes inline.
+    """
+    if _EMBED_BATCHER is None or _EMBED_CACHE.max_bytes <= 0 or not texts or not embeddings_ready():
+        return
+    try:
+        await _EMBED_BATCHER.encode(list(dict.fromkeys(normalize_text(t) for t in texts)))
+    except Exception as e:
+        logger.warning(f"Embedding prefetch failed, scoring will encode inline: {e}")
+
+# ------------------------ Match Executor ------------------------
+
+class PoolSaturated(Exception):
+    """The match executor's queue is full; answered with 503."""
+
+def _timed_call(fn: Callable[..., Any], args: Tuple[Any, ...]) -> Tuple[float, float, Any]:
+    # wall-clock start, so queue wait can be measured across processes
+    started = time.time()
+    result = fn(*args)
+    return started, time.time() - started, result
+
+def _init_match_worker() -> None:
+    """Process-pool initializer: each worker scores with its own model copy."""
+    if USE_EMBEDDINGS:
+        load_embedding_model()
+
+class MatchExecutor:
+    """Bounded pool for CPU-bound matching (RapidFuzz, SBERT, TF-IDF, regex).
+
+    ``kind`` is "thread" (shares the embedding cache and the vectors
+    prefetched by the batcher), "process" (spawned workers, each loading its
+    own model; for CPU-heavy scoring the GIL would serialise) or "inline"
+    (run on the event loop, as before). At most ``workers`` jobs run and
+    ``max_queue`` wait; beyond that ``run`` raises PoolSaturated. Queue wait
+    and run time are recorded in histograms (ms).
+    """
+
+    def __init__(self, kind: str, workers: int, max_queue: int):
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"Unknown MATCH_POOL_KIND {kind!r}; expected thread, process or inline")
+        self.kind = kind
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.queue_wait_hist = Histogram([1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500])
+        self.run_time_hist = Histogram([1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500])
+
+    def _pool(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_match_worker,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="matcher")
+        return self._executor
+
+    @property
+    def shares_memory(self) -> bool:
+        """Whether jobs see this process's embedding cache (not so for process pools)."""
+        return self.kind != "process"
+
+    def saturated(self) -> bool:
+        with self._lock:
+            return self.kind != "inline" and self._in_flight >= self.workers + self.max_queue
+
+    def check_admission(self) -> None:
+        """Raise PoolSaturated before a request starts work it cannot finish."""
+        if self.saturated():
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated(f"{self._in_flight} matching jobs in flight")
+
+    def _done(self, _: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(*args)`` in the pool; raises PoolSaturated when the queue is full."""
+        if self.kind == "inline":
+            _, elapsed, result = _timed_call(fn, args)
+            self.run_time_hist.observe(elapsed * 1000)
+            return result
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PoolSaturated(f"{self._in_flight} matching jobs in flight")
+            self._in_flight += 1
+            self.submitted += 1
+        submitted = time.time()
+        try:
+            job = self._pool().submit(_timed_call, fn, args)
+        except Exception:
+            self._done(None)
+            raise
+        job.add_done_callback(self._done)
+        started, elapsed, result = await asyncio.wrap_future(job)
+        self.queue_wait_hist.observe(max(0.0, started - submitted) * 1000)
+        self.run_time_hist.observe(elapsed * 1000)
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": in_flight,
+            "queued": max(0, in_flight - self.workers),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "queue_wait_ms": self.queue_wait_hist.snapshot(),
+            "run_time_ms": self.run_time_hist.snapshot(),
+        }
+
+_MATCH_POOL = MatchExecutor(
+    kind=os.environ.get("MATCH_POOL_KIND", "thread").lower(),
+    workers=int(os.environ.get("MATCH_POOL_WORKERS", str(min(8, os.cpu_count() or 4)))),
+    max_queue=int(os.environ.get("MATCH_POOL_MAX_QUEUE", "64")),
+)
+
+async def prefetch_shortlists(query: str, groups: List[List[Dict[str, Any]]],
+                              weights: Optional[Dict[str, float]] = None) -> Optional[List[Optional[FeatureBlock]]]:
+    """Batch-encode the query and each group's shortlist before scoring.
+
+    The shortlist is ranked in the pool, and the feature block of each group
+    is returned for scoring to reuse. Process workers keep their own
+    embedding caches, so there is nothing to prefetch for them (None).
+    """
+    if not _MATCH_POOL.shares_memory:
+        return None
+    blocks, titles = await _MATCH_POOL.run(shortlist_blocks, query, groups, weights)
+    await prefetch_embeddings([query] + titles)
+    return blocks
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request, exc: PoolSaturated):
+    logger.warning(f"🚦 Matcher saturated, rejecting request: {exc}")
+    return JSONResponse(status_code=503, content={"detail": "Matcher is at capacity; retry shortly"},
+                        headers={"Retry-After": "1"})
+
+# ------------------------ Response Cache ------------------------
+
+# Whole serialized responses of /match-products and /match-products-for-stores,
+# keyed by a content hash of the request, so resent payloads (client retries,
+# users in the same ZIP) skip matching. RESPONSE_CACHE_DB shares them across
+# the workers on a host (bounded by RESPONSE_CACHE_DB_MAX_ENTRIES/_MB);
+# RESPONSE_CACHE_MAX_ENTRIES=0 without a DB disables it.
+_RESPONSE_CACHE = ResponseCache(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+    max_bytes=int(float(os.environ.get("RESPONSE_CACHE_MAX_MB", "32")) * 1024 * 1024),
+    ttl_s=float(os.environ.get("RESPONSE_CACHE_TTL_S", "300")),
+    negative_ttl_s=0,
+    db_path=os.environ.get("RESPONSE_CACHE_DB") or None,
+    db_max_entries=int(os.environ.get("RESPONSE_CACHE_DB_MAX_ENTRIES", "16384")),
+    db_max_bytes=int(float(os.environ.get("RESPONSE_CACHE_DB_MAX_MB", "256")) * 1024 * 1024),
+)
+# Responses computed without everything they could have used (embedding model
+# still loading, LLM budget exceeded or extraction failed) expire sooner
+RESPONSE_CACHE_DEGRADED_TTL_S = float(os.environ.get("RESPONSE_CACHE_DEGRADED_TTL_S", "30"))
+
+def response_cache_key(endpoint: str, query: str, hasdata_results: List[Dict[str, Any]], **params: Any) -> str:
+    """Stable hash of the query (see cache_query_text), the results (in order) and the other parameters."""
+    payload = json.dumps(
+        [OPENAI_EXTRACT_MODEL, EMBED_BACKEND, cache_query_text(query), hasdata_results, params],
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return f"{endpoint}|{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+def cached_response(key: str) -> Optional[Response]:
+    """The cached body for ``key`` with ``X-Cache: HIT``, or None."""
+    body = _RESPONSE_CACHE.get(key)
+    if body is MISS or body is None:
+        return None
+    return Response(content=body, media_type="application/json", headers={"X-Cache": "HIT"})
+
+def cache_response(key: str, content: Any, degraded: bool = False) -> Response:
+    """Serialize ``content`` once, cache the body and return it with ``X-Cache: MISS``."""
+    body = json.dumps(jsonable_encoder(content), separators=(",", ":"))
+    _RESPONSE_CACHE.put(key, body, RESPONSE_CACHE_DEGRADED_TTL_S if degraded else None)
+    return Response(content=body, media_type="application/json", headers={"X-Cache": "MISS"})
+
+def embeddings_at_full_strength() -> bool:
+    return embeddings_ready() or not USE_EMBEDDINGS
+
 # ------------------------ API Endpoints ------------------------
 
 @app.get("/health", response_model=HealthResponse)
@@ -903,9 +2126,36 @@ async def health_check():
     """Health check endpoint."""
     return HealthResponse(
         status="healthy",
-        embeddings_available=USE_EMBEDDINGS
+        embeddings_available=embeddings_ready(),
+        model_state=_MODEL_STATE,
+        embedding_backend=EMBED_BACKEND,
+        embedding_cache=_EMBED_CACHE.stats(),
+        embedding_store=_EMBED_STORE.stats() if _EMBED_STORE is not None else None,
+        embedding_batcher=_EMBED_BATCHER.stats() if _EMBED_BATCHER is not None else {"enabled": False},
+        llm_client=_OPENAI_CLIENT.stats(),
+        extraction_cache=_EXTRACTION_CACHE.stats(),
+        extraction_flights=_EXTRACTION_FLIGHTS.stats(),
+        extraction_batches={"batch_size": EXTRACT_BATCH_SIZE, **_BATCH_STATS},
+        llm_breaker=_OPENAI_BREAKER.stats(),
+        llm_timeout=_OPENAI_LATENCY.stats(),
+        local_extractor=_LOCAL_EXTRACTOR.stats(),
+        match_pool=_MATCH_POOL.stats(),
+        response_cache=_RESPONSE_CACHE.stats(),
     )
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: the process is up and serving the event loop."""
+    return {"status": "alive"}
+
+@app.get("/health/ready", response_model=ReadinessResponse)
+async def readiness_check(response: Response):
+    """Readiness: 503 until the embedding model is loaded and warmed up."""
+    ready = service_ready()
+    if not ready:
+        response.status_code = 503
+    return ReadinessResponse(ready=ready, model_state=_MODEL_STATE, timings_ms=_MODEL_TIMINGS)
+
 @app.post("/match-products", response_model=ProductMatchResponse)
 async def match_products(request: ProductMatchRequest):
     """
@@ -916,6 +2166,24 @@ async def match_products(request: ProductMatchRequest):
     - Semantic embeddings (Sentence-BERT)
     - Unit parsing and price-per-unit calculations
     - Weighted scoring with tie-breaking
+
+    Identical requests within RESPONSE_CACHE_TTL_S are answered from the
+    response cache (``X-Cache: HIT``).
+    """
+    key = response_cache_key("match-products", request.query, request.hasdata_results, weights=request.weights,
+                             conf_threshold=request.conf_threshold, tie_delta=request.tie_delta)
+    hit = cached_response(key)
+    if hit is not None:
+        return hit
+    result = await score_match_request(request)
+    return cache_response(key, result, degraded=not embeddings_at_full_strength())
+
+async def score_match_request(request: ProductMatchRequest, block: Optional[FeatureBlock] = None,
+                              prefetch: bool = True) -> ProductMatchResponse:
+    """Body of /match-products.
+
+    With ``prefetch=False`` the caller has already encoded the shortlist
+    (and may pass the request's feature ``block``).
     """
     start_time = datetime.now()
     
@@ -929,14 +2197,20 @@ async def match_products(request: ProductMatchRequest):
         
         if not request.hasdata_results:
             raise HTTPException(status_code=400, detail="HasData results cannot be empty")
+
+        _MATCH_POOL.check_admission()
+        if prefetch:
+            blocks = await prefetch_shortlists(request.query, [request.hasdata_results], request.weights)
+            block = blocks[0] if blocks else None
         
-        # Process the matching
-        result = select_best_product(
-            query=request.query,
-            hasdata_results=request.hasdata_results,
-            weights=request.weights,
-            conf_threshold=request.conf_threshold,
-            tie_delta=request.tie_delta
+        # Process the matching off the event loop
+        result = await _MATCH_POOL.run(
+            partial(select_best_product, block=block),
+            request.query,
+            request.hasdata_results,
+            request.weights,
+            request.conf_threshold,
+            request.tie_delta,
         )
         
         # Calculate processing time
@@ -954,10 +2228,178 @@ async def match_products(request: ProductMatchRequest):
             processing_time_ms=processing_time
         )
         
+    except PoolSaturated:
+        raise
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# ------------------------ Store Matching ------------------------
+
+# Most match-executor jobs one stores request is split into (0 = one per worker)
+STORE_FANOUT_MAX_JOBS = int(os.environ.get("STORE_FANOUT_MAX_JOBS", "0"))
+
+# Longest the stores endpoint waits for LLM extraction (from request start)
+# before answering with the classic matches; 0 (the default) waits for the
+# extraction, as the endpoint always has.
+LLM_LATENCY_BUDGET_MS = float(os.environ.get("LLM_LATENCY_BUDGET_MS", "0"))
+
+async def await_llm_within_budget(llm_task: "asyncio.Future", start_time: datetime) -> Tuple[Optional[Dict[str, Optional[str]]], bool]:
+    """Result of an in-flight extraction, or (None, True) once the budget runs out.
+
+    A late extraction keeps running in the background, so it still lands in
+    the extraction cache for the next request.
+    """
+    if LLM_LATENCY_BUDGET_MS <= 0:
+        return await llm_task, False
+    elapsed_ms = (datetime.now() - start_time).total_seconds() * 1000
+    try:
+        remaining = max(0.0, LLM_LATENCY_BUDGET_MS - elapsed_ms) / 1000.0
+        return await asyncio.wait_for(asyncio.shield(llm_task), timeout=remaining), False
+    except asyncio.TimeoutError:
+        logger.warning(f"⏱️ LLM extraction exceeded the {LLM_LATENCY_BUDGET_MS:.0f} ms budget; using classic matches")
+        return None, True
+
+def classic_store_match(query: str, store: str, store_products: List[Dict[str, Any]],
+                        general: Optional[bool] = None,
+                        block: Optional[FeatureBlock] = None) -> Optional[Dict[str, Any]]:
+    """Classic (score-based) match for one store, or None.
+
+    Tries the default weights, then a lower threshold with more weight on
+    partial matches, then the cheapest product containing the key terms.
+    ``general`` is the query's is_general_query() verdict, shared by stores.
+    Both passes score the same feature block (``block``, or one built here).
+    """
+    if general is None:
+        general = is_general_query(query)
+    if block is None and store_products and not general:
+        block = FeatureBlock(query, store_products)
+    # Use very low confidence threshold to catch more matches via classic algorithm
+    match_result = select_best_product(query, store_products,
+                                     weights={"token_set": 0.50, "embed": 0.30, "partial": 0.15, "brand": 0.05},
+                                     conf_threshold=0.15,
+                                     tie_delta=0.20,
+                                     include_candidates=False,
+                                     general=general,
+                                     block=block)
+    
+    if match_result["selected"]:
+        logger.info(f"✅ Found match for {store}: {match_result['selected']['title']} - ${match_result['selected']['extractedPrice']} (score: {match_result['score']:.3f})")
+        return {
+            "product": match_result["selected"],
+            "score": match_result["score"],
+            "confidence_ok": match_result["confidence_ok"],
+            "reason": match_result["reason"],
+            "exact_match": False  # Classic algorithm means not exact match
+        }
+
+    # Try with even lower threshold and different weights
+    match_result_low = select_best_product(query, store_products, 
+                                         weights={"token_set": 0.40, "embed": 0.20, "partial": 0.30, "brand": 0.10},
+                                         conf_threshold=0.10,  # Very low
+                                         tie_delta=0.25,
+                                         include_candidates=False,
+                                         general=general,
+                                         block=block)
+    if match_result_low["selected"]:
+        logger.info(f"⚠️ Low confidence match for {store}: {match_result_low['selected']['title']} - ${match_result_low['selected']['extractedPrice']} (score: {match_result_low['score']:.3f})")
+        return {
+            "product": match_result_low["selected"],
+            "score": match_result_low["score"],
+            "confidence_ok": False,  # Mark as low confidence
+            "reason": f"low_confidence_{match_result_low['reason']}",
+            "exact_match": False  # Low confidence means not exact match
+        }
+
+    # Last resort: select cheapest product that contains key terms
+    cheapest_match = find_cheapest_relevant_product(query, store_products)
+    if cheapest_match:
+        logger.info(f"💰 Fallback cheapest for {store}: {cheapest_match['title']} - ${cheapest_match['extractedPrice']}")
+        return {
+            "product": cheapest_match,
+            "score": 0.05,  # Very low score
+            "confidence_ok": False,
+            "reason": "cheapest_fallback",
+            "exact_match": False  # Fallback means not exact match
+        }
+    return None
+
+def classic_matches_for_stores(stores: List[str], store_results: Dict[str, List[Dict[str, Any]]],
+                               query: str, general: Optional[bool] = None,
+                               blocks: Optional[Dict[str, FeatureBlock]] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+    """classic_store_match for each store; a store that fails gets None."""
+    matches = {}
+    for store in stores:
+        try:
+            matches[store] = classic_store_match(query, store, store_results[store], general,
+                                                 (blocks or {}).get(store))
+        except Exception as e:
+            logger.error(f"Error matching for {store}: {e}")
+            matches[store] = None
+    return matches
+
+def priority_matches_for_stores(stores: List[str], store_results: Dict[str, List[Dict[str, Any]]],
+                                item: Optional[str], brand: Optional[str],
+                                quantity: Optional[Quantity]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """select_by_priority_conditions for each store."""
+    return {s: select_by_priority_conditions(store_results[s], item, brand, None, quantity=quantity) for s in stores}
+
+def store_chunks(stores: List[str], store_results: Dict[str, List[Dict[str, Any]]], parts: int) -> List[List[str]]:
+    """Split ``stores`` into at most ``parts`` chunks of similar product counts.
+
+    Largest store first onto the lightest chunk; each chunk keeps the order
+    of ``stores``.
+    """
+    parts = max(1, min(parts, len(stores)))
+    chunks: List[List[str]] = [[] for _ in range(parts)]
+    loads = [0] * parts
+    for store in sorted(stores, key=lambda s: -len(store_results[s])):
+        i = loads.index(min(loads))
+        chunks[i].append(store)
+        loads[i] += len(store_results[store])
+    rank = {s: i for i, s in enumerate(stores)}
+    return [sorted(c, key=rank.__getitem__) for c in chunks if c]
+
+async def fan_out_stores(fn: Callable[..., Dict[str, Any]], stores: List[str],
+                         store_results: Dict[str, List[Dict[str, Any]]], *args: Any) -> Dict[str, Any]:
+    """``fn(chunk, chunk_results, *args)`` for chunks of stores run concurrently in the match pool.
+
+    One job per worker (at most STORE_FANOUT_MAX_JOBS); results are merged
+    back in the order of ``stores``, whichever chunk finishes first.
+    """
+    parts = _MATCH_POOL.workers if STORE_FANOUT_MAX_JOBS <= 0 else min(_MATCH_POOL.workers, STORE_FANOUT_MAX_JOBS)
+    chunks = store_chunks(stores, store_results, parts)
+    merged: Dict[str, Any] = {}
+    for part in await asyncio.gather(*(
+        _MATCH_POOL.run(fn, chunk, {s: store_results[s] for s in chunk}, *args) for chunk in chunks
+    )):
+        merged.update(part)
+    return {s: merged[s] for s in stores}
+
+async def classic_store_matches(query: str, store_mapping: Dict[str, str],
+                                store_results: Dict[str, List[Dict[str, Any]]],
+                                general: Optional[bool] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Classic matches for every mapped HasData store, computed off the event loop.
+
+    Embeddings for every store's shortlist are batch-encoded first; scoring
+    then fans out across the match executor so the LLM call proceeds
+    concurrently.
+    """
+    stores = list(dict.fromkeys(store_mapping.values()))
+    if not stores:
+        return {}
+    if general is None:
+        general = is_general_query(query)
+    blocks = await prefetch_shortlists(query, [store_results[s] for s in stores])
+    if blocks is not None:
+        blocks = {s: b for s, b in zip(stores, blocks) if b is not None}
+    return await fan_out_stores(classic_matches_for_stores, stores, store_results, query, general, blocks)
+
+def _resolved(value: Any) -> "asyncio.Future":
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(value)
+    return future
+
 @app.post("/match-products-for-stores")
 async def match_products_for_stores(request: Dict[str, Any]):
     """
@@ -969,6 +2411,28 @@ async def match_products_for_stores(request: Dict[str, Any]):
         "hasdata_results": [...],
         "nearby_stores": ["Kroger", "Walmart", "Target", ...]
     }
+
+    Identical requests within RESPONSE_CACHE_TTL_S are answered from the
+    response cache (``X-Cache: HIT``).
+    """
+    key = response_cache_key("match-products-for-stores", request.get("query") or "",
+                             request.get("hasdata_results") or [], nearby_stores=request.get("nearby_stores") or [])
+    hit = cached_response(key)
+    if hit is not None:
+        return hit
+    result = await match_stores_for_query(request)
+    extraction_failed = (result["extraction_source"] == "llm" and result["query_components"] is None
+                         and bool((os.environ.get("OPENAI_API_KEY") or "").strip()))
+    degraded = result["llm_budget_exceeded"] or extraction_failed or not embeddings_at_full_strength()
+    return cache_response(key, result, degraded=degraded)
+
+async def match_stores_for_query(request: Dict[str, Any], extraction: Optional["asyncio.Future"] = None,
+                                 source: str = "llm") -> Dict[str, Any]:
+    """Body of /match-products-for-stores.
+
+    ``extraction``, when given, is a future resolving to the query's
+    components (from ``source``); otherwise the local extractor runs and,
+    if it is not confident, a single LLM extraction.
     """
     start_time = datetime.now()
     
@@ -984,6 +2448,16 @@ async def match_products_for_stores(request: Dict[str, Any]):
         
         if not query or not hasdata_results:
             raise HTTPException(status_code=400, detail="Query and hasdata_results are required")
+        _MATCH_POOL.check_admission()
+
+        # Simple queries are extracted locally; otherwise start the LLM
+        # extraction now and run classic scoring while it is in flight
+        if extraction is None:
+            local_components = _LOCAL_EXTRACTOR.confident_components(query)
+            if local_components is not None:
+                extraction, source = _resolved(local_components), "local"
+            else:
+                extraction, source = asyncio.ensure_future(extract_query_components(query)), "llm"
         
         # Group HasData results by store
         store_results = {}
@@ -1010,17 +2484,6 @@ async def match_products_for_stores(request: Dict[str, Any]):
             for result in results:  # Show ALL products per store
                 logger.info(f"    - {result.get('title', 'Unknown')} - ${result.get('extractedPrice', 0)}")
         
-        # Extract brand/item/quantity from LLM using the specified prompt
-        llm_components = call_openai_extract_components(query)
-        item_comp = llm_components.get("item") if llm_components else None
-        brand_comp = llm_components.get("brand") if llm_components else None
-        quantity_comp = llm_components.get("quantity") if llm_components else None
-        quantity_liters = parse_volume_to_liters_from_quantity_string(quantity_comp)
-        
-        # Log extracted components
-        if llm_components:
-            logger.info(f"🤖 LLM extracted components: brand={brand_comp}, item={item_comp}, quantity={quantity_comp} (liters={quantity_liters})")
-
         # Major stores list for fuzzy matching (one-word matching only for these)
         MAJOR_STORES = [
             'walmart', 'wal-mart', 'wal mart',
@@ -1127,9 +2590,37 @@ async def match_products_for_stores(request: Dict[str, Any]):
                 logger.info(f"   ✅ Mapped '{nearby_store}' → '{best_match}'")
         
         logger.info(f"📊 Store mapping: {len(store_mapping)} nearby stores mapped to HasData stores")
+
+        # Query-side work shared by every store
+        general = is_general_query(query)
+
+        # Speculatively score every mapped store with the classic algorithm
+        classic_task = None
+        if not extraction.done():
+            classic_task = asyncio.ensure_future(classic_store_matches(query, store_mapping, store_results, general))
+            classic_task.add_done_callback(lambda t: t.cancelled() or t.exception())  # may go unused
+
+        # Extract brand/item/quantity from LLM using the specified prompt
+        llm_components, llm_budget_exceeded = await await_llm_within_budget(extraction, start_time)
+        item_comp = llm_components.get("item") if llm_components else None
+        brand_comp = llm_components.get("brand") if llm_components else None
+        quantity_comp = llm_components.get("quantity") if llm_components else None
+        desired_quantity = parse_quantity(quantity_comp)
+        
+        # Log extracted components
+        if llm_components:
+            logger.info(f"🤖 {'Locally' if source == 'local' else 'LLM'} extracted components: brand={brand_comp}, item={item_comp}, quantity={quantity_comp} (parsed={desired_quantity})")
         
+        # LLM-guided priority conditions for every mapped store, off the event loop
+        priority_picks = {}
+        if item_comp or brand_comp or desired_quantity is not None:
+            mapped = list(dict.fromkeys(store_mapping.values()))
+            priority_picks = await fan_out_stores(priority_matches_for_stores, mapped, store_results,
+                                                  item_comp, brand_comp, desired_quantity)
+
         # Find best match for nearby stores using mapped HasData stores
         store_matches = {}
+        classic_results = None
         
         # Process nearby stores that have matching HasData stores
         for nearby_store in nearby_stores:
@@ -1152,19 +2643,19 @@ async def match_products_for_stores(request: Dict[str, Any]):
                 # ALWAYS try LLM-guided priority conditions first if LLM returned anything
                 # This is the primary matching method as per requirements
                 picked_via_llm = None
-                if item_comp or brand_comp or quantity_liters is not None:
+                if item_comp or brand_comp or desired_quantity is not None:
                     logger.info(f"🎯 Using priority-based matching for {nearby_store} with LLM components")
-                    picked_via_llm = select_by_priority_conditions(store_products, item_comp, brand_comp, quantity_liters)
+                    picked_via_llm = priority_picks.get(store)
 
                 if picked_via_llm is not None:
                     # Determine which case was matched
-                    if item_comp and brand_comp and quantity_liters is not None:
+                    if item_comp and brand_comp and desired_quantity is not None:
                         case = "highest_priority"  # All three present
                         exact_match = True  # All components matched
                     elif item_comp and brand_comp:
                         case = "second_case"  # Item and brand
                         exact_match = False  # Missing quantity
-                    elif item_comp and quantity_liters is not None:
+                    elif item_comp and desired_quantity is not None:
                         case = "third_case"  # Item and quantity
                         exact_match = False  # Missing brand
                     else:
@@ -1174,7 +2665,7 @@ async def match_products_for_stores(request: Dict[str, Any]):
                     # Use nearby_store name in the result, not HasData store name
                     store_matches[nearby_store] = {
                         "product": picked_via_llm,
-                        "score": 0.99 if (item_comp and brand_comp and quantity_liters is not None) else 0.9,
+                        "score": 0.99 if (item_comp and brand_comp and desired_quantity is not None) else 0.9,
                         "confidence_ok": True,
                         "reason": f"llm_priority_selection_{case}",
                         "exact_match": exact_match
@@ -1184,54 +2675,18 @@ async def match_products_for_stores(request: Dict[str, Any]):
                 
                 # Fallback to classic algorithm only if LLM priority matching didn't find a match
                 logger.info(f"⚠️ LLM priority matching didn't find a match for {nearby_store}, falling back to classic algorithm")
-
-                # Use very low confidence threshold to catch more matches via classic algorithm
-                match_result = select_best_product(query, store_products,
-                                                 weights={"token_set": 0.50, "embed": 0.30, "partial": 0.15, "brand": 0.05},
-                                                 conf_threshold=0.15,
-                                                 tie_delta=0.20)
-                
-                if match_result["selected"]:
+                if classic_results is None:
+                    if classic_task is None:
+                        classic_task = asyncio.ensure_future(classic_store_matches(query, store_mapping, store_results, general))
+                    classic_results = await classic_task
+                classic_match = classic_results.get(store)
+                if classic_match is not None:
                     # Use nearby_store name in the result, not HasData store name
-                    store_matches[nearby_store] = {
-                        "product": match_result["selected"],
-                        "score": match_result["score"],
-                        "confidence_ok": match_result["confidence_ok"],
-                        "reason": match_result["reason"],
-                        "exact_match": False  # Classic algorithm means not exact match
-                    }
-                    logger.info(f"✅ Found match for {nearby_store}: {match_result['selected']['title']} - ${match_result['selected']['extractedPrice']} (score: {match_result['score']:.3f})")
+                    store_matches[nearby_store] = dict(classic_match)
                 else:
-                    # Try with even lower threshold and different weights
-                    match_result_low = select_best_product(query, store_products, 
-                                                         weights={"token_set": 0.40, "embed": 0.20, "partial": 0.30, "brand": 0.10},
-                                                         conf_threshold=0.10,  # Very low
-                                                         tie_delta=0.25)
-                    if match_result_low["selected"]:
-                        # Use nearby_store name in the result, not HasData store name
-                        store_matches[nearby_store] = {
-                            "product": match_result_low["selected"],
-                            "score": match_result_low["score"],
-                            "confidence_ok": False,  # Mark as low confidence
-                            "reason": f"low_confidence_{match_result_low['reason']}",
-                            "exact_match": False  # Low confidence means not exact match
-                        }
-                        logger.info(f"⚠️ Low confidence match for {nearby_store}: {match_result_low['selected']['title']} - ${match_result_low['selected']['extractedPrice']} (score: {match_result_low['score']:.3f})")
-                    else:
-                        # Last resort: select cheapest product that contains key terms
-                        cheapest_match = find_cheapest_relevant_product(query, store_products)
-                        if cheapest_match:
-                            # Use nearby_store name in the result, not HasData store name
-                            store_matches[nearby_store] = {
-                                "product": cheapest_match,
-                                "score": 0.05,  # Very low score
-                                "confidence_ok": False,
-                                "reason": "cheapest_fallback",
-                                "exact_match": False  # Fallback means not exact match
-                            }
-                            logger.info(f"💰 Fallback cheapest for {nearby_store}: {cheapest_match['title']} - ${cheapest_match['extractedPrice']}")
-                        else:
-                            logger.info(f"❌ No match found for {nearby_store}")
+                    logger.info(f"❌ No match found for {nearby_store}")
+            except PoolSaturated:
+                raise
             except Exception as e:
                 logger.error(f"Error matching for {nearby_store}: {e}")
         
@@ -1240,6 +2695,9 @@ async def match_products_for_stores(request: Dict[str, Any]):
             if store not in store_results:
                 logger.info(f"⚠️ No HasData results for {store}")
         
+        if classic_task is not None and classic_results is None:
+            classic_task.cancel()  # every store was matched from the LLM components
+
         # Find stores that need AI processing
         stores_needing_ai = [store for store in nearby_stores if store not in store_matches]
         
@@ -1254,31 +2712,190 @@ async def match_products_for_stores(request: Dict[str, Any]):
             "processing_time_ms": processing_time,
             "total_stores": len(nearby_stores),
             "matched_stores": len(store_matches),
-            "ai_stores": len(stores_needing_ai)
+            "ai_stores": len(stores_needing_ai),
+            "llm_budget_exceeded": llm_budget_exceeded,
+            "extraction_source": source,
+            "query_components": llm_components,
         }
         
+    except PoolSaturated:
+        raise
     except Exception as e:
         logger.error(f"Error processing store matches: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# Batch extractions still running after their items answered (they fill the cache)
+_BACKGROUND_TASKS: set = set()
+
+@app.post("/match-shopping-list")
+async def match_shopping_list(request: Dict[str, Any]):
+    """
+    Match a whole shopping list against nearby stores in one call.
+
+    Request format:
+    {
+        "nearby_stores": ["Kroger", "Walmart", ...],
+        "items": [
+            {"query": "whole milk 1 gallon", "hasdata_results": [...]},
+            {"query": "tide pods 42 ct", "hasdata_results": [...], "nearby_stores": [...]}
+        ]
+    }
+
+    Queries the local extractor is not confident about are extracted together
+    in batched OpenAI calls (EXTRACT_BATCH_SIZE queries each) while every item
+    is matched. Returns one /match-products-for-stores result per item, in
+    order; an item that fails carries "error" and "status_code" instead.
+    """
+    start_time = datetime.now()
+    items = request.get("items")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="items is required")
+    _MATCH_POOL.check_admission()
+    default_stores = request.get("nearby_stores") or []
+
+    item_requests = []
+    for item in items:
+        item = item if isinstance(item, dict) else {}
+        item_requests.append({
+            "query": item.get("query") or "",
+            "hasdata_results": item.get("hasdata_results") or [],
+            "nearby_stores": item.get("nearby_stores") or default_stores,
+        })
+
+    loop = asyncio.get_running_loop()
+    extractions, sources, llm_queries, llm_futures = [], [], [], []
+    for req in item_requests:
+        components = _LOCAL_EXTRACTOR.confident_components(req["query"]) if req["query"] else None
+        if components is not None:
+            extractions.append(_resolved(components))
+            sources.append("local")
+        else:
+            future = loop.create_future()
+            extractions.append(future)
+            sources.append("llm")
+            if req["query"]:
+                llm_queries.append(req["query"])
+                llm_futures.append(future)
+
+    async def run_batch() -> None:
+        try:
+            found = await extract_query_components_batch(llm_queries)
+        except Exception as e:
+            logger.error(f"Batch extraction failed: {e}")
+            found = [None] * len(llm_queries)
+        for future, components in zip(llm_futures, found):
+            if not future.done():
+                future.set_result(components)
+
+    if llm_queries:
+        task = asyncio.ensure_future(run_batch())
+        _BACKGROUND_TASKS.add(task)
+        task.add_done_callback(_BACKGROUND_TASKS.discard)
+
+    outcomes = await asyncio.gather(*[
+        match_stores_for_query(req, extraction, source)
+        for req, extraction, source in zip(item_requests, extractions, sources)
+    ], return_exceptions=True)
+
+    results = []
+    for req, outcome in zip(item_requests, outcomes):
+        if isinstance(outcome, HTTPException):
+            results.append({"query": req["query"], "error": outcome.detail, "status_code": outcome.status_code})
+        elif isinstance(outcome, PoolSaturated):
+            results.append({"query": req["query"], "error": "Matcher is at capacity; retry shortly", "status_code": 503})
+        elif isinstance(outcome, Exception):
+            results.append({"query": req["query"], "error": str(outcome), "status_code": 500})
+        else:
+            results.append({"query": req["query"], **outcome})
+
+    return {
+        "results": results,
+        "total_items": len(item_requests),
+        "local_extractions": sources.count("local"),
+        "llm_extractions": len(llm_queries),
+        "processing_time_ms": (datetime.now() - start_time).total_seconds() * 1000,
+    }
+
+# Requests of one /match-multiple-products batch scored at the same time
+MATCH_BATCH_CONCURRENCY = int(os.environ.get("MATCH_BATCH_CONCURRENCY", "4"))
+
+def match_request_key(request: ProductMatchRequest) -> str:
+    """Content hash of a match request; identical requests share one result."""
+    payload = json.dumps(
+        [request.query, request.hasdata_results, request.weights, request.conf_threshold, request.tie_delta],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
 @app.post("/match-multiple-products")
 async def match_multiple_products(requests: List[ProductMatchRequest]):
     """
     Batch process multiple product matching requests.
+
+    Identical requests are matched once. The queries and shortlisted titles
+    of the rest are embedded together in one batch, then the requests are
+    scored concurrently, MATCH_BATCH_CONCURRENCY at a time. Results keep the
+    input order; ``timings`` gives each item's queue and processing time. An
+    item the saturated matcher could not take gets an error entry with
+    ``status_code`` 503 instead of failing the batch.
     """
-    results = []
-    for request in requests:
-        try:
-            result = await match_products(request)
-            results.append(result)
-        except Exception as e:
-            logger.error(f"Error processing batch request: {str(e)}")
-            results.append({
-                "error": str(e),
-                "query": request.query
-            })
-    
-    return {"results": results}
+    start_time = datetime.now()
+    _MATCH_POOL.check_admission()
+
+    keys = [match_request_key(r) for r in requests]
+    unique: Dict[str, ProductMatchRequest] = {}
+    for key, request in zip(keys, requests):
+        unique.setdefault(key, request)
+
+    # Shortlist every request in the pool, then embed the union in one batch
+    blocks: Dict[str, Optional[FeatureBlock]] = {}
+    valid = {k: r for k, r in unique.items() if r.query.strip() and r.hasdata_results}
+    if valid and _MATCH_POOL.shares_memory:
+        shortlisted = await asyncio.gather(*(
+            _MATCH_POOL.run(shortlist_blocks, r.query, [r.hasdata_results], r.weights) for r in valid.values()
+        ), return_exceptions=True)
+        texts = []
+        for (key, request), outcome in zip(valid.items(), shortlisted):
+            if isinstance(outcome, BaseException):
+                continue  # scored (or rejected) on its own below
+            request_blocks, titles = outcome
+            blocks[key] = request_blocks[0]
+            texts.append(request.query)
+            texts.extend(titles)
+        await prefetch_embeddings(texts)
+
+    limit = asyncio.Semaphore(max(1, MATCH_BATCH_CONCURRENCY))
+
+    async def run(key: str, request: ProductMatchRequest) -> Tuple[Any, float, float]:
+        queued = datetime.now()
+        async with limit:
+            started = datetime.now()
+            try:
+                result = await score_match_request(request, blocks.get(key), prefetch=key not in blocks)
+            except PoolSaturated as e:
+                logger.warning(f"🚦 Matcher saturated, rejecting batch item: {e}")
+                result = {"error": "Matcher is at capacity; retry shortly", "query": request.query, "status_code": 503}
+            except Exception as e:
+                logger.error(f"Error processing batch request: {str(e)}")
+                result = {"error": str(e), "query": request.query}
+            finished = datetime.now()
+        return (result, (started - queued).total_seconds() * 1000, (finished - started).total_seconds() * 1000)
+
+    outcomes = dict(zip(unique, await asyncio.gather(*(run(k, r) for k, r in unique.items()))))
+
+    results, timings, seen = [], [], set()
+    for key in keys:
+        result, queue_ms, processing_ms = outcomes[key]
+        results.append(result)
+        timings.append({"queue_ms": queue_ms, "processing_time_ms": processing_ms, "duplicate": key in seen})
+        seen.add(key)
+
+    return {
+        "results": results,
+        "timings": timings,
+        "unique_requests": len(unique),
+        "processing_time_ms": (datetime.now() - start_time).total_seconds() * 1000,
+    }
 
 # ------------------------ Example Usage ------------------------
 
@@ -1314,6 +2931,7 @@ if __name__ == "__main__":
     ]
     
     # Test the matching function
+    load_embedding_model()
     query = "whole milk 1 gallon"
     result = select_best_product(query, example_results)
     
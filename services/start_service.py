@@ -5,11 +5,16 @@ Startup script for the Product Matcher Service.
 This script provides easy ways to start the service in different modes:
 - Development mode with auto-reload
 - Production mode with proper logging
+- Preloaded production mode (model loaded once, workers forked copy-on-write)
 - Docker mode
 """
 
 import os
 import sys
+import gc
+import time
+import signal
+import socket
 import subprocess
 import argparse
 import logging
@@ -70,6 +75,118 @@ def start_production():
         "--log-level", "warning"
     ])
 
+def read_memory_mb(pid):
+    """Return USS/PSS/RSS in MB for a process from /proc/<pid>/smaps_rollup (Linux only)."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) / 1024.0
+    except OSError:
+        return None
+    return {
+        "uss": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+        "pss": fields.get("Pss", 0.0),
+        "rss": fields.get("Rss", 0.0),
+    }
+
+def report_worker_memory(master_pid, worker_pids):
+    """Print per-worker unique memory so copy-on-write sharing can be verified."""
+    print(f"{'process':>16} {'USS MB':>9} {'PSS MB':>9} {'RSS MB':>9}")
+    for label, pid in [("master", master_pid)] + [(f"worker {p}", p) for p in worker_pids]:
+        mem = read_memory_mb(pid)
+        if mem is None:
+            print(f"{label:>16} {'n/a':>9} {'n/a':>9} {'n/a':>9}")
+        else:
+            print(f"{label:>16} {mem['uss']:>9.1f} {mem['pss']:>9.1f} {mem['rss']:>9.1f}")
+
+def start_production_preload(workers=4, host="0.0.0.0", port=8000, report_delay=5.0):
+    """Start the service with the model preloaded in a master process.
+
+    The master imports the app, loads and warms the embedding model, freezes
+    the GC heap and binds the listening socket; workers are then forked so the
+    model weights and library code are shared copy-on-write instead of being
+    loaded once per worker. Dead workers are re-forked from the same image.
+    """
+    if not hasattr(os, "fork"):
+        print("⚠️ os.fork is not available on this platform; falling back to regular production mode")
+        start_production()
+        return
+
+    import uvicorn
+
+    print(f"🚀 Starting Product Matcher Service in preload mode ({workers} workers)...")
+    # Avoid leaving freed holes in pages that the workers will share
+    gc.disable()
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import product_matcher_service as pms
+
+    t0 = time.perf_counter()
+    pms.load_embedding_model()
+    pms.warm_caches()
+    print(f"✅ Model loaded and caches warmed in master in {(time.perf_counter() - t0) * 1000:.0f}ms")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    config = uvicorn.Config(pms.app, log_level="warning")
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            gc.enable()
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                uvicorn.Server(config).run(sockets=[sock])
+            finally:
+                os._exit(0)
+        return pid
+
+    gc.collect()
+    gc.freeze()
+    children = {spawn() for _ in range(workers)}
+    print(f"📡 Listening on http://{host}:{port} with workers {sorted(children)}")
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    reported = False
+    started = time.monotonic()
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            children.discard(pid)
+            if not stopping:
+                print(f"⚠️ Worker {pid} exited with status {status}; re-forking")
+                children.add(spawn())
+            continue
+        if not reported and time.monotonic() - started >= report_delay:
+            report_worker_memory(os.getpid(), sorted(children))
+            reported = True
+        time.sleep(0.2)
+    sock.close()
+    print("🛑 All workers stopped")
+
 def start_docker():
     """Build and run the service using Docker."""
     print("🐳 Building and starting Product Matcher Service with Docker...")
@@ -149,10 +266,11 @@ def main():
     parser = argparse.ArgumentParser(description="Product Matcher Service Startup Script")
     parser.add_argument(
         "mode", 
-        choices=["dev", "prod", "docker", "test"], 
-        help="Startup mode: dev (development), prod (production), docker (Docker), test (test service)"
+        choices=["dev", "prod", "prod-preload", "docker", "test"], 
+        help="Startup mode: dev (development), prod (production), prod-preload (production, model shared across forked workers), docker (Docker), test (test service)"
     )
     parser.add_argument("--check-deps", action="store_true", help="Check dependencies before starting")
+    parser.add_argument("--workers", type=int, default=4, help="Number of workers for prod-preload mode")
     
     args = parser.parse_args()
     
@@ -168,6 +286,8 @@ def main():
         start_development()
     elif args.mode == "prod":
         start_production()
+    elif args.mode == "prod-preload":
+        start_production_preload(workers=args.workers)
     elif args.mode == "docker":
         start_docker()
     elif args.mode == "test":